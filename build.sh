@@ -24,7 +24,8 @@ fi
 
 # Build the module
 cd jni
-ndk-build APP_ABI="arm64-v8a"
+# NDK_BUILD_JOBS is set by the Python build scripts (see scripts/build_tuning.py)
+ndk-build APP_ABI="arm64-v8a" ${NDK_BUILD_JOBS:+-j"$NDK_BUILD_JOBS"}
 cd ..
 
 echo "Build complete!"
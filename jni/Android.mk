@@ -6,14 +6,21 @@ LOCAL_MODULE := lsfbypass
 LOCAL_SRC_FILES := main.cpp hook.cpp cache.cpp utils.cpp
 LOCAL_LDLIBS := -llog -landroid
 LOCAL_STATIC_LIBRARIES := dobby
-LOCAL_CFLAGS := -std=c++17 -Wall -Werror
+# LSF_EXTRA_CFLAGS is passed on the ndk-build command line by the build scripts (e.g. -ftime-trace)
+LOCAL_CFLAGS := -std=c++17 -Wall -Werror $(LSF_EXTRA_CFLAGS)
 LOCAL_CPPFLAGS := -std=c++17
 
 include $(BUILD_SHARED_LIBRARY)
 
 # Build Dobby static library
+# Prefer a per-ABI library (external/<abi>/libdobby.a, produced by the matrix build)
+DOBBY_LIB := external/$(TARGET_ARCH_ABI)/libdobby.a
+ifeq ($(wildcard $(LOCAL_PATH)/$(DOBBY_LIB)),)
+DOBBY_LIB := external/libdobby.a
+endif
+
 include $(CLEAR_VARS)
 LOCAL_MODULE := dobby
-LOCAL_SRC_FILES := external/libdobby.a
+LOCAL_SRC_FILES := $(DOBBY_LIB)
 LOCAL_EXPORT_C_INCLUDES := $(LOCAL_PATH)/external
 include $(PREBUILT_STATIC_LIBRARY)
\ No newline at end of file
@@ -0,0 +1,15 @@
+"""
+构建和自动修复工具
+各模块也可以作为独立脚本运行（USER_GUIDE.md 中的 python scripts/xxx.py 用法），
+此时脚本所在目录就是模块搜索路径的第一项，模块之间因此统一按顶层模块名导入，不使用包内相对导入。
+
+以包的形式使用（python -m scripts）时，由这里把本目录加入模块搜索路径，使两种运行方式的导入一致。
+这是唯一修改sys.path的地方，其他模块不要再自行修改
+"""
+
+import os
+import sys
+
+_SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if _SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, _SCRIPTS_DIR)
@@ -0,0 +1,7 @@
+"""python -m scripts 的入口"""
+
+import sys
+
+import cli
+
+sys.exit(cli.main())
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+AI错误分析结果的持久化缓存
+以归一化后的错误指纹为键保存分析结果，支持过期时间、条目数上限(LRU)和命中统计，
+重复出现的构建错误无需再次请求分析接口
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from pathlib import Path
+
+
+# 默认缓存位置和容量，可通过环境变量覆盖
+DEFAULT_CACHE_PATH = Path.home() / ".cache" / "hyperos_sf_bypass" / "analysis.sqlite3"
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 1000
+
+# sqlite连接不能跨线程使用，每个线程各自维护连接
+_local = threading.local()
+
+
+def _env_int(name, default):
+    """读取整数类型的环境变量"""
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def get_cache_path():
+    """获取缓存数据库路径"""
+    return Path(os.environ.get('ANALYSIS_CACHE_PATH', DEFAULT_CACHE_PATH))
+
+
+def _connect():
+    """打开（或复用）当前线程的缓存数据库连接"""
+    cache_path = get_cache_path()
+    key = str(cache_path)
+    if not hasattr(_local, 'connections'):
+        _local.connections = {}
+    conn = _local.connections.get(key)
+    if conn is None:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(key, timeout=10, isolation_level=None)
+        # WAL模式允许多个构建节点进程同时读写
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS analyses (
+                fingerprint TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_last_access ON analyses(last_access)")
+        conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        _local.connections[key] = conn
+    return conn
+
+
+def _bump_stat(conn, name):
+    """累加统计计数"""
+    conn.execute(
+        "INSERT INTO stats (name, value) VALUES (?, 1) "
+        "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+        (name,)
+    )
+
+
+def get(fingerprint):
+    """查询缓存的分析结果，未命中或已过期时返回None"""
+    try:
+        conn = _connect()
+        now = time.time()
+        ttl = _env_int('ANALYSIS_CACHE_TTL', DEFAULT_TTL_SECONDS)
+        row = conn.execute(
+            "SELECT response, created_at FROM analyses WHERE fingerprint = ?",
+            (fingerprint,)
+        ).fetchone()
+
+        if row is None or (ttl > 0 and now - row[1] > ttl):
+            _bump_stat(conn, 'misses')
+            return None
+
+        conn.execute(
+            "UPDATE analyses SET last_access = ?, hits = hits + 1 WHERE fingerprint = ?",
+            (now, fingerprint)
+        )
+        _bump_stat(conn, 'hits')
+        return row[0]
+    except sqlite3.Error as e:
+        print(f"警告: 读取分析缓存失败: {str(e)}")
+        return None
+
+
+def put(fingerprint, response):
+    """保存分析结果，并淘汰过期和超出容量的条目"""
+    try:
+        conn = _connect()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO analyses (fingerprint, response, created_at, last_access, hits) "
+            "VALUES (?, ?, ?, ?, 0)",
+            (fingerprint, response, now, now)
+        )
+        evict(conn)
+    except sqlite3.Error as e:
+        print(f"警告: 写入分析缓存失败: {str(e)}")
+
+
+def evict(conn=None):
+    """删除过期条目，并按最近访问时间淘汰超出上限的条目"""
+    conn = conn or _connect()
+    ttl = _env_int('ANALYSIS_CACHE_TTL', DEFAULT_TTL_SECONDS)
+    max_entries = _env_int('ANALYSIS_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)
+
+    removed = 0
+    if ttl > 0:
+        removed += conn.execute(
+            "DELETE FROM analyses WHERE created_at < ?", (time.time() - ttl,)
+        ).rowcount
+    if max_entries > 0:
+        removed += conn.execute(
+            "DELETE FROM analyses WHERE fingerprint IN ("
+            "SELECT fingerprint FROM analyses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (max_entries,)
+        ).rowcount
+    return removed
+
+
+def get_stats():
+    """返回缓存的命中统计和条目数"""
+    conn = _connect()
+    stats = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+    entries = conn.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+    return {
+        'hits': stats.get('hits', 0),
+        'misses': stats.get('misses', 0),
+        'entries': entries,
+    }
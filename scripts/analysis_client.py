@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+AI分析接口客户端
+提供长连接池、连接/读取超时、带抖动的指数退避重试和熔断器，
+并提供asyncio接口和后台提交接口，分析请求进行期间修复流程可以继续执行本地检查
+"""
+
+import os
+import ssl
+import json
+import time
+import random
+import queue
+import asyncio
+import threading
+import http.client
+import urllib.parse
+from collections import deque
+from concurrent.futures import Future
+
+import build_trace
+
+
+# 默认的超时、重试和熔断参数，可通过环境变量覆盖
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 120
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_BASE = 1.0
+DEFAULT_BACKOFF_CAP = 30.0
+DEFAULT_POOL_SIZE = 4
+DEFAULT_BREAKER_THRESHOLD = 5
+DEFAULT_BREAKER_COOLDOWN = 60
+
+# 需要重试的HTTP状态码
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class AnalysisError(Exception):
+    """分析请求失败"""
+
+
+class CircuitOpenError(AnalysisError):
+    """熔断器处于打开状态，请求被直接拒绝"""
+
+
+class CircuitBreaker:
+    """连续失败达到阈值后在冷却时间内拒绝请求，冷却结束后放行一次试探请求"""
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._probe_owner = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """判断当前是否允许发出请求"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.cooldown or self._probing:
+                return False
+            # 半开状态，只放行一个试探请求
+            self._probing = True
+            self._probe_owner = threading.get_ident()
+            return True
+
+    def record_success(self):
+        """记录一次成功，关闭熔断器"""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+            self._probe_owner = None
+
+    def record_failure(self):
+        """记录一次失败，达到阈值或试探失败时打开熔断器"""
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+            self._probe_owner = None
+
+    def release_probe(self):
+        """当前线程的试探请求没有记录结果就结束时(例如抛出了意外的异常)释放试探名额，
+        否则熔断器会一直拒绝请求"""
+        with self._lock:
+            if self._probing and self._probe_owner == threading.get_ident():
+                self._probing = False
+                self._probe_owner = None
+
+    @property
+    def is_open(self):
+        """熔断器是否处于打开状态"""
+        with self._lock:
+            return self._opened_at is not None
+
+
+class RateLimiter:
+    """令牌桶限速，平均每秒最多rate个请求，允许burst个请求的突发"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取得一个令牌，没有可用令牌时等待"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class DaemonExecutor:
+    """工作线程为守护线程的线程池
+    concurrent.futures.ThreadPoolExecutor会在解释器退出时等待工作线程结束，
+    一个还在等待响应的分析请求会让构建已经结束的进程多挂起一个读取超时"""
+
+    def __init__(self, max_workers, thread_name_prefix='worker'):
+        self.max_workers = max_workers
+        self.thread_name_prefix = thread_name_prefix
+        self._queue = queue.SimpleQueue()
+        self._threads = []
+        self._shutdown = False
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        """提交任务，返回concurrent.futures.Future"""
+        future = Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("线程池已关闭，不能再提交任务")
+            self._queue.put((future, fn, args, kwargs))
+            if len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._work, daemon=True,
+                                          name=f"{self.thread_name_prefix}_{len(self._threads)}")
+                thread.start()
+                self._threads.append(thread)
+        return future
+
+    def _work(self):
+        """工作线程: 依次执行队列中的任务，收到None时退出"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        """关闭线程池，cancel_futures为True时取消还没有开始执行的任务"""
+        with self._lock:
+            self._shutdown = True
+            if cancel_futures:
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not None:
+                        item[0].cancel()
+            for _ in self._threads:
+                self._queue.put(None)
+            threads = list(self._threads)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+
+class ConnectionPool:
+    """同一主机的HTTP长连接池"""
+
+    def __init__(self, api_url, max_size, connect_timeout, read_timeout):
+        parsed = urllib.parse.urlsplit(api_url)
+        self.scheme = parsed.scheme or 'https'
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.max_size = max_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._ssl_context = ssl.create_default_context() if self.scheme == 'https' else None
+
+    def acquire(self):
+        """取出一个空闲连接，没有时新建，返回(连接, 是否为复用连接)"""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+
+        if self.scheme == 'https':
+            conn = http.client.HTTPSConnection(
+                self.host, self.port, timeout=self.connect_timeout, context=self._ssl_context
+            )
+        else:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.connect_timeout)
+        conn.connect()
+        # 连接建立后改用读取超时
+        conn.sock.settimeout(self.read_timeout)
+        return conn, False
+
+    def release(self, conn, reusable):
+        """归还连接，不可复用或池已满时关闭"""
+        if reusable:
+            with self._lock:
+                if len(self._idle) < self.max_size:
+                    self._idle.append(conn)
+                    return
+        conn.close()
+
+    def close(self):
+        """关闭所有空闲连接"""
+        with self._lock:
+            while self._idle:
+                self._idle.pop().close()
+
+
+def _env_number(name, default, cast=float):
+    """读取数值类型的环境变量"""
+    try:
+        return cast(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class AnalysisClient:
+    """兼容OpenAI chat/completions格式的分析接口客户端"""
+
+    def __init__(self, api_url, api_key, model,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT,
+                 max_retries=DEFAULT_MAX_RETRIES, backoff_base=DEFAULT_BACKOFF_BASE,
+                 backoff_cap=DEFAULT_BACKOFF_CAP, pool_size=DEFAULT_POOL_SIZE,
+                 breaker_threshold=DEFAULT_BREAKER_THRESHOLD, breaker_cooldown=DEFAULT_BREAKER_COOLDOWN):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.model = model
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self.pool = ConnectionPool(api_url, pool_size, connect_timeout, read_timeout)
+        parsed = urllib.parse.urlsplit(api_url)
+        self.path = parsed.path or '/'
+        if parsed.query:
+            self.path += '?' + parsed.query
+        self._executor = DaemonExecutor(pool_size, thread_name_prefix='analysis')
+
+    def _backoff_delay(self, attempt, retry_after=None):
+        """带完全抖动的指数退避时间"""
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_cap))
+        return delay
+
+    def _send_once(self, body, headers):
+        """发送一次请求，返回(状态码, 响应体, Retry-After秒数)"""
+        conn, reused = self.pool.acquire()
+        try:
+            conn.request('POST', self.path, body=body, headers=headers)
+            response = conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            if reused:
+                # 复用的连接可能已被服务端关闭，换一个新连接立即重试一次
+                conn, reused = self.pool.acquire()
+                try:
+                    conn.request('POST', self.path, body=body, headers=headers)
+                    response = conn.getresponse()
+                    data = response.read()
+                except (OSError, http.client.HTTPException):
+                    conn.close()
+                    raise
+            else:
+                raise
+
+        self.pool.release(conn, not response.will_close)
+        retry_after = response.getheader('Retry-After')
+        try:
+            retry_after = float(retry_after) if retry_after is not None else None
+        except ValueError:
+            retry_after = None
+        return response.status, data, retry_after
+
+    def post_json(self, payload):
+        """发送JSON请求并返回解析后的响应，失败时按退避策略重试"""
+        if not self.breaker.allow():
+            raise CircuitOpenError("分析接口连续失败，熔断器已打开，暂不发送请求")
+        try:
+            return self._post_json(payload)
+        finally:
+            self.breaker.release_probe()
+
+    def _post_json(self, payload):
+        """已经通过熔断器检查的请求，结果记录到熔断器"""
+        body = json.dumps(payload).encode('utf-8')
+        headers = {
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': 'application/json',
+            'Connection': 'keep-alive',
+        }
+
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                status, data, retry_after = self._send_once(body, headers)
+            except (OSError, http.client.HTTPException) as e:
+                last_error = AnalysisError(f"请求分析接口失败: {str(e)}")
+            else:
+                if 200 <= status < 300:
+                    try:
+                        result = json.loads(data.decode('utf-8'))
+                    except ValueError as e:
+                        self.breaker.record_failure()
+                        raise AnalysisError(f"分析接口返回了无效的JSON: {str(e)}")
+                    self.breaker.record_success()
+                    return result
+                last_error = AnalysisError(f"分析接口返回HTTP {status}: {data[:200]!r}")
+                if status not in RETRYABLE_STATUS:
+                    # 客户端错误说明服务本身可用，不计入熔断
+                    self.breaker.record_success()
+                    raise last_error
+
+            if attempt < self.max_retries:
+                delay = self._backoff_delay(attempt, retry_after)
+                print(f"分析请求失败，{delay:.1f}s 后进行第 {attempt + 1} 次重试: {last_error}")
+                time.sleep(delay)
+
+        self.breaker.record_failure()
+        raise last_error
+
+    def analyze(self, prompt, temperature=0.1):
+        """同步发送分析请求，返回模型回复的文本"""
+        data = {
+            "model": self.model,
+            "messages": [
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": temperature
+        }
+        with build_trace.span('analysis.request', category='analysis', model=self.model):
+            result = self.post_json(data)
+        try:
+            return result['choices'][0]['message']['content']
+        except (KeyError, IndexError, TypeError):
+            raise AnalysisError(f"分析接口响应格式不正确: {str(result)[:200]}")
+
+    def submit(self, prompt, temperature=0.1):
+        """在后台线程中发送分析请求，返回concurrent.futures.Future"""
+        return self._executor.submit(self.analyze, prompt, temperature)
+
+    async def analyze_async(self, prompt, temperature=0.1):
+        """asyncio接口，请求在后台线程中执行，不阻塞事件循环"""
+        loop = asyncio.get_running_loop()
+        return await asyncio.wrap_future(self.submit(prompt, temperature), loop=loop)
+
+    def close(self):
+        """关闭连接池和后台线程，还没有开始的分析请求被取消"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.pool.close()
+
+
+def get_client(api_url, api_key, model):
+    """获取共享的客户端实例，相同配置复用同一个连接池和熔断器"""
+    key = (api_url, api_key, model)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = AnalysisClient(
+                api_url, api_key, model,
+                connect_timeout=_env_number('SHENGSUAN_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT),
+                read_timeout=_env_number('SHENGSUAN_READ_TIMEOUT', DEFAULT_READ_TIMEOUT),
+                max_retries=_env_number('SHENGSUAN_MAX_RETRIES', DEFAULT_MAX_RETRIES, int),
+                breaker_threshold=_env_number('SHENGSUAN_BREAKER_THRESHOLD', DEFAULT_BREAKER_THRESHOLD, int),
+                breaker_cooldown=_env_number('SHENGSUAN_BREAKER_COOLDOWN', DEFAULT_BREAKER_COOLDOWN),
+            )
+            _clients[key] = client
+        return client
+
+
+def close_clients():
+    """关闭全部共享的客户端，在一次运行结束时调用"""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
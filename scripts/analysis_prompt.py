@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+"""
+AI分析的提示
+单次分析、批量分析和基准测试共用的提示，不依赖分析客户端，可以在模块顶层导入
+"""
+
+
+def build_prompt(error_msg):
+    """生成发送给AI的分析提示"""
+    return f"""
+    你是一个专业的Android NDK和C++构建专家。
+    请分析以下构建错误并提供修复建议：
+    
+    错误信息:
+    {error_msg}
+    
+    请提供具体的修复步骤。
+    """
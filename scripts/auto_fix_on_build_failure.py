@@ -6,218 +6,39 @@ Build失败时的自动检测和修复脚本
 
 import os
 import sys
-import subprocess
-import json
-import urllib.request
 import re
+import argparse
 from pathlib import Path
-import platform
-
 
-def check_dobby_library():
-    """检查Dobby库是否存在"""
-    dobby_path = Path("jni/external/libdobby.a")
-    return dobby_path.exists()
+import analysis_prompt
+import build_trace
+import diagnostics
+import failure_index
+import fix_rules
+import log_reducer
+import run_history
 
-
-def download_dobby():
-    """下载Dobby库的函数"""
-    print("正在下载Dobby库...")
-    
-    # 创建external目录（如果不存在）
-    external_dir = Path("jni/external")
-    external_dir.mkdir(parents=True, exist_ok=True)
-    
-    # 检查Dobby是否已经下载
-    dobby_dir = external_dir / "Dobby"
-    if not dobby_dir.exists():
-        try:
-            # 克隆Dobby项目
-            print("正在克隆Dobby项目...")
-            subprocess.run([
-                "git", "clone", "--depth=1", 
-                "https://github.com/jmpews/Dobby.git", 
-                str(dobby_dir)
-            ], check=True)
-            print("Dobby库已下载到", dobby_dir)
-        except subprocess.CalledProcessError:
-            print("无法通过Git下载Dobby库")
-            return False
-        except FileNotFoundError:
-            print("系统中未找到Git命令")
-            return False
-    
-    return True
+# 构建、修复和分析客户端相关的模块(build_runner、workspace、concurrent.futures等)只在用到时才导入，
+# analyze子命令和build_monitor在构建成功时不需要承担这些模块的导入开销
 
 
-def check_ndk_installed():
-    """检查NDK是否已安装并配置"""
-    # 检查环境变量
-    ndk_env = os.environ.get('ANDROID_NDK_HOME') or os.environ.get('NDK_HOME')
-    
-    if ndk_env and Path(ndk_env).exists():
-        print(f"NDK已配置: {ndk_env}")
-        return True
-    
-    # 在某些常见位置查找NDK
-    possible_paths = [
-        Path.home() / "Android" / "Sdk" / "ndk",
-        Path.home() / "Library" / "Android" / "sdk" / "ndk",
-        Path("C:") / "Android" / "Sdk" / "ndk",
-        Path("C:") / "android-ndk-*",  # Windows通配符
-    ]
-    
-    for path in possible_paths:
-        if path.exists():
-            # 如果是通配符路径，展开它
-            if '*' in str(path):
-                expanded = list(Path(path.parent).glob(path.name))
-                if expanded:
-                    # 使用最新的NDK版本
-                    latest_ndk = sorted(expanded, key=os.path.getmtime, reverse=True)[0]
-                    os.environ['ANDROID_NDK_HOME'] = str(latest_ndk)
-                    print(f"发现NDK: {latest_ndk}")
-                    return True
-            else:
-                os.environ['ANDROID_NDK_HOME'] = str(path)
-                print(f"发现NDK: {path}")
-                return True
-    
-    print("警告: 未找到ANDROID_NDK_HOME或NDK_HOME环境变量")
-    return False
+# 正在进行中的分析请求，按错误指纹去重
+_pending_analyses = {}
+# 本次运行在构建失败时于后台发起的分析请求，每次运行最多一个
+_background_analysis = None
 
 
-def check_build_tools():
-    """检查构建工具是否安装"""
-    tools_needed = ['git']
-    missing_tools = []
-    
-    # 根据平台确定需要的工具
-    if platform.system().lower() == "windows":
-        tools_needed.extend(['make'])  # Windows上可能使用mingw或其他make工具
-    else:
-        tools_needed.extend(['make', 'cmake'])
+def _completed_future(value):
+    """返回一个已经完成的Future"""
+    import concurrent.futures
     
-    for tool in tools_needed:
-        try:
-            subprocess.run([tool, '--version'], 
-                         check=True, 
-                         stdout=subprocess.DEVNULL, 
-                         stderr=subprocess.DEVNULL)
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            missing_tools.append(tool)
-    
-    if missing_tools:
-        print(f"警告: 缺少构建工具: {', '.join(missing_tools)}")
-        return False
-    
-    print("构建工具齐全")
-    return True
-
-
-def compile_dobby_if_needed():
-    """如果需要，编译Dobby库"""
-    # 检查是否已经有预编译的库
-    dobby_lib_path = Path("jni/external/libdobby.a")
-    if dobby_lib_path.exists():
-        print("Dobby库已存在，跳过编译")
-        return True
-    
-    # 检查Dobby源码是否存在
-    dobby_src_path = Path("jni/external/Dobby")
-    if not dobby_src_path.exists():
-        print("错误: Dobby源码不存在")
-        return False
-    
-    print("开始编译Dobby库...")
-    
-    try:
-        # 进入Dobby目录
-        current_dir = os.getcwd()
-        os.chdir(dobby_src_path)
-        
-        # 创建构建目录
-        build_dir = Path("build")
-        build_dir.mkdir(exist_ok=True)
-        
-        # 获取NDK路径
-        ndk_path = os.environ.get('ANDROID_NDK_HOME') or os.environ.get('NDK_HOME')
-        if not ndk_path:
-            print("错误: 未设置NDK路径")
-            return False
-        
-        # 运行CMake配置
-        cmake_cmd = [
-            'cmake', '.', '-B', 'build',
-            f'-DCMAKE_TOOLCHAIN_FILE={ndk_path}/build/cmake/android.toolchain.cmake',
-            '-DANDROID_ABI=arm64-v8a',
-            '-DANDROID_PLATFORM=android-21'
-        ]
-        
-        print("运行CMake配置...")
-        result = subprocess.run(cmake_cmd, capture_output=True, text=True)
-        
-        if result.returncode != 0:
-            print(f"CMake配置失败: {result.stderr}")
-            # 尝试不同的NDK路径配置
-            alt_cmake_cmd = [
-                'cmake', '-H.', '-Bbuild',
-                f'-DCMAKE_TOOLCHAIN_FILE={ndk_path}/build/cmake/android.toolchain.cmake',
-                '-DANDROID_ABI=arm64-v8a',
-                '-DANDROID_PLATFORM=android-21',
-                '-DCMAKE_BUILD_TYPE=Release'
-            ]
-            result = subprocess.run(alt_cmake_cmd, capture_output=True, text=True)
-            if result.returncode != 0:
-                print(f"备用CMake配置也失败: {result.stderr}")
-                return False
-        
-        # 编译Dobby
-        print("编译Dobby库...")
-        make_cmd = ['cmake', '--build', 'build', '--parallel']
-        result = subprocess.run(make_cmd, capture_output=True, text=True)
-        
-        if result.returncode != 0:
-            print(f"Dobby编译失败: {result.stderr}")
-            return False
-        
-        # 将编译好的库复制到正确的位置
-        compiled_lib_path = None
-        # 查找编译好的库文件
-        for root, dirs, files in os.walk('build'):
-            for file in files:
-                if file == 'libdobby.a':
-                    compiled_lib_path = Path(root) / file
-                    break
-            if compiled_lib_path:
-                break
-        
-        if compiled_lib_path:
-            target_dir = Path("../../../../../libs/arm64-v8a/")
-            target_dir.mkdir(parents=True, exist_ok=True)
-            target_path = target_dir / "libdobby.a"
-            
-            import shutil
-            shutil.copy(compiled_lib_path, target_path)
-            print(f"Dobby库已编译并复制到: {target_path}")
-            
-            # 同时复制到jni/external/libdobby.a
-            ext_target = Path("../libdobby.a")
-            shutil.copy(compiled_lib_path, ext_target)
-            print(f"Dobby库已复制到: {ext_target}")
-        else:
-            print("错误: 编译后的库文件不存在")
-            return False
-        
-        os.chdir(current_dir)
-        return True
-    except Exception as e:
-        print(f"编译Dobby时发生错误: {str(e)}")
-        return False
+    future = concurrent.futures.Future()
+    future.set_result(value)
+    return future
 
 
-def ai_analyze_error(error_msg):
-    """使用AI分析构建错误"""
+def start_ai_analysis(error_msg):
+    """在后台发起AI分析，立即返回Future，修复流程可以同时继续执行本地检查"""
     print(f"正在分析错误...")
     
     # 获取环境变量中的API配置
@@ -225,129 +46,233 @@ def ai_analyze_error(error_msg):
     api_url = os.environ.get('SHENGSUAN_API_URL', 'https://api.shengsuan.cloud/v1/chat/completions')
     model = os.environ.get('SHENGSUAN_MODEL', 'deepseek/deepseek-v3.2')
     
-    if not api_key:
-        print("警告: 未设置SHENGSUAN_API_KEY环境变量，跳过AI分析功能")
-        print("要启用AI分析，请设置SHENGSUAN_API_KEY环境变量")
-        return None
+    # 先缩减日志，限制请求大小，并使指纹只取决于保留下来的错误
+    with build_trace.span('analysis.reduce_log', category='analysis'):
+        error_msg = log_reducer.reduce_log(error_msg)
     
-    # 准备发送给AI的提示
-    prompt = f"""
-    你是一个专业的Android NDK和C++构建专家。
-    请分析以下构建错误并提供修复建议：
+    # 分析客户端依赖ssl、asyncio等较重的模块，只在需要分析时才导入
+    import analysis_cache
+    import analysis_client
     
-    错误信息:
-    {error_msg}
+    # 相同指纹的错误直接使用缓存的分析结果或正在进行的请求
+    error_key = log_reducer.fingerprint(error_msg, salt=model)
+    if error_key in _pending_analyses:
+        run_history.record_analysis(error_key, 'shared')
+        return _pending_analyses[error_key]
     
-    请提供具体的修复步骤。
-    """
+    cached_response = analysis_cache.get(error_key)
+    if cached_response is not None:
+        print(f"AI分析结果(缓存 {error_key[:12]})")
+        run_history.record_analysis(error_key, 'hit')
+        return _completed_future(cached_response)
     
-    headers = {
-        'Authorization': f'Bearer {api_key}',
-        'Content-Type': 'application/json'
-    }
+    if not api_key:
+        run_history.record_analysis(error_key, 'skipped')
+        print("警告: 未设置SHENGSUAN_API_KEY环境变量，跳过AI分析功能")
+        print("要启用AI分析，请设置SHENGSUAN_API_KEY环境变量")
+        return _completed_future(None)
     
-    data = {
-        "model": model,
-        "messages": [
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0.1
-    }
+    # 准备发送给AI的提示
+    prompt = analysis_prompt.build_prompt(error_msg)
+    
+    def on_done(future):
+        _pending_analyses.pop(error_key, None)
+        if future.cancelled():
+            run_history.record_analysis(error_key, 'cancelled')
+        elif future.exception() is None:
+            analysis_cache.put(error_key, future.result())
+        else:
+            run_history.record_analysis(error_key, 'error')
+    
+    run_history.record_analysis(error_key, 'miss')
+    client = analysis_client.get_client(api_url, api_key, model)
+    future = client.submit(prompt, temperature=0.1)
+    _pending_analyses[error_key] = future
+    future.add_done_callback(on_done)
+    return future
+
+
+def start_background_analysis(error_msg):
+    """构建失败时在后台发起AI分析；修复后的重新构建再次失败时不重复发起，
+    最终的分析与它是同一个错误时共用这个请求"""
+    global _background_analysis
+    if _background_analysis is None:
+        _background_analysis = start_ai_analysis(error_msg)
+    return _background_analysis
+
+
+def cancel_background_analysis():
+    """修复成功或运行结束时放弃后台分析: 还在排队的请求被取消，并关闭分析客户端"""
+    global _background_analysis
+    future, _background_analysis = _background_analysis, None
+    if future is not None:
+        future.cancel()
+    # 没有发起过分析时不为此导入分析客户端
+    analysis_client = sys.modules.get('analysis_client')
+    if analysis_client is not None:
+        analysis_client.close_clients()
+
+
+def ai_analyze_error(error_msg):
+    """使用AI分析构建错误"""
+    import analysis_client
     
     try:
-        req = urllib.request.Request(api_url, 
-                                   data=json.dumps(data).encode('utf-8'), 
-                                   headers=headers)
-        response = urllib.request.urlopen(req)
-        result = json.loads(response.read().decode('utf-8'))
-        
-        ai_response = result['choices'][0]['message']['content']
-        print(f"AI分析结果:\n{ai_response}")
-        
-        return ai_response
-    except Exception as e:
+        with build_trace.span('analysis.wait', category='analysis'):
+            ai_response = start_ai_analysis(error_msg).result()
+    except analysis_client.AnalysisError as e:
         print(f"AI分析失败: {str(e)}")
         return None
+    
+    if ai_response:
+        print(f"AI分析结果:\n{ai_response}")
+    return ai_response
 
 
 def attempt_build():
     """尝试构建项目"""
+    import build_runner
+    import build_tuning
+    import compiler_cache
+    
     print("开始构建项目...")
+    
+    # 启用提前终止时，匹配到致命错误模式立即结束构建
+    abort_on = None
+    if fix_rules.early_abort_enabled():
+        abort_on = fix_rules.make_fatal_matcher(fix_rules.load_fix_rules())
+    
+    # ndk-build经由ccache/sccache编译，源码未变化的重试直接命中缓存
+    cache_session = compiler_cache.get_session()
+    # 并行任务数由自动调优按CPU、内存和历史记录决定，通过NDK_BUILD_JOBS传给build.sh
+    jobs = build_tuning.choose_jobs('ndk-build', verbose=True)
+    
     try:
-        # 使用subprocess运行构建脚本，捕获输出
-        result = subprocess.run(
-            ['bash', 'build.sh'], 
-            check=False, 
-            capture_output=True, 
-            text=True
-        )
+        # 流式运行构建脚本，只在内存中保留尾部输出
+        with build_trace.span('ndk-build'):
+            result = build_runner.run_streaming(['bash', 'build.sh'], abort_on=abort_on,
+                                                env=build_tuning.build_env(jobs, cache_session.env()))
+        cache_session.record_build(result.elapsed)
+        build_tuning.record('ndk-build', jobs, result)
         
         if result.returncode == 0:
-            print("构建成功!")
-            print(result.stdout[-500:])  # 打印最后500个字符的输出
+            print(f"构建成功! 用时 {result.elapsed:.1f}s，日志: {result.log_path}")
             return True
         else:
-            print("构建失败:")
-            print(result.stderr)
+            print(f"构建失败，完整日志: {result.log_path}")
             
-            # 分析错误
-            error_analysis = ai_analyze_error(result.stderr)
+            # 已匹配到致命错误时直接交给对应的修复动作，跳过AI分析；
+            # 否则在后台发起分析，修复流程继续执行本地检查
+            if result.aborted_by:
+                print(f"构建已提前终止: {result.aborted_by['description']}")
+            else:
+                start_background_analysis(result.output)
             
-            return False, result.stderr
+            return False, result.output
     except FileNotFoundError:
         # 如果bash不可用，尝试powershell
         print("bash命令不可用，尝试PowerShell...")
         try:
-            result = subprocess.run(
-                ['powershell', './build.sh'], 
-                check=False, 
-                capture_output=True, 
-                text=True
-            )
+            with build_trace.span('ndk-build'):
+                result = build_runner.run_streaming(['powershell', './build.sh'], abort_on=abort_on,
+                                                    env=build_tuning.build_env(jobs, cache_session.env()))
+            cache_session.record_build(result.elapsed)
+            build_tuning.record('ndk-build', jobs, result)
             
             if result.returncode == 0:
-                print("构建成功!")
-                print(result.stdout[-500:])
+                print(f"构建成功! 用时 {result.elapsed:.1f}s，日志: {result.log_path}")
                 return True
             else:
-                print("构建失败:")
-                print(result.stderr)
+                print(f"构建失败，完整日志: {result.log_path}")
                 
-                # 分析错误
-                error_analysis = ai_analyze_error(result.stderr)
+                if result.aborted_by:
+                    print(f"构建已提前终止: {result.aborted_by['description']}")
+                else:
+                    start_background_analysis(result.output)
                 
-                return False, result.stderr
+                return False, result.output
         except FileNotFoundError:
             print("PowerShell命令也不可用")
             return False, "无法执行构建脚本"
 
 
+def fix_download_and_compile_dobby():
+    """修复动作: 下载并编译Dobby库"""
+    import workspace
+    
+    return workspace.download_dobby() and workspace.compile_dobby_if_needed()
+
+
+def fix_check_ndk_installation():
+    """修复动作: 检查并配置NDK"""
+    import workspace
+    
+    return workspace.check_ndk_installed()
+
+
+def fix_verify_architecture_support():
+    """修复动作: 确认Application.mk中的ABI与Dobby库一致"""
+    import workspace
+    
+    app_mk = Path("jni/Application.mk")
+    try:
+        content = app_mk.read_text(encoding='utf-8')
+    except OSError:
+        print(f"错误: 无法读取 {app_mk}")
+        return False
+    
+    match = re.search(r'^APP_ABI\s*:=\s*(.+)$', content, re.MULTILINE)
+    abis = match.group(1).split() if match else []
+    if workspace.DOBBY_ABI not in abis:
+        print(f"错误: Application.mk 中的APP_ABI ({' '.join(abis)}) 不包含 {workspace.DOBBY_ABI}")
+        return False
+    
+    print(f"架构配置正常: APP_ABI={' '.join(abis)}")
+    return True
+
+
+def fix_recompile_dobby():
+    """修复动作: 重新编译Dobby库"""
+    import workspace
+    
+    # 已有的库可能就是构建失败的原因，不能因为它存在或缓存命中而跳过编译
+    return workspace.compile_dobby_if_needed(force=True)
+
+
+# auto_fix_config.json 中 fix_action 名称到修复函数的映射
+FIX_ACTIONS = {
+    'download_and_compile_dobby': fix_download_and_compile_dobby,
+    'recompile_dobby': fix_recompile_dobby,
+    'check_ndk_installation': fix_check_ndk_installation,
+    'verify_architecture_support': fix_verify_architecture_support,
+}
+
+
+def rebuild():
+    """重新构建，返回(是否成功, 错误输出)"""
+    build_result = attempt_build()
+    return (True, '') if build_result is True else build_result
+
+
 def attempt_fix_build():
     """尝试修复构建问题"""
+    import fix_scheduler
+    import workspace
+    
     print("开始自动检测和修复构建问题...")
     
-    # 检查Dobby库
-    if not check_dobby_library():
-        print("检测到问题: 缺少Dobby库文件")
-        
-        # 尝试下载Dobby库
-        if download_dobby():
-            print("Dobby库下载成功!")
-        else:
-            print("无法自动下载Dobby库，请手动下载并放置到 jni/external/libdobby.a")
-            print("下载链接: https://github.com/jmpews/Dobby")
-            return False
-    else:
-        print("Dobby库已存在")
+    # 检查Dobby库，缺失时尝试下载
+    if not workspace.ensure_dobby():
+        return False
     
     # 检查NDK配置
-    if not check_ndk_installed():
+    if not workspace.check_ndk_installed():
         print("错误: NDK未配置，请安装NDK并设置ANDROID_NDK_HOME环境变量")
         print("参考文档: NDK_SETUP_GUIDE.md")
         return False
     
     # 编译Dobby库（如果需要）
-    if not compile_dobby_if_needed():
+    if not workspace.compile_dobby_if_needed():
         print("Dobby库编译失败")
         return False
     
@@ -359,36 +284,30 @@ def attempt_fix_build():
         success, error_msg = build_result
         print("\n检测到构建失败，正在尝试修复...")
         
-        # 尝试针对性修复
-        fixes_applied = 0
-        max_fix_attempts = 3
+        # 按优先级队列执行修复动作，修复没有改变工作区状态时不重新构建
+        scheduler = fix_scheduler.FixScheduler(FIX_ACTIONS, rebuild, max_rebuilds=3)
+        success, error_msg = scheduler.run(error_msg)
+        scheduler.print_summary()
         
-        while not success and fixes_applied < max_fix_attempts:
-            fixes_applied += 1
-            print(f"\n正在进行第 {fixes_applied} 次修复尝试...")
-            
-            # 根据错误消息尝试修复
-            if "arm64-v8a" in error_msg.lower():
-                print("检测到ARM64架构相关错误，尝试修复...")
-                # ARM64特定修复
-                success, error_msg = attempt_build()
-            elif "dobby" in error_msg.lower() or "libdobby" in error_msg.lower():
-                print("检测到Dobby库相关错误，重新编译Dobby...")
-                if compile_dobby_if_needed():
-                    success, error_msg = attempt_build()
-                else:
-                    print("Dobby库重新编译失败")
-                    break
-            elif "ndk" in error_msg.lower():
-                print("检测到NDK相关错误...")
-                success, error_msg = attempt_build()
+        if success:
+            # 本地修复已经解决问题，不再需要后台的分析结果
+            cancel_background_analysis()
+        else:
+            # 先在本地查找相似的历史失败，几乎相同的失败直接给出当时的修复方法，不再等待AI分析
+            with build_trace.span('analysis.similar', category='analysis'):
+                similar = failure_index.find_similar(error_msg)
+            if similar:
+                failure_index.print_matches(similar)
+                if similar[0]['similarity'] >= failure_index.SKIP_ANALYSIS_SIMILARITY:
+                    print("与已解决的历史失败几乎相同，跳过AI分析，请参考上面的修复方法")
+                    return success
+            if scheduler.attempts:
+                print("可用的修复动作均未解决问题，尝试AI分析...")
             else:
                 print("未知错误类型，尝试AI分析...")
-                ai_analysis = ai_analyze_error(error_msg)
-                if ai_analysis:
-                    print("AI分析已完成，但自动修复需要人工介入")
-                success = False
-                break
+            ai_analysis = ai_analyze_error(error_msg)
+            if ai_analysis:
+                print("AI分析已完成，但自动修复需要人工介入")
         
         return success
     else:
@@ -396,13 +315,24 @@ def attempt_fix_build():
         return build_result
 
 
-def main():
+def main(argv=None):
     """主函数"""
+    import compiler_cache
+    
+    parser = argparse.ArgumentParser(description="构建项目，失败时自动分析并修复")
+    parser.parse_args(argv)
+    
     print("Build失败自动检测和修复系统启动")
     print("此系统将在检测到构建失败时自动分析和修复问题")
     
     # 尝试修复构建问题
-    success = attempt_fix_build()
+    try:
+        success = attempt_fix_build()
+    finally:
+        cancel_background_analysis()
+    compiler_cache.get_session().report()
+    build_trace.finish()
+    run_history.finish('fix', success)
     
     if success:
         print("\n修复完成，项目构建成功!")
@@ -417,6 +347,47 @@ def main():
         return 1
 
 
+def analyze_main(argv=None):
+    """命令行入口: 分析已有的构建日志，列出匹配的修复动作并请求AI分析"""
+    parser = argparse.ArgumentParser(description="分析构建日志")
+    parser.add_argument('log', help="构建日志文件路径，- 表示标准输入")
+    parser.add_argument('--no-ai', action='store_true', help="只匹配本地修复规则，不请求AI分析")
+    args = parser.parse_args(argv)
+    
+    if args.log == '-':
+        error_msg = sys.stdin.read()
+    else:
+        try:
+            with open(args.log, 'r', encoding='utf-8', errors='replace') as f:
+                error_msg = f.read()
+        except OSError as e:
+            print(f"错误: 无法读取日志: {str(e)}")
+            return 1
+    
+    print(log_reducer.reduce_log(error_msg))
+    errors = [item for item in diagnostics.parse_text(error_msg) if item.is_error]
+    if errors:
+        print(f"错误诊断 ({len(errors)} 个):")
+        diagnostics.print_diagnostics(errors)
+    matches = fix_rules.get_matcher().classify(error_msg)
+    run_history.record_classification(matches)
+    for match in matches:
+        rule = match['rule']
+        print(f"检测到{rule['description']} (匹配: {match['first_line'].strip()})，修复动作: {rule['fix_action']}")
+    if not matches:
+        print("未匹配到已知的错误类型")
+    similar = failure_index.find_similar(error_msg)
+    if similar:
+        failure_index.print_matches(similar)
+    
+    if not args.no_ai:
+        ai_analyze_error(error_msg)
+    build_trace.finish()
+    # 分析的日志中没有错误时才记为成功
+    run_history.finish('analyze', not errors and not matches)
+    return 0
+
+
 def trigger_remote_build():
     """创建远程构建触发器"""
     script_content = '''#!/usr/bin/env python3
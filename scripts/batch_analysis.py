@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+批量分析构建失败日志
+把一个目录下的失败日志按错误指纹聚类，每种不同的失败只匹配一次修复规则、只请求一次AI分析，
+分析请求在有上限的并发池中按速率限制发出，结果再分发回同一类中的每个日志
+"""
+
+import os
+import sys
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import analysis_prompt
+import build_trace
+import diagnostics
+import fix_rules
+import log_reducer
+
+
+DEFAULT_CONCURRENCY = 4
+# 每分钟最多发出的分析请求数，0表示不限速
+DEFAULT_RATE_PER_MINUTE = 30
+DEFAULT_REPORT_PATH = "analysis-batch.json"
+LOG_PATTERNS = ('*.log', '*.txt')
+
+
+def _env_int(name, default):
+    """读取整数类型的环境变量"""
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class Cluster:
+    """指纹相同的一组失败日志"""
+
+    def __init__(self, fingerprint, reduced):
+        self.fingerprint = fingerprint
+        self.reduced = reduced
+        # 缩减后日志中的错误级别诊断
+        self.diagnostics = [item for item in diagnostics.parse_text(reduced) if item.is_error]
+        self.logs = []
+        self.matches = []
+        # 分析结果的来源: cache / api / error / skipped
+        self.source = None
+        self.analysis = None
+        self.error = None
+
+    @property
+    def first_error(self):
+        """第一个错误诊断"""
+        return diagnostics.format_diagnostic(self.diagnostics[0]) if self.diagnostics else None
+
+    def to_dict(self):
+        """转换为可序列化的字典"""
+        return {
+            'fingerprint': self.fingerprint,
+            'logs': [str(path) for path in self.logs],
+            'first_error': self.first_error,
+            'diagnostics': [item.to_dict() for item in self.diagnostics],
+            'fix_actions': [match['rule']['fix_action'] for match in self.matches],
+            'source': self.source,
+            'analysis': self.analysis,
+            'error': self.error,
+        }
+
+
+def find_logs(paths):
+    """展开目录，返回排序后的日志文件列表"""
+    logs = set()
+    for path in map(Path, paths):
+        if path.is_dir():
+            for pattern in LOG_PATTERNS:
+                logs.update(p for p in path.rglob(pattern) if p.is_file())
+        elif path.is_file():
+            logs.add(path)
+    return sorted(logs)
+
+
+def cluster_logs(log_paths, salt=''):
+    """逐个缩减日志并按指纹聚类，返回按日志数量降序排列的Cluster列表"""
+    clusters = {}
+    with build_trace.span('batch.cluster', category='analysis', logs=len(log_paths)):
+        for log_path in log_paths:
+            try:
+                reduced = log_reducer.reduce_file(log_path)
+            except OSError as e:
+                print(f"警告: 无法读取日志 {log_path}: {str(e)}")
+                continue
+            # 与单个日志的分析使用相同的指纹，可以共用分析缓存
+            key = log_reducer.fingerprint(reduced, salt=salt)
+            cluster = clusters.get(key)
+            if cluster is None:
+                cluster = clusters[key] = Cluster(key, reduced)
+                # 对决定这一类的错误文本匹配规则，同一类的所有日志得到相同的修复动作
+                cluster.matches = fix_rules.get_matcher().classify(log_reducer.error_text(reduced))
+            cluster.logs.append(log_path)
+    return sorted(clusters.values(), key=lambda cluster: -len(cluster.logs))
+
+
+def _analyze_one(client, limiter, cluster):
+    """发出一个分析请求，结果写入cluster"""
+    import analysis_cache
+    import analysis_client
+
+    limiter.acquire()
+    try:
+        cluster.analysis = client.analyze(analysis_prompt.build_prompt(cluster.reduced), temperature=0.1)
+    except analysis_client.AnalysisError as e:
+        cluster.source = 'error'
+        cluster.error = str(e)
+        return
+    except Exception as e:
+        # 一个请求的意外错误不能中断整个批量分析
+        cluster.source = 'error'
+        cluster.error = f"{type(e).__name__}: {str(e)}"
+        return
+    cluster.source = 'api'
+    analysis_cache.put(cluster.fingerprint, cluster.analysis)
+
+
+def analyze_clusters(clusters, api_url, api_key, model, concurrency, rate_per_minute):
+    """先查分析缓存，未命中的失败以有上限的并发和速率请求分析接口"""
+    import analysis_cache
+    import analysis_client
+
+    pending = []
+    for cluster in clusters:
+        cached = analysis_cache.get(cluster.fingerprint)
+        if cached is not None:
+            cluster.source = 'cache'
+            cluster.analysis = cached
+        elif not api_key:
+            cluster.source = 'skipped'
+        else:
+            pending.append(cluster)
+    if not pending:
+        return
+
+    client = analysis_client.get_client(api_url, api_key, model)
+    # 突发量与并发数相同，之后按平均速率放行
+    limiter = analysis_client.RateLimiter(rate_per_minute / 60, burst=concurrency)
+    print(f"请求AI分析 {len(pending)} 种失败 (并发 {concurrency}，"
+          f"{'不限速' if rate_per_minute <= 0 else f'每分钟 {rate_per_minute} 个'})")
+    with build_trace.span('batch.analysis', category='analysis', clusters=len(pending)), \
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='batch-analysis') as executor:
+        for future in [executor.submit(_analyze_one, client, limiter, cluster) for cluster in pending]:
+            future.result()
+
+
+def build_report(clusters):
+    """生成批量分析报告，每个日志都附带其所在类的结果"""
+    logs = {}
+    for index, cluster in enumerate(clusters):
+        for log_path in cluster.logs:
+            logs[str(log_path)] = {
+                'cluster': index,
+                'cluster_size': len(cluster.logs),
+                'fingerprint': cluster.fingerprint,
+                'fix_actions': [match['rule']['fix_action'] for match in cluster.matches],
+                'source': cluster.source,
+                'analysis': cluster.analysis,
+                'error': cluster.error,
+            }
+    return {
+        'clusters': [cluster.to_dict() for cluster in clusters],
+        'logs': logs,
+    }
+
+
+def print_clusters(clusters, log_count):
+    """打印每种失败的日志数量、修复动作和分析结果"""
+    print(f"{log_count} 个日志，{len(clusters)} 种不同的失败")
+    for index, cluster in enumerate(clusters):
+        print(f"\n[{index + 1}] {len(cluster.logs)} 个日志  指纹 {cluster.fingerprint[:12]}")
+        if cluster.first_error:
+            print(f"  首个错误: {cluster.first_error}")
+        for log_path in cluster.logs[:5]:
+            print(f"  - {log_path}")
+        if len(cluster.logs) > 5:
+            print(f"  - ... 另外 {len(cluster.logs) - 5} 个")
+        for match in cluster.matches:
+            rule = match['rule']
+            print(f"  检测到{rule['description']}，修复动作: {rule['fix_action']}")
+        if cluster.source == 'error':
+            print(f"  AI分析失败: {cluster.error}")
+        elif cluster.analysis:
+            label = "缓存" if cluster.source == 'cache' else "AI"
+            print(f"  {label}分析结果:\n{cluster.analysis}")
+
+
+def main(argv=None):
+    """命令行入口: 批量分析一个或多个目录中的失败日志"""
+    parser = argparse.ArgumentParser(description="按错误指纹聚类并批量分析构建失败日志")
+    parser.add_argument('paths', nargs='+', help="日志目录或日志文件")
+    parser.add_argument('--no-ai', action='store_true', help="只聚类和匹配本地修复规则，不请求AI分析")
+    parser.add_argument('--concurrency', type=int,
+                        default=_env_int('ANALYSIS_BATCH_CONCURRENCY', DEFAULT_CONCURRENCY),
+                        help="同时进行的分析请求数")
+    parser.add_argument('--rate', type=int, default=_env_int('ANALYSIS_RATE_LIMIT', DEFAULT_RATE_PER_MINUTE),
+                        help="每分钟最多发出的分析请求数，0表示不限速")
+    parser.add_argument('--output', default=DEFAULT_REPORT_PATH, help="批量分析报告(JSON)的路径")
+    args = parser.parse_args(argv)
+
+    log_paths = find_logs(args.paths)
+    if not log_paths:
+        print("错误: 没有找到日志文件")
+        return 1
+
+    api_key = os.environ.get('SHENGSUAN_API_KEY')
+    api_url = os.environ.get('SHENGSUAN_API_URL', 'https://api.shengsuan.cloud/v1/chat/completions')
+    model = os.environ.get('SHENGSUAN_MODEL', 'deepseek/deepseek-v3.2')
+
+    clusters = cluster_logs(log_paths, salt=model)
+    if not args.no_ai:
+        if not api_key:
+            print("警告: 未设置SHENGSUAN_API_KEY环境变量，只使用缓存的AI分析结果")
+        analyze_clusters(clusters, api_url, api_key, model, max(1, args.concurrency), args.rate)
+
+    print_clusters(clusters, len(log_paths))
+    try:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(build_report(clusters), f, indent=2, ensure_ascii=False)
+        print(f"\n批量分析报告: {args.output}")
+    except OSError as e:
+        print(f"警告: 无法写入批量分析报告: {str(e)}")
+    build_trace.finish()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
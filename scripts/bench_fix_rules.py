@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+修复规则匹配器的微基准测试
+生成合成构建日志，对比规则索引与逐条规则扫描整个日志的吞吐量(MB/s)
+"""
+
+import sys
+import time
+import random
+import argparse
+
+import fix_rules
+
+
+# 合成日志使用的普通输出行与错误行
+NOISE_LINES = [
+    "[arm64-v8a] Compile++      : lsfbypass <= main.cpp",
+    "[arm64-v8a] Compile++      : lsfbypass <= hook.cpp",
+    "/usr/local/android-ndk/toolchains/llvm/prebuilt/linux-x86_64/bin/clang++ -MMD -MP -MF obj/local/arm64-v8a/objs/lsfbypass/cache.o.d -target aarch64-none-linux-android33 -fdata-sections -ffunction-sections -fstack-protector-strong -funwind-tables -no-canonical-prefixes  --sysroot /usr/local/android-ndk/sysroot -g -Wno-invalid-command-line-argument -Wno-unused-command-line-argument  -D_FORTIFY_SOURCE=2 -fpic -O2 -DNDEBUG  -Ijni -std=c++17 -Wall -Werror -c jni/cache.cpp -o obj/local/arm64-v8a/objs/lsfbypass/cache.o",
+    "In file included from jni/hook.cpp:3:",
+    "make: Entering directory '/home/runner/work/PROMPT_SPEC/jni'",
+    "[arm64-v8a] SharedLibrary  : liblsfbypass.so",
+]
+ERROR_LINES = [
+    "Error: jni/external/libdobby.a: No such file or directory",
+    "jni/hook.cpp:42:10: error: use of undeclared identifier 'DobbyHook'",
+    "Android NDK: ANDROID_NDK_HOME is not set",
+    "ld: error: undefined symbol: DobbyHook",
+    "build.sh: line 12: ndk-build: command not found",
+]
+
+
+def generate_log(size_mb, error_ratio=0.001, seed=0):
+    """生成指定大小的合成构建日志，error_ratio为0时只在末尾附加错误行"""
+    rng = random.Random(seed)
+    target_size = int(size_mb * 1024 * 1024)
+    lines = []
+    size = 0
+    while size < target_size:
+        if rng.random() < error_ratio:
+            line = rng.choice(ERROR_LINES)
+        else:
+            line = rng.choice(NOISE_LINES)
+        lines.append(line)
+        size += len(line) + 1
+    if error_ratio == 0:
+        lines.extend(ERROR_LINES)
+    return '\n'.join(lines) + '\n'
+
+
+def naive_classify(error_msg, rules):
+    """对照实现: 每条规则单独扫描整个日志"""
+    return [rule for rule in rules if rule['pattern'].search(error_msg)]
+
+
+def measure(func, text, repeat):
+    """多次运行取最快一次的耗时"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main(argv=None):
+    """主函数"""
+    parser = argparse.ArgumentParser(description="修复规则匹配器吞吐量基准测试")
+    parser.add_argument('--size-mb', type=float, default=100, help="合成日志大小(MB)，默认100")
+    parser.add_argument('--repeat', type=int, default=3, help="重复次数，取最快一次")
+    parser.add_argument('--error-ratio', type=float, default=0.001, help="常规场景中错误行的比例")
+    parser.add_argument('--config', default=None, help="auto_fix_config.json 路径")
+    args = parser.parse_args(argv)
+
+    rules = fix_rules.load_fix_rules(args.config)
+    matcher = fix_rules.RuleMatcher(rules)
+
+    print(f"规则数: {len(rules)}")
+    # 常规场景: 错误行随机分布；最坏场景: 错误行全部位于日志末尾，需要完整扫描
+    scenarios = [
+        ("常规日志", args.error_ratio),
+        ("错误位于末尾", 0),
+    ]
+    for name, error_ratio in scenarios:
+        text = generate_log(args.size_mb, error_ratio)
+        size_mb = len(text.encode('utf-8')) / (1024 * 1024)
+
+        combined_time, combined_result = measure(matcher.classify, text, args.repeat)
+        naive_time, naive_result = measure(lambda t: naive_classify(t, rules), text, args.repeat)
+
+        print(f"\n[{name}] 日志大小: {size_mb:.1f} MB")
+        print(f"规则索引分类: {combined_time:.3f}s  {size_mb / combined_time:.1f} MB/s  命中 {len(combined_result)} 条规则")
+        print(f"逐条规则扫描: {naive_time:.3f}s  {size_mb / naive_time:.1f} MB/s  命中 {len(naive_result)} 条规则")
+        for match in combined_result:
+            rule = match['rule']
+            print(f"  [{rule['priority']:>3}] {rule['fix_action']:<30} {rule['description']}")
+
+        if {m['rule']['index'] for m in combined_result} != {r['index'] for r in naive_result}:
+            print("错误: 两种实现的匹配结果不一致")
+            return 1
+        del text
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
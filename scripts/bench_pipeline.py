@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+构建修复流程的基准测试
+通过 simulate_build_failure.sh 回放 bench/corpus/ 中录制的构建失败日志，依次经过
+日志捕获、日志缩减、规则分类、修复计划和AI分析(本地桩服务)各阶段，
+统计每个阶段的p50/p95耗时和Python堆内存峰值，并与 bench/baseline.json 比较，
+分类或修复计划发生变化、耗时或内存超出容差时返回非零
+"""
+
+import io
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import contextlib
+import tempfile
+import threading
+import tracemalloc
+import http.server
+from pathlib import Path
+
+import analysis_client
+import analysis_prompt
+import auto_fix_on_build_failure
+import build_runner
+import fix_rules
+import fix_scheduler
+import log_reducer
+
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SIMULATOR = REPO_ROOT / "simulate_build_failure.sh"
+CORPUS_DIR = REPO_ROOT / "bench" / "corpus"
+DEFAULT_BASELINE_PATH = REPO_ROOT / "bench" / "baseline.json"
+
+STAGES = ['capture', 'reduce', 'classify', 'plan', 'analysis']
+
+DEFAULT_ITERATIONS = 30
+WARMUP_ITERATIONS = 2
+DEFAULT_TOLERANCE = 0.5
+
+# 亚毫秒级的阶段受调度抖动影响较大，比较时额外允许的绝对误差
+LATENCY_SLACK_MS = 1.0
+MEMORY_SLACK_KB = 64
+
+
+class StubAnalysisHandler(http.server.BaseHTTPRequestHandler):
+    """兼容chat/completions格式的本地桩服务，固定返回一段分析结果"""
+
+    protocol_version = 'HTTP/1.1'
+    # 响应头和响应体分两次写出，不关闭Nagle算法时会与客户端的延迟确认叠加出约40ms的等待
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        """处理分析请求"""
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        prompt = request['messages'][0]['content']
+        body = json.dumps({
+            'choices': [{'message': {'role': 'assistant', 'content': f"桩分析结果: 收到 {len(prompt)} 个字符"}}],
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """不输出访问日志"""
+
+
+def start_stub_server(latency=0.0):
+    """在后台线程中启动桩服务，返回(服务器, 接口地址)"""
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StubAnalysisHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    return server, f"http://{host}:{port}/v1/chat/completions"
+
+
+def list_scenarios():
+    """录制的场景名称"""
+    return sorted(path.stem for path in CORPUS_DIR.glob('*.log'))
+
+
+def percentile(values, pct):
+    """最近秩百分位数"""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class Pipeline:
+    """构建修复流程的各阶段，每个阶段的输入来自前一个阶段"""
+
+    def __init__(self, work_dir, analysis_url):
+        self.work_dir = Path(work_dir)
+        self.matcher = fix_rules.RuleMatcher(fix_rules.load_fix_rules())
+        # 只用到修复动作的名称，修复计划阶段不执行修复
+        self.actions = dict.fromkeys(auto_fix_on_build_failure.FIX_ACTIONS)
+        self.client = analysis_client.AnalysisClient(analysis_url, 'bench', 'stub', max_retries=0, pool_size=1)
+
+    def capture(self, scenario):
+        """运行模拟构建并捕获输出"""
+        # 不在终端打印构建监控的提示
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = build_runner.run_streaming(['bash', str(SIMULATOR), scenario], cwd=REPO_ROOT,
+                                                log_path=self.work_dir / "capture.log", echo=False)
+        return result.output
+
+    def reduce(self, output):
+        """缩减日志"""
+        return log_reducer.reduce_log(output)
+
+    def classify(self, output):
+        """按修复规则分类"""
+        return self.matcher.classify(output)
+
+    def plan(self, output):
+        """计算错误指纹并生成修复队列"""
+        scheduler = fix_scheduler.FixScheduler(self.actions, build=None, matcher=self.matcher)
+        signature = fix_scheduler.error_signature(output)
+        return signature, [rule['fix_action'] for rule in scheduler.plan(output, ())]
+
+    def analysis(self, reduced):
+        """向桩服务发送分析请求"""
+        return self.client.analyze(analysis_prompt.build_prompt(reduced))
+
+    def run_once(self, scenario, timings=None):
+        """完整运行一次，timings不为None时记录各阶段耗时(毫秒)，返回(指纹, 修复计划)"""
+        def timed(stage, func, *args):
+            start = time.perf_counter()
+            value = func(*args)
+            if timings is not None:
+                timings[stage].append((time.perf_counter() - start) * 1000)
+            return value
+
+        output = timed('capture', self.capture, scenario)
+        reduced = timed('reduce', self.reduce, output)
+        timed('classify', self.classify, output)
+        signature, actions = timed('plan', self.plan, output)
+        timed('analysis', self.analysis, reduced)
+        return signature, actions
+
+    def measure_memory(self, scenario):
+        """单独运行一次，返回各阶段的Python堆内存峰值(KB)；tracemalloc会拖慢执行，不与计时同时进行"""
+        output = self.capture(scenario)
+        reduced = self.reduce(output)
+        stage_inputs = {
+            'capture': (self.capture, scenario),
+            'reduce': (self.reduce, output),
+            'classify': (self.classify, output),
+            'plan': (self.plan, output),
+            'analysis': (self.analysis, reduced),
+        }
+        peaks = {}
+        for stage in STAGES:
+            func, arg = stage_inputs[stage]
+            tracemalloc.start()
+            try:
+                func(arg)
+                peaks[stage] = tracemalloc.get_traced_memory()[1] / 1024
+            finally:
+                tracemalloc.stop()
+        return peaks
+
+    def close(self):
+        """关闭分析客户端"""
+        self.client.close()
+
+
+def run_benchmark(scenarios, iterations, stub_latency=0.0):
+    """运行所有场景，返回结果数据"""
+    server, url = start_stub_server(stub_latency)
+    results = {'iterations': iterations, 'scenarios': {}}
+    with tempfile.TemporaryDirectory(prefix='bench-pipeline-') as work_dir:
+        # 修复计划依赖修复记录和失败相似度索引，使用空记录保证结果可重复
+        isolated = {
+            'FIX_HISTORY_PATH': os.path.join(work_dir, 'fix_history.json'),
+            'FAILURE_INDEX_DIR': os.path.join(work_dir, 'failure_index'),
+        }
+        previous = {name: os.environ.get(name) for name in isolated}
+        os.environ.update(isolated)
+        pipeline = Pipeline(work_dir, url)
+        try:
+            for scenario in scenarios:
+                for _ in range(WARMUP_ITERATIONS):
+                    pipeline.run_once(scenario)
+                timings = {stage: [] for stage in STAGES}
+                for _ in range(iterations):
+                    signature, actions = pipeline.run_once(scenario, timings)
+                peaks = pipeline.measure_memory(scenario)
+                results['scenarios'][scenario] = {
+                    'fingerprint': signature,
+                    'actions': actions,
+                    'stages': {
+                        stage: {
+                            'p50_ms': round(percentile(timings[stage], 50), 3),
+                            'p95_ms': round(percentile(timings[stage], 95), 3),
+                            'peak_kb': round(peaks[stage], 1),
+                        }
+                        for stage in STAGES
+                    },
+                }
+        finally:
+            pipeline.close()
+            server.shutdown()
+            server.server_close()
+            for name, value in previous.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """与基线比较，返回回归描述列表"""
+    regressions = []
+    for scenario, current in results['scenarios'].items():
+        expected = baseline.get('scenarios', {}).get(scenario)
+        if expected is None:
+            continue
+        if current['actions'] != expected['actions']:
+            regressions.append(f"{scenario}: 修复计划 {current['actions']} != 基线 {expected['actions']}")
+        if current['fingerprint'] != expected['fingerprint']:
+            regressions.append(f"{scenario}: 错误指纹与基线不一致")
+        for stage, stats in current['stages'].items():
+            base = expected['stages'].get(stage)
+            if base is None:
+                continue
+            limit = base['p95_ms'] * (1 + tolerance) + LATENCY_SLACK_MS
+            if stats['p95_ms'] > limit:
+                regressions.append(f"{scenario}/{stage}: p95 {stats['p95_ms']:.2f}ms > "
+                                   f"基线 {base['p95_ms']:.2f}ms (上限 {limit:.2f}ms)")
+            limit = base['peak_kb'] * (1 + tolerance) + MEMORY_SLACK_KB
+            if stats['peak_kb'] > limit:
+                regressions.append(f"{scenario}/{stage}: 内存峰值 {stats['peak_kb']:.0f}KB > "
+                                   f"基线 {base['peak_kb']:.0f}KB (上限 {limit:.0f}KB)")
+    return regressions
+
+
+def print_results(results):
+    """打印各场景各阶段的统计"""
+    for scenario, data in results['scenarios'].items():
+        print(f"\n[{scenario}] 修复计划: {', '.join(data['actions']) or '无'}")
+        print(f"  {'阶段':<10} {'p50':>9} {'p95':>9} {'内存峰值':>10}")
+        for stage, stats in data['stages'].items():
+            print(f"  {stage:<10} {stats['p50_ms']:>7.2f}ms {stats['p95_ms']:>7.2f}ms {stats['peak_kb']:>8.0f}KB")
+
+
+def _env_float(name, default):
+    """读取浮点类型的环境变量"""
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def main(argv=None):
+    """命令行入口: 运行基准测试并与基线比较"""
+    parser = argparse.ArgumentParser(description="构建修复流程基准测试")
+    parser.add_argument('--scenarios', default=None, help=f"逗号分隔的场景，默认全部: {', '.join(list_scenarios())}")
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS, help="每个场景的计时次数")
+    parser.add_argument('--stub-latency-ms', type=float, default=0, help="桩服务的响应延迟(毫秒)")
+    parser.add_argument('--baseline', default=str(DEFAULT_BASELINE_PATH), help="基线文件路径")
+    parser.add_argument('--update-baseline', action='store_true', help="用本次结果覆盖基线")
+    parser.add_argument('--tolerance', type=float, default=_env_float('BENCH_TOLERANCE', DEFAULT_TOLERANCE),
+                        help="耗时和内存相对基线允许增加的比例")
+    parser.add_argument('--json', default=None, help="把结果写入JSON文件")
+    args = parser.parse_args(argv)
+
+    scenarios = args.scenarios.split(',') if args.scenarios else list_scenarios()
+    unknown = [scenario for scenario in scenarios if not (CORPUS_DIR / f"{scenario}.log").exists()]
+    if unknown:
+        print(f"错误: 未知的场景: {', '.join(unknown)}")
+        return 1
+
+    results = run_benchmark(scenarios, args.iterations, args.stub_latency_ms / 1000)
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+    baseline_path = Path(args.baseline)
+    if args.update_baseline:
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        print(f"\n基线已更新: {baseline_path}")
+        return 0
+
+    try:
+        with open(baseline_path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    except (OSError, ValueError):
+        print(f"\n未找到基线 {baseline_path}，使用 --update-baseline 生成")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\n检测到 {len(regressions)} 处回归 (容差 {args.tolerance:.0%}):")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print(f"\n与基线相比没有回归 (容差 {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
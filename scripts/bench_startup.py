@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+命令行冷启动耗时基准测试
+在新的解释器进程中反复运行 python -m scripts <子命令> --help，测量从启动进程到子命令解析完参数的耗时，
+即每次构建前固定付出的开销；中位数超过预算时返回非零，并列出导入最慢的模块
+"""
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+from pathlib import Path
+
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# 冷启动预算(毫秒)，见 USER_GUIDE.md 中的"统一命令行入口"
+DEFAULT_BUDGET_MS = 150
+DEFAULT_RUNS = 10
+DEFAULT_TOP = 10
+
+
+def _env_int(name, default):
+    """读取整数类型的环境变量"""
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def measure_startup(command, runs):
+    """返回每次冷启动的耗时(毫秒)列表"""
+    cmd = [sys.executable, '-m', 'scripts', command, '--help']
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(cmd, cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        elapsed = (time.perf_counter() - start) * 1000
+        if result.returncode != 0:
+            raise RuntimeError(f"{' '.join(cmd)} 退出码 {result.returncode}: "
+                               f"{result.stderr.decode('utf-8', errors='replace').strip()}")
+        timings.append(elapsed)
+    return timings
+
+
+def slowest_imports(command, top=DEFAULT_TOP):
+    """用 -X importtime 找出累计导入耗时最长的顶层模块，返回[(微秒, 模块名)]"""
+    cmd = [sys.executable, '-X', 'importtime', '-m', 'scripts', command, '--help']
+    result = subprocess.run(cmd, cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            text=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        # 格式: "import time: self [us] | cumulative | imported package"
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2]
+        # 只统计被直接导入的模块，嵌套导入已计入其累计耗时
+        if name.startswith('  '):
+            continue
+        imports.append((int(parts[1]), name.strip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+def main(argv=None):
+    """命令行入口: 测量冷启动耗时并与预算比较"""
+    parser = argparse.ArgumentParser(description="命令行冷启动耗时基准测试")
+    parser.add_argument('--command', default='build', help="要测量的子命令，默认build")
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS, help="运行次数")
+    parser.add_argument('--budget-ms', type=int, default=_env_int('CLI_STARTUP_BUDGET_MS', DEFAULT_BUDGET_MS),
+                        help="中位数耗时预算(毫秒)")
+    args = parser.parse_args(argv)
+
+    try:
+        timings = sorted(measure_startup(args.command, args.runs))
+    except RuntimeError as e:
+        print(f"错误: {str(e)}")
+        return 1
+    median = timings[len(timings) // 2]
+    print(f"python -m scripts {args.command}: 冷启动 {args.runs} 次，"
+          f"最快 {timings[0]:.1f}ms / 中位数 {median:.1f}ms / 最慢 {timings[-1]:.1f}ms (预算 {args.budget_ms}ms)")
+
+    print("\n导入耗时最长的模块:")
+    for cumulative_us, name in slowest_imports(args.command):
+        print(f"  {cumulative_us / 1000:7.1f}ms  {name}")
+
+    if median > args.budget_ms:
+        print(f"\n错误: 冷启动中位数 {median:.1f}ms 超出预算 {args.budget_ms}ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
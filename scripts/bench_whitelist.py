@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+白名单加载和查找的基准测试
+生成合成白名单，对比逐行解析文本并插入哈希集合(jni/cache.cpp 的做法)与mmap二进制有序字符串表的
+加载耗时、加载时分配的内存和单次查找耗时；Python中的绝对数值只作参考，比例可以反映设备端的差异
+"""
+
+import sys
+import math
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+import whitelist_table
+
+
+DEFAULT_ENTRIES = 50000
+DEFAULT_LOOKUPS = 100000
+DEFAULT_REPEAT = 5
+
+WORDS = ['android', 'google', 'miui', 'xiaomi', 'tencent', 'alibaba', 'game', 'video', 'music', 'camera',
+         'browser', 'launcher', 'wallet', 'mobile', 'cloud', 'social', 'maps', 'store', 'player', 'chat']
+
+
+def generate_entries(count, seed=0):
+    """生成不重复的合成包名"""
+    rng = random.Random(seed)
+    entries = set()
+    while len(entries) < count:
+        parts = [rng.choice(('com', 'org', 'net', 'cn', 'io'))]
+        parts += rng.sample(WORDS, rng.randint(1, 3))
+        parts.append(f"{rng.choice(WORDS)}{rng.randrange(100000)}")
+        entries.add('.'.join(parts))
+    return sorted(entries)
+
+
+def load_text(path):
+    """逐行读取文本白名单并插入集合，与设备端现有的加载方式相同"""
+    whitelist = set()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                whitelist.add(line)
+    return whitelist
+
+
+def best_time(func, repeat):
+    """多次运行取最快一次的耗时(秒)和最后一次的返回值"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def allocated_bytes(func):
+    """func返回的对象仍然存活时的内存分配峰值"""
+    tracemalloc.start()
+    try:
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    if hasattr(result, 'close'):
+        result.close()
+    return peak
+
+
+def measure_lookups(container, queries, repeat):
+    """每次查找的平均耗时(纳秒)，同时返回命中数"""
+    def run():
+        return sum(1 for query in queries if query in container)
+    elapsed, hits = best_time(run, repeat)
+    return elapsed / len(queries) * 1e9, hits
+
+
+def main(argv=None):
+    """命令行入口: 生成合成白名单并对比两种格式"""
+    parser = argparse.ArgumentParser(description="白名单加载和查找基准测试")
+    parser.add_argument('--entries', type=int, default=DEFAULT_ENTRIES, help="白名单条目数")
+    parser.add_argument('--lookups', type=int, default=DEFAULT_LOOKUPS, help="查找次数，命中和未命中各占一半")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="重复次数，取最快一次")
+    args = parser.parse_args(argv)
+
+    entries = generate_entries(args.entries)
+    rng = random.Random(1)
+    queries = [rng.choice(entries) if i % 2 == 0 else f"com.missing.app{i}" for i in range(args.lookups)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        text_path = Path(tmp_dir) / 'whitelist.txt'
+        table_path = Path(tmp_dir) / 'whitelist.bin'
+        text_path.write_text(''.join(name + '\n' for name in rng.sample(entries, len(entries))),
+                             encoding='utf-8')
+        whitelist_table.write_table(entries, table_path)
+
+        text_load, text_set = best_time(lambda: load_text(text_path), args.repeat)
+        table_load, _ = best_time(lambda: whitelist_table.WhitelistTable(table_path, verify=False).close(),
+                                  args.repeat)
+        verified_load, _ = best_time(lambda: whitelist_table.WhitelistTable(table_path).close(), args.repeat)
+        text_memory = allocated_bytes(lambda: load_text(text_path))
+        table_memory = allocated_bytes(lambda: whitelist_table.WhitelistTable(table_path, verify=False))
+
+        table = whitelist_table.WhitelistTable(table_path)
+        text_lookup, text_hits = measure_lookups(text_set, queries, args.repeat)
+        table_lookup, table_hits = measure_lookups(table, queries, args.repeat)
+        table.close()
+
+        text_size = text_path.stat().st_size
+        table_size = table_path.stat().st_size
+
+    if text_hits != table_hits:
+        print(f"错误: 两种格式的查找结果不一致 ({text_hits} / {table_hits})")
+        return 1
+
+    print(f"{args.entries} 个条目，{args.lookups} 次查找 (命中 {text_hits})")
+    print(f"  {'格式':<16} {'文件大小':>10} {'加载耗时':>12} {'加载分配内存':>14} {'单次查找':>10}")
+    print(f"  {'文本+哈希集合':<16} {text_size / 1024:>8.0f}KB {text_load * 1000:>10.2f}ms "
+          f"{text_memory / 1024:>12.0f}KB {text_lookup:>8.0f}ns")
+    print(f"  {'mmap有序表':<16} {table_size / 1024:>8.0f}KB {table_load * 1000:>10.2f}ms "
+          f"{table_memory / 1024:>12.0f}KB {table_lookup:>8.0f}ns")
+    print(f"  {'mmap有序表+CRC':<16} {'':>10} {verified_load * 1000:>10.2f}ms")
+    print(f"\n加载耗时降低为文本方式的 {table_load / text_load:.2%}")
+    # Python中每次比较都要经过解释器，有序表的查找耗时主要是解释器开销；
+    # 设备端每次查找最多 log2(n) 次memcmp，且结果会被按UID缓存
+    print(f"有序表每次查找最多比较 {math.ceil(math.log2(args.entries + 1))} 次")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
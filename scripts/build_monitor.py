@@ -1,58 +1,85 @@
 #!/usr/bin/env python3
 """
 构建失败监控脚本
-监控构建过程并在失败时自动启动修复流程
+监控构建过程并在失败时自动启动修复流程；
+--watch 模式下常驻运行，监听源码和配置的变化，合并短时间内的连续修改后立即增量构建，
+新的修改到来时取消已经过时的构建
 """
 
 import os
 import sys
-import subprocess
+import argparse
 import time
 import threading
 from pathlib import Path
 
+import build_runner
+import build_trace
+import build_tuning
+import compiler_cache
+import diagnostics
+import failure_index
+import fix_rules
+import log_reducer
+import matrix_build
+import preflight
+import run_history
+
+
+# build.sh位于仓库根目录，需要在根目录下运行
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# 监听模式下递归监听的目录和单独监听的文件
+WATCH_ROOTS = [Path("jni")]
+WATCH_FILES = [Path("jni/Android.mk"), Path("jni/Application.mk"), Path("auto_fix_config.json")]
+# 构建产物和Dobby源码目录的变化不触发构建
+WATCH_IGNORED_DIRS = {'obj', 'libs', 'build-matrix', 'build-profile', 'Dobby', '.git'}
+CONFIG_FILE = "auto_fix_config.json"
+
+DEFAULT_DEBOUNCE_MS = 300
+
 
 def run_build_and_monitor():
     """运行构建并监控结果"""
     print("开始构建并监控...")
+    cache_session = compiler_cache.get_session()
+    jobs = build_tuning.choose_jobs('ndk-build', verbose=True)
     
     try:
-        # 运行构建脚本
-        result = subprocess.run(
-            ['bash', '../build.sh'],
-            cwd=os.path.dirname(__file__),
-            check=False,
-            capture_output=True,
-            text=True
-        )
+        # 流式运行构建脚本，实时输出进度
+        with build_trace.span('build'):
+            result = build_runner.run_streaming(
+                ['bash', 'build.sh'],
+                cwd=REPO_ROOT,
+                env=build_tuning.build_env(jobs, cache_session.env())
+            )
+        cache_session.record_build(result.elapsed)
+        build_tuning.record('ndk-build', jobs, result)
         
         if result.returncode != 0:
-            print("检测到构建失败，错误信息:")
-            print(result.stderr)
-            return result.stderr
+            print(f"检测到构建失败，完整日志: {result.log_path}")
+            return result.output
         else:
-            print("构建成功!")
-            print(result.stdout)
+            print(f"构建成功! 用时 {result.elapsed:.1f}s")
             return None
             
     except FileNotFoundError:
         # 尝试PowerShell
         try:
-            result = subprocess.run(
-                ['powershell', '../build.sh'],
-                cwd=os.path.dirname(__file__),
-                check=False,
-                capture_output=True,
-                text=True
-            )
+            with build_trace.span('build'):
+                result = build_runner.run_streaming(
+                    ['powershell', './build.sh'],
+                    cwd=REPO_ROOT,
+                    env=build_tuning.build_env(jobs, cache_session.env())
+                )
+            cache_session.record_build(result.elapsed)
+            build_tuning.record('ndk-build', jobs, result)
             
             if result.returncode != 0:
-                print("检测到构建失败，错误信息:")
-                print(result.stderr)
-                return result.stderr
+                print(f"检测到构建失败，完整日志: {result.log_path}")
+                return result.output
             else:
-                print("构建成功!")
-                print(result.stdout)
+                print(f"构建成功! 用时 {result.elapsed:.1f}s")
                 return None
         except FileNotFoundError:
             print("找不到bash或PowerShell命令")
@@ -63,12 +90,11 @@ def handle_build_failure(error_msg):
     """处理构建失败"""
     print("构建失败，启动自动修复流程...")
     
-    # 导入自动修复脚本并运行
-    sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-    from scripts.auto_fix_on_build_failure import attempt_fix_build
+    # 自动修复模块依赖AI分析客户端，只在构建失败时才导入
+    import auto_fix_on_build_failure
     
     # 运行修复
-    success = attempt_fix_build()
+    success = auto_fix_on_build_failure.attempt_fix_build()
     
     if success:
         print("自动修复成功！")
@@ -88,19 +114,159 @@ def handle_build_failure(error_msg):
         return False
 
 
-def main():
+class WatchBuilder:
+    """监听模式下的增量构建，同一时间只运行一个构建，新的修改到来时取消正在进行的构建"""
+
+    def __init__(self, ndk_build, abi, jobs):
+        self.ndk_build = ndk_build
+        self.abi = abi
+        self.jobs = jobs
+        self.cache_session = compiler_cache.get_session()
+        self._thread = None
+        self._cancel = None
+        # 最近一次失败的输出，以及之后修改过的文件；下一次构建成功时作为已解决的失败存入相似度索引
+        self._failure = None
+        self._changes = set()
+
+    def start(self, changed_at, changed=()):
+        """取消过时的构建并开始新的构建"""
+        self.cancel()
+        self._changes.update(changed)
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(self._cancel, changed_at), daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        """取消正在进行的构建并等待其退出"""
+        if self._thread is not None and self._thread.is_alive():
+            print("[监听] 有新的修改，取消正在进行的构建")
+            self._cancel.set()
+            self._thread.join()
+
+    def _run(self, cancel, changed_at):
+        """运行一次增量ndk-build"""
+        cmd = [self.ndk_build, f'APP_ABI={self.abi}', f'-j{self.jobs}']
+        with build_trace.span('watch.build', abi=self.abi):
+            result = build_runner.run_streaming(cmd, cwd=matrix_build.JNI_DIR,
+                                                env=self.cache_session.env(), cancel=cancel)
+        if result.cancelled:
+            return
+        self.cache_session.record_build(result.elapsed)
+        build_tuning.record('ndk-build', self.jobs, result)
+
+        latency = time.monotonic() - changed_at
+        if result.returncode == 0:
+            print(f"[监听] 构建成功，用时 {result.elapsed:.1f}s，从修改到产物 {latency:.1f}s")
+            run_history.finish('watch', True)
+            if self._failure is not None and self._changes:
+                failure_index.record_fix(self._failure, f"修改 {', '.join(sorted(self._changes))}", 'watch')
+            self._failure = None
+            self._changes = set()
+            return
+
+        self._failure = result.output
+        self._changes = set()
+
+        print(f"[监听] 构建失败，完整日志: {result.log_path}")
+        errors = [item for item in result.diagnostics if item.is_error]
+        if errors:
+            diagnostics.print_diagnostics(errors)
+        else:
+            print(log_reducer.reduce_result(result))
+        matches = fix_rules.get_matcher().classify(result.output)
+        run_history.record_classification(matches)
+        run_history.finish('watch', False)
+        for match in matches:
+            rule = match['rule']
+            print(f"[监听] {rule['description']}，可运行自动修复脚本执行: {rule['fix_action']}")
+        if not matches:
+            similar = failure_index.find_similar(result.output, k=3)
+            if similar:
+                failure_index.print_matches(similar)
+
+
+def watch(abi, debounce_seconds):
+    """常驻监听源码和配置，变化后增量构建"""
+    # inotify通过ctypes加载libc，只在监听模式下才导入
+    import file_watch
+
+    # 预检只在启动时执行一次
+    report = preflight.run_preflight()
+    ndk_build = matrix_build.find_ndk_build(report.ndk_path)
+    if ndk_build is None:
+        print("错误: 未找到ndk-build，请检查NDK安装")
+        return 1
+
+    watcher = file_watch.create_watcher(WATCH_ROOTS, WATCH_FILES, WATCH_IGNORED_DIRS)
+    builder = WatchBuilder(ndk_build, abi, matrix_build.get_cpu_budget())
+    print(f"[监听] 正在监听 {', '.join(str(path) for path in WATCH_ROOTS + WATCH_FILES)} "
+          f"({type(watcher).__name__})，按Ctrl+C退出")
+
+    builder.start(time.monotonic())
+    try:
+        while True:
+            changed = watcher.wait()
+            if not changed:
+                continue
+            changed_at = time.monotonic()
+            # 合并短时间内的连续修改（例如编辑器保存多个文件、git checkout）
+            changed = file_watch.wait_for_quiet(watcher, changed, debounce_seconds)
+            names = sorted(os.path.relpath(path) for path in changed)
+            print(f"[监听] 检测到 {len(names)} 个文件变化: {', '.join(names[:5])}"
+                  + (" ..." if len(names) > 5 else ""))
+            if any(os.path.basename(path) == CONFIG_FILE for path in changed):
+                fix_rules.reload()
+                print("[监听] 已重新加载自动修复配置")
+            builder.start(changed_at, names)
+    except KeyboardInterrupt:
+        print("\n[监听] 退出")
+    finally:
+        builder.cancel()
+        watcher.close()
+    return 0
+
+
+def _env_int(name, default):
+    """读取整数类型的环境变量"""
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def main(argv=None):
     """主函数"""
+    parser = argparse.ArgumentParser(description="构建失败监控")
+    parser.add_argument('--watch', action='store_true', help="常驻运行，源码或配置变化时自动增量构建")
+    parser.add_argument('--abi', default=matrix_build.DEFAULT_ABIS[0], help="监听模式下构建的ABI")
+    parser.add_argument('--debounce-ms', type=int,
+                        default=_env_int('BUILD_WATCH_DEBOUNCE_MS', DEFAULT_DEBOUNCE_MS),
+                        help="合并连续修改的等待时间(毫秒)")
+    args = parser.parse_args(argv)
+
+    if args.watch:
+        status = watch(args.abi, args.debounce_ms / 1000)
+        compiler_cache.get_session().report()
+        build_trace.finish()
+        return status
+
     print("构建失败监控系统启动")
     
     # 运行构建并监控
     error_msg = run_build_and_monitor()
     
     if error_msg:
-        # 构建失败，启动修复流程
-        handle_build_failure(error_msg)
+        # 构建失败，与监听模式一样记录分类结果，再启动修复流程
+        run_history.record_classification(fix_rules.get_matcher().classify(error_msg))
+        success = handle_build_failure(error_msg)
     else:
         print("构建成功，无需修复")
+        success = True
+    compiler_cache.get_session().report()
+    build_trace.finish()
+    run_history.finish('monitor', success)
+    return 0
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+流式构建运行器
+逐行读取构建输出，同时输出到控制台和滚动日志文件，内存中只保留有限的尾部行用于错误分析
+"""
+
+import os
+import sys
+import re
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+import build_trace
+import diagnostics
+import run_history
+
+
+# 默认日志位置与容量，可通过环境变量覆盖
+DEFAULT_LOG_PATH = "build.log"
+DEFAULT_LOG_MAX_MB = 10
+DEFAULT_LOG_BACKUPS = 3
+DEFAULT_TAIL_LINES = 400
+
+# 判定"出现错误"的默认模式，用于统计首个错误出现的时间
+DEFAULT_ERROR_PATTERN = re.compile(
+    r'(error:|Error \d+|fatal error|No such file or directory|FAILED)'
+)
+
+
+def _env_int(name, default):
+    """读取整数类型的环境变量"""
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class RotatingLog:
+    """按大小滚动的构建日志文件"""
+
+    def __init__(self, path, max_bytes, backups):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._rotate()
+        self._file = open(self.path, 'w', encoding='utf-8')
+        self._size = 0
+
+    def _rotate(self):
+        """将现有日志依次后移为 .1 .2 ...，超出数量的删除"""
+        if not self.path.exists():
+            return
+        for index in range(self.backups, 0, -1):
+            src = self.path if index == 1 else self.path.with_name(f"{self.path.name}.{index - 1}")
+            dst = self.path.with_name(f"{self.path.name}.{index}")
+            if src.exists():
+                os.replace(src, dst)
+        if self.backups == 0:
+            self.path.unlink()
+
+    def write(self, line):
+        """写入一行，超过大小上限时滚动"""
+        data_size = len(line.encode('utf-8', errors='replace'))
+        if self.max_bytes and self._size + data_size > self.max_bytes:
+            self._file.close()
+            self._rotate()
+            self._file = open(self.path, 'w', encoding='utf-8')
+            self._size = 0
+        self._file.write(line)
+        self._size += data_size
+
+    def close(self):
+        """关闭日志文件"""
+        self._file.close()
+
+
+class StreamResult:
+    """流式构建的运行结果"""
+
+    def __init__(self, returncode, tail, elapsed, first_error_time, first_error_line, log_path,
+                 aborted_by=None, usage=None, cancelled=False, diagnostics=None):
+        self.returncode = returncode
+        self.tail = tail
+        self.elapsed = elapsed
+        self.first_error_time = first_error_time
+        self.first_error_line = first_error_line
+        self.log_path = log_path
+        # 提前终止构建的致命错误匹配结果，未提前终止时为None
+        self.aborted_by = aborted_by
+        # 构建进程的资源占用(os.wait4返回的rusage)，不支持的平台或提前终止时为None
+        self.usage = usage
+        # 是否因外部取消而终止
+        self.cancelled = cancelled
+        # 构建输出中解析出的不同诊断(diagnostics.Diagnostic)，按出现顺序排列
+        self.diagnostics = diagnostics or []
+
+    @property
+    def output(self):
+        """尾部输出文本，供错误分析使用"""
+        return ''.join(self.tail)
+
+
+def _wait_with_usage(process):
+    """等待进程结束，支持时同时返回该进程及其已回收子进程的资源占用"""
+    if not hasattr(os, 'wait4'):
+        process.wait()
+        return None
+    try:
+        _, status, usage = os.wait4(process.pid, 0)
+    except ChildProcessError:
+        process.wait()
+        return None
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return usage
+
+
+def _kill_process_tree(process, own_group, grace_seconds=5):
+    """终止构建进程；进程拥有独立进程组时连同整个进程组一起终止"""
+    if process.poll() is not None:
+        return
+    try:
+        if own_group:
+            os.killpg(process.pid, signal.SIGTERM)
+        else:
+            process.terminate()
+        process.wait(timeout=grace_seconds)
+    except subprocess.TimeoutExpired:
+        if own_group:
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+        process.wait()
+    except ProcessLookupError:
+        process.wait()
+
+
+def _watch_cancel(process, own_group, cancel, done, cancelled):
+    """等待外部取消信号，收到后向构建进程(组)发送SIGTERM；回收进程由运行构建的线程负责"""
+    while not done.is_set():
+        if cancel.wait(0.1):
+            cancelled.set()
+            try:
+                if own_group:
+                    os.killpg(process.pid, signal.SIGTERM)
+                else:
+                    process.terminate()
+            except ProcessLookupError:
+                pass
+            return
+
+
+def run_streaming(cmd, cwd=None, log_path=None, tail_lines=None, error_pattern=None, echo=True,
+                  abort_on=None, env=None, pass_fds=(), cancel=None):
+    """运行构建命令，逐行输出并写入滚动日志，返回StreamResult
+
+    abort_on为可选的回调函数，对每一行输出调用，返回非空值时立即终止整个构建进程组；
+    pass_fds为需要由子进程继承的文件描述符（例如make的jobserver管道）；
+    cancel为可选的threading.Event，被设置时终止整个构建进程组（即使构建没有输出）
+    """
+    if log_path is None:
+        log_path = os.environ.get('BUILD_LOG_PATH', DEFAULT_LOG_PATH)
+    if tail_lines is None:
+        tail_lines = _env_int('BUILD_LOG_TAIL_LINES', DEFAULT_TAIL_LINES)
+    if error_pattern is None:
+        error_pattern = DEFAULT_ERROR_PATTERN
+
+    max_bytes = _env_int('BUILD_LOG_MAX_MB', DEFAULT_LOG_MAX_MB) * 1024 * 1024
+    backups = _env_int('BUILD_LOG_BACKUPS', DEFAULT_LOG_BACKUPS)
+
+    # 需要提前终止时让构建运行在独立的进程组中，以便连同ndk-build的子进程一起终止
+    own_group = (abort_on is not None or cancel is not None) and os.name == 'posix'
+
+    start_time = time.monotonic()
+    # stderr合并到stdout，保证错误行与上下文的相对顺序
+    process = subprocess.Popen(
+        cmd,
+        cwd=cwd,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        encoding='utf-8',
+        errors='replace',
+        bufsize=1,
+        start_new_session=own_group,
+        pass_fds=pass_fds
+    )
+
+    log = RotatingLog(log_path, max_bytes, backups)
+    tail = deque(maxlen=tail_lines)
+    # 诊断在输出到达时逐行解析，不需要事后重新扫描日志
+    parser = diagnostics.DiagnosticParser()
+    first_error_time = None
+    first_error_line = None
+    aborted_by = None
+    usage = None
+    done = threading.Event()
+    cancelled = threading.Event()
+    if cancel is not None:
+        threading.Thread(target=_watch_cancel, args=(process, own_group, cancel, done, cancelled),
+                         daemon=True).start()
+
+    try:
+        for line in process.stdout:
+            if echo:
+                sys.stdout.write(line)
+                sys.stdout.flush()
+            log.write(line)
+            tail.append(line)
+            parser.feed(line)
+
+            if first_error_time is None and error_pattern.search(line):
+                first_error_time = time.monotonic() - start_time
+                first_error_line = line.rstrip('\n')
+                print(f"[构建监控] 首个错误出现于 {first_error_time:.2f}s: {first_error_line}")
+
+            if abort_on is not None:
+                aborted_by = abort_on(line)
+                if aborted_by:
+                    print(f"[构建监控] 检测到致命错误，提前终止构建: {line.rstrip()}")
+                    _kill_process_tree(process, own_group)
+                    break
+        if process.returncode is None and not cancelled.is_set():
+            usage = _wait_with_usage(process)
+    finally:
+        done.set()
+        _kill_process_tree(process, own_group)
+        log.close()
+
+    elapsed = time.monotonic() - start_time
+    build_trace.record_child(usage)
+    parser.close()
+    result = StreamResult(process.returncode, list(tail), elapsed, first_error_time, first_error_line,
+                          str(log_path), aborted_by, usage, cancelled.is_set(), list(parser.diagnostics.values()))
+    run_history.record_command(cmd, result)
+    return result
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+构建阶段计时和性能剖析
+提供可嵌套的span计时接口，记录每个阶段的墙钟时间、本进程CPU时间、子进程CPU时间和子进程峰值内存，
+运行结束时输出Chrome trace-event格式的JSON(可在chrome://tracing或Perfetto中打开)和汇总表
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import functools
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:
+    # Windows上没有resource模块，不统计子进程资源
+    resource = None
+
+
+DEFAULT_TRACE_PATH = "build-trace.json"
+
+# macOS上ru_maxrss的单位是字节，Linux上是KB
+_MAXRSS_SCALE = 1024 if sys.platform == 'darwin' else 1
+
+_origin = time.perf_counter()
+_events = []
+_events_lock = threading.Lock()
+_local = threading.local()
+
+
+def enabled():
+    """是否启用计时，BUILD_TRACE=0时关闭"""
+    return os.environ.get('BUILD_TRACE', '1') != '0'
+
+
+def get_trace_path():
+    """获取trace文件路径"""
+    return Path(os.environ.get('BUILD_TRACE_PATH', DEFAULT_TRACE_PATH))
+
+
+def _children_usage():
+    """已回收子进程的累计CPU时间(秒)和峰值内存(KB)"""
+    if resource is None:
+        return 0.0, None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime, usage.ru_maxrss // _MAXRSS_SCALE
+
+
+def _stack():
+    """当前线程正在进行的span"""
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+class Span:
+    """一个计时阶段"""
+
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.child_peak_rss_kb = None
+        self._start = time.perf_counter()
+        self._cpu_start = time.thread_time()
+        self._children_cpu_start, self._children_rss_start = _children_usage()
+
+    def record_child(self, peak_rss_kb):
+        """记录在本阶段内结束的子进程的峰值内存"""
+        if peak_rss_kb is not None:
+            self.child_peak_rss_kb = max(self.child_peak_rss_kb or 0, peak_rss_kb)
+
+    def finish(self):
+        """结束计时并生成trace事件"""
+        end = time.perf_counter()
+        children_cpu, children_rss = _children_usage()
+        # 累计峰值在本阶段内升高，说明升高的部分来自本阶段的子进程
+        if children_rss is not None and self._children_rss_start is not None \
+                and children_rss > self._children_rss_start:
+            self.record_child(children_rss)
+
+        args = dict(self.args)
+        args.update({
+            'wall_s': round(end - self._start, 6),
+            'cpu_s': round(time.thread_time() - self._cpu_start, 6),
+            'child_cpu_s': round(children_cpu - self._children_cpu_start, 6),
+            'child_peak_rss_kb': self.child_peak_rss_kb,
+        })
+        return {
+            'name': self.name,
+            'cat': self.category,
+            'ph': 'X',
+            'ts': round((self._start - _origin) * 1e6),
+            'dur': round((end - self._start) * 1e6),
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': args,
+        }
+
+
+@contextmanager
+def span(name, category='build', **args):
+    """计时一个阶段，可以嵌套；args会写入trace事件"""
+    if not enabled():
+        yield None
+        return
+    current = Span(name, category, args)
+    stack = _stack()
+    stack.append(current)
+    try:
+        yield current
+    finally:
+        stack.remove(current)
+        event = current.finish()
+        with _events_lock:
+            _events.append(event)
+
+
+def traced(name, category='build'):
+    """以span包装整个函数的装饰器"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_child(usage):
+    """记录一个子进程的峰值内存(os.wait4返回的rusage)，计入当前线程所有进行中的span
+
+    子进程的CPU时间已包含在RUSAGE_CHILDREN的增量中，这里只补充单个子进程的峰值内存
+    """
+    if usage is None:
+        return
+    peak_rss_kb = usage.ru_maxrss // _MAXRSS_SCALE
+    for current in _stack():
+        current.record_child(peak_rss_kb)
+
+
+def get_events():
+    """返回已结束的trace事件"""
+    with _events_lock:
+        return list(_events)
+
+
+def write_trace(path=None):
+    """写出Chrome trace-event格式的JSON文件，返回文件路径"""
+    path = Path(path or get_trace_path())
+    events = sorted(get_events(), key=lambda event: event['ts'])
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+    except OSError as e:
+        print(f"警告: 无法写入trace文件: {str(e)}")
+        return None
+    return path
+
+
+def summarize(events=None):
+    """按阶段名称汇总，返回按首次出现顺序排列的列表"""
+    summary = {}
+    for event in sorted(events if events is not None else get_events(), key=lambda e: e['ts']):
+        args = event['args']
+        row = summary.setdefault(event['name'], {
+            'name': event['name'],
+            'count': 0,
+            'wall_s': 0.0,
+            'cpu_s': 0.0,
+            'child_cpu_s': 0.0,
+            'child_peak_rss_kb': None,
+        })
+        row['count'] += 1
+        row['wall_s'] += args['wall_s']
+        row['cpu_s'] += args['cpu_s']
+        row['child_cpu_s'] += args['child_cpu_s']
+        if args['child_peak_rss_kb'] is not None:
+            row['child_peak_rss_kb'] = max(row['child_peak_rss_kb'] or 0, args['child_peak_rss_kb'])
+    return list(summary.values())
+
+
+def print_summary(events=None):
+    """打印各阶段的耗时汇总表"""
+    rows = summarize(events)
+    if not rows:
+        return
+    print("\n阶段耗时:")
+    print(f"  {'阶段':<28} {'次数':>4} {'墙钟':>9} {'CPU':>9} {'子进程CPU':>10} {'子进程峰值内存':>12}")
+    for row in rows:
+        rss = f"{row['child_peak_rss_kb'] / 1024:.0f}MB" if row['child_peak_rss_kb'] else "-"
+        print(f"  {row['name']:<28} {row['count']:>4} {row['wall_s']:>8.2f}s {row['cpu_s']:>8.2f}s "
+              f"{row['child_cpu_s']:>9.2f}s {rss:>12}")
+
+
+def finish():
+    """运行结束时写出trace文件并打印汇总表"""
+    if not enabled() or not get_events():
+        return None
+    path = write_trace()
+    print_summary()
+    if path is not None:
+        print(f"  trace: {path}")
+    return path
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+构建并行度自动调优
+根据可用CPU核心、可用内存、cgroup的CPU/内存限制和历史上单个编译单元的峰值内存决定CMake和ndk-build的并行任务数，
+每次独占机器的构建结束后记录墙钟时间和是否被OOM终止，按机器类型逐步收敛到不会OOM的最快并行度
+"""
+
+import os
+import sys
+import json
+import math
+import argparse
+import platform
+from pathlib import Path
+
+import file_lock
+
+
+# 调优记录文件
+DEFAULT_STATE_PATH = Path.home() / ".cache" / "hyperos_sf_bypass" / "build_tuning.json"
+
+# 构建类型: cmake为Dobby的CMake构建，ndk-build为模块本身的构建
+KINDS = ('cmake', 'ndk-build')
+
+# 各构建类型的手动设置，设置后不再自动选择
+OVERRIDE_ENV = {
+    'cmake': 'DOBBY_BUILD_JOBS',
+    'ndk-build': 'BUILD_CPU_BUDGET',
+}
+
+# 还没有峰值内存记录时假设每个编译单元占用的内存(MB)
+DEFAULT_UNIT_RSS_MB = 1024
+# 按峰值内存估算并行度时的放大系数，为同时运行的其他进程留出余量
+RSS_MARGIN = 1.25
+# 给系统和其他进程保留的内存(MB)
+MEMORY_RESERVE_MB = 512
+# 子进程CPU时间少于该值(秒)的构建(例如无变化的增量构建)不用于比较耗时
+MIN_CPU_SECONDS = 5.0
+# 墙钟时间的平滑系数
+EMA_ALPHA = 0.3
+# 峰值内存记录每次构建后的衰减比例，避免一次异常的峰值永久压低并行度
+RSS_DECAY = 0.9
+
+# 被OOM终止的退出码: SIGKILL，以及shell报告的 128 + 9
+OOM_RETURNCODES = (-9, 137)
+# 编译器或内核在内存不足时的输出
+OOM_MARKERS = (
+    'out of memory',
+    'cannot allocate memory',
+    'killed signal terminated program',
+    'unable to execute command: killed',
+    'virtual memory exhausted',
+)
+
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+
+# macOS上ru_maxrss的单位是字节，Linux上是KB
+_MAXRSS_SCALE = 1024 if sys.platform == 'darwin' else 1
+
+
+def get_state_path():
+    """获取调优记录文件路径"""
+    return Path(os.environ.get('BUILD_TUNING_PATH', DEFAULT_STATE_PATH))
+
+
+def enabled():
+    """是否启用自动调优，BUILD_AUTOTUNE=0时关闭"""
+    return os.environ.get('BUILD_AUTOTUNE', '1') != '0'
+
+
+def _read(path):
+    """读取一个小文件的内容，不存在时返回None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _cgroup_cpu_limit():
+    """cgroup的CPU配额折合的核心数，没有限制时返回None"""
+    # cgroup v2: "<quota> <period>" 或 "max <period>"
+    value = _read(CGROUP_ROOT / "cpu.max")
+    if value:
+        quota, _, period = value.partition(' ')
+        if quota != 'max' and period:
+            return max(1, math.ceil(int(quota) / int(period)))
+        return None
+    # cgroup v1
+    quota = _read(CGROUP_ROOT / "cpu" / "cpu.cfs_quota_us")
+    period = _read(CGROUP_ROOT / "cpu" / "cpu.cfs_period_us")
+    if quota and period and int(quota) > 0:
+        return max(1, math.ceil(int(quota) / int(period)))
+    return None
+
+
+def _cgroup_memory():
+    """cgroup的内存限制和当前用量(字节)，没有限制时返回(None, None)"""
+    for limit_file, usage_file in (("memory.max", "memory.current"),
+                                   ("memory/memory.limit_in_bytes", "memory/memory.usage_in_bytes")):
+        limit = _read(CGROUP_ROOT / limit_file)
+        if limit is None:
+            continue
+        # cgroup v1没有限制时是一个接近2^63的值
+        if limit == 'max' or int(limit) >= 1 << 60:
+            return None, None
+        usage = _read(CGROUP_ROOT / usage_file)
+        return int(limit), int(usage) if usage else 0
+    return None, None
+
+
+def _meminfo():
+    """/proc/meminfo中的总内存和可用内存(字节)，不支持的平台返回(None, None)"""
+    fields = {}
+    try:
+        with open('/proc/meminfo', 'r', encoding='utf-8') as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                if name in ('MemTotal', 'MemAvailable'):
+                    fields[name] = int(value.split()[0]) * 1024
+    except (OSError, ValueError):
+        return None, None
+    return fields.get('MemTotal'), fields.get('MemAvailable')
+
+
+class Resources:
+    """本机当前可用于构建的资源"""
+
+    def __init__(self, cpus, memory_total, memory_available):
+        self.cpus = cpus
+        # 字节，无法检测时为None
+        self.memory_total = memory_total
+        self.memory_available = memory_available
+
+    @property
+    def machine_class(self):
+        """机器类型: 架构、核心数和内存容量相同的机器共用调优记录"""
+        memory = f"{round(self.memory_total / (1 << 30))}g" if self.memory_total else "unknown"
+        return f"{platform.machine() or 'unknown'}-{self.cpus}c-{memory}"
+
+    def to_dict(self):
+        """转换为可序列化的字典"""
+        return {
+            'cpus': self.cpus,
+            'memory_total': self.memory_total,
+            'memory_available': self.memory_available,
+            'machine_class': self.machine_class,
+        }
+
+
+def detect_resources():
+    """检测CPU核心数和内存，两者都取进程亲和性/系统总量与cgroup限制中较小的一个"""
+    if hasattr(os, 'sched_getaffinity'):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    try:
+        cgroup_cpus = _cgroup_cpu_limit()
+    except ValueError:
+        cgroup_cpus = None
+    if cgroup_cpus:
+        cpus = min(cpus, cgroup_cpus)
+
+    total, available = _meminfo()
+    try:
+        limit, usage = _cgroup_memory()
+    except ValueError:
+        limit, usage = None, None
+    if limit is not None:
+        total = min(total, limit) if total else limit
+        available = min(available, limit - usage) if available else limit - usage
+    return Resources(max(1, cpus), total, max(0, available) if available is not None else None)
+
+
+def _load_state():
+    """读取调优记录"""
+    try:
+        with open(get_state_path(), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(state):
+    """保存调优记录"""
+    state_path = get_state_path()
+    try:
+        state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = state_path.with_name(f"{state_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, state_path)
+    except OSError as e:
+        print(f"警告: 无法写入构建并行度调优记录: {str(e)}")
+
+
+def _entry(state, machine_class, kind):
+    """某类机器上某种构建的记录: {'peak_rss_kb', 'trials': {并行度: {'runs', 'seconds', 'oom'}}}"""
+    return state.setdefault(machine_class, {}).setdefault(kind, {'peak_rss_kb': None, 'trials': {}})
+
+
+def _override(kind):
+    """手动设置的并行度，未设置时返回None"""
+    try:
+        jobs = int(os.environ.get(OVERRIDE_ENV[kind], 0))
+    except ValueError:
+        jobs = 0
+    return jobs if jobs > 0 else None
+
+
+def ceiling(resources, entry):
+    """资源允许的最大并行度: 不超过核心数、可用内存能容纳的编译单元数，且低于曾经OOM的并行度"""
+    limit = resources.cpus
+    if resources.memory_available is not None:
+        unit_mb = (entry['peak_rss_kb'] / 1024) if entry['peak_rss_kb'] else DEFAULT_UNIT_RSS_MB
+        usable_mb = resources.memory_available / (1 << 20) - MEMORY_RESERVE_MB
+        limit = min(limit, int(usable_mb // (unit_mb * RSS_MARGIN)))
+    oom = [int(jobs) for jobs, trial in entry['trials'].items() if trial['oom']]
+    if oom:
+        limit = min(limit, min(oom) - 1)
+    return max(1, limit)
+
+
+def suggest(resources, entry):
+    """在资源上限内选择并行度，返回(并行度, 原因)
+
+    没有可比较的记录时使用上限；否则取平均墙钟时间最短的并行度，先试两侧相距1/4的并行度，
+    再把步长逐次减半到1，所有相邻的并行度都试过且都不更快即为收敛
+    """
+    top = ceiling(resources, entry)
+    measured = {int(jobs): trial for jobs, trial in entry['trials'].items()
+                if not trial['oom'] and trial.get('seconds') is not None and int(jobs) <= top}
+    if not measured:
+        return top, "资源上限"
+    best = min(measured, key=lambda jobs: measured[jobs]['seconds'])
+    step = max(1, best // 4)
+    while step >= 1:
+        for candidate in (best + step, best - step):
+            if 1 <= candidate <= top and candidate not in measured:
+                return candidate, f"尝试 (当前最快 {best})"
+        step //= 2
+    return best, "已收敛"
+
+
+def choose_jobs(kind, verbose=False):
+    """决定一次构建的并行任务数"""
+    jobs = _override(kind)
+    if jobs is not None:
+        return jobs
+    resources = detect_resources()
+    if not enabled():
+        # 与自动调优的上限一样遵守进程亲和性和cgroup的CPU配额
+        return resources.cpus
+    entry = _entry(_load_state(), resources.machine_class, kind)
+    jobs, reason = suggest(resources, entry)
+    if verbose:
+        print(f"[并行度] {kind}: {jobs} ({reason}，{resources.machine_class})")
+    return jobs
+
+
+def is_oom(result):
+    """构建是否因内存不足而终止"""
+    if result.returncode in OOM_RETURNCODES:
+        return True
+    if result.returncode == 0:
+        return False
+    output = result.output.lower()
+    return any(marker in output for marker in OOM_MARKERS)
+
+
+def record(kind, jobs, result):
+    """记录一次独占机器的构建的结果(build_runner.StreamResult)"""
+    if not enabled() or result.cancelled or result.aborted_by is not None:
+        return
+    oom = is_oom(result)
+    usage = result.usage
+    cpu_seconds = (usage.ru_utime + usage.ru_stime) if usage is not None else 0.0
+    # 失败的构建编译的单元不完整，只有OOM有参考价值
+    if result.returncode != 0 and not oom:
+        return
+
+    resources = detect_resources()
+    # 读-改-写期间持锁，同时结束的构建不会覆盖彼此的记录
+    with file_lock.locked(get_state_path()):
+        state = _load_state()
+        entry = _entry(state, resources.machine_class, kind)
+        if usage is not None and usage.ru_maxrss:
+            # os.wait4返回的峰值内存是进程树中最大的单个进程，即最大的编译单元
+            peak_kb = usage.ru_maxrss // _MAXRSS_SCALE
+            previous = entry['peak_rss_kb'] or 0
+            entry['peak_rss_kb'] = max(peak_kb, int(previous * RSS_DECAY))
+
+        trial = entry['trials'].setdefault(str(jobs), {'runs': 0, 'seconds': None, 'oom': False})
+        trial['runs'] += 1
+        if oom:
+            trial['oom'] = True
+            print(f"[并行度] {kind} 在 {jobs} 个并行任务时内存不足，之后使用更低的并行度")
+        elif cpu_seconds >= MIN_CPU_SECONDS:
+            # 按墙钟时间比较并行度；CPU时间很少的构建(例如无变化的增量构建)不代表该并行度的速度
+            previous = trial.get('seconds')
+            trial['seconds'] = result.elapsed if previous is None else \
+                EMA_ALPHA * result.elapsed + (1 - EMA_ALPHA) * previous
+        _save_state(state)
+
+
+def build_env(jobs, base=None):
+    """build.sh的环境变量，通过NDK_BUILD_JOBS传入ndk-build的并行任务数"""
+    env = dict(os.environ if base is None else base)
+    env['NDK_BUILD_JOBS'] = str(jobs)
+    return env
+
+
+def _format_memory(value):
+    """格式化内存大小"""
+    return f"{value / (1 << 30):.1f}GB" if value is not None else "未知"
+
+
+def print_status(resources, state):
+    """打印本机资源、调优记录和下一次构建会使用的并行度"""
+    print(f"机器类型: {resources.machine_class}")
+    print(f"  可用CPU {resources.cpus}，内存 {_format_memory(resources.memory_total)}，"
+          f"可用内存 {_format_memory(resources.memory_available)}")
+    for kind in KINDS:
+        entry = _entry(state, resources.machine_class, kind)
+        override = _override(kind)
+        jobs, reason = suggest(resources, entry)
+        if override is not None:
+            jobs, reason = override, f"由 {OVERRIDE_ENV[kind]} 指定"
+        elif not enabled():
+            jobs, reason = resources.cpus, "自动调优已关闭"
+        peak = f"{entry['peak_rss_kb'] / 1024:.0f}MB" if entry['peak_rss_kb'] else "未知"
+        print(f"\n{kind}: 下次使用 {jobs} 个并行任务 ({reason})，资源上限 {ceiling(resources, entry)}，"
+              f"单个编译单元峰值内存 {peak}")
+        for key in sorted(entry['trials'], key=int):
+            trial = entry['trials'][key]
+            if trial['oom']:
+                result = "内存不足"
+            elif trial.get('seconds') is None:
+                result = "无可比较的构建"
+            else:
+                result = f"平均墙钟 {trial['seconds']:.1f}s"
+            print(f"  -j{key:<4} {trial['runs']:>3} 次  {result}")
+
+
+def main(argv=None):
+    """命令行入口: 查看调优状态或输出并行度"""
+    parser = argparse.ArgumentParser(description="构建并行度自动调优")
+    parser.add_argument('--jobs', choices=KINDS, help="只输出该构建类型下次使用的并行任务数，供shell脚本使用")
+    parser.add_argument('--reset', action='store_true', help="清除本机类型的调优记录")
+    args = parser.parse_args(argv)
+
+    if args.jobs:
+        print(choose_jobs(args.jobs))
+        return 0
+
+    resources = detect_resources()
+    if args.reset:
+        with file_lock.locked(get_state_path()):
+            state = _load_state()
+            state.pop(resources.machine_class, None)
+            _save_state(state)
+        print(f"已清除 {resources.machine_class} 的调优记录")
+        return 0
+    print_status(resources, _load_state())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
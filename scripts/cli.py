@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+统一的命令行入口
+python -m scripts <子命令> [参数]，子命令对应的模块在分派时才导入，入口本身只依赖sys和importlib；
+常用的build路径的冷启动耗时由 python -m scripts bench startup 按预算检查
+"""
+
+import sys
+import importlib
+
+
+PROG = "python -m scripts"
+
+# 子命令: (说明, 模块, 入口函数, 固定参数)
+COMMANDS = {
+    'preflight': ("检查构建环境 (--json, --no-cache)", 'preflight', 'main', []),
+    'build': ("并行构建一个或多个ABI (--abis, --jobs)", 'matrix_build', 'main', []),
+    'fix': ("构建项目，失败时自动分析并修复", 'auto_fix_on_build_failure', 'main', []),
+    'watch': ("监听源码和配置的变化并增量构建 (--abi, --debounce-ms)", 'build_monitor', 'main', ['--watch']),
+    'analyze': ("分析已有的构建日志 (<log>, --no-ai)", 'auto_fix_on_build_failure', 'analyze_main', []),
+    'package': ("打包Magisk模块zip，只重新压缩变化的条目 (--abis, --output)", 'package_module', 'main', []),
+    'batch': ("按错误指纹聚类并批量分析日志目录 (<dir>, --concurrency, --rate)", 'batch_analysis', 'main', []),
+    'whitelist': ("校验白名单并编译为二进制表 (--check, --fix)", 'whitelist_table', 'main', []),
+    'history': ("查询运行历史 (--last, --top, --json)", 'run_history', 'main', []),
+    'similar': ("查找相似的历史失败及其修复方法 (<log>, --add, --top)", 'failure_index', 'main', []),
+    'tune': ("查看构建并行度的自动调优状态 (--jobs, --reset)", 'build_tuning', 'main', []),
+    'reduce': ("缩减构建日志，只保留不同的错误块 (<log>, --max-blocks, --max-bytes)", 'log_reducer', 'main', []),
+    'profile': ("以-ftime-trace编译并输出编译耗时报告 (--abi, --include-dobby)", 'compile_profile', 'main', []),
+    'dobby': ("获取、检出、导出或导入固定版本的Dobby源码 (fetch, checkout, export, import)",
+              'dobby_source', 'main', []),
+    'bench': ("运行基准测试 (rules, startup, pipeline, whitelist)", None, None, []),
+}
+
+# bench 的子命令
+BENCHMARKS = {
+    'rules': ("修复规则匹配器吞吐量 (--size-mb)", 'bench_fix_rules', 'main', []),
+    'startup': ("命令行冷启动耗时 (--command, --runs)", 'bench_startup', 'main', []),
+    'pipeline': ("构建修复流程各阶段的耗时和内存 (--update-baseline)", 'bench_pipeline', 'main', []),
+    'whitelist': ("白名单文本与二进制表的加载和查找耗时 (--entries)", 'bench_whitelist', 'main', []),
+}
+
+NESTED = {
+    'bench': BENCHMARKS,
+}
+
+
+def print_usage(table, prog):
+    """打印子命令列表"""
+    print(f"用法: {prog} <子命令> [参数]\n")
+    print("子命令:")
+    for name, (description, _, _, _) in table.items():
+        print(f"  {name:<10} {description}")
+    print(f"\n查看子命令的参数: {prog} <子命令> --help")
+
+
+def dispatch(table, argv, prog):
+    """按第一个参数分派子命令，只导入被选中子命令的模块"""
+    if not argv or argv[0] in ('-h', '--help'):
+        print_usage(table, prog)
+        return 0 if argv else 2
+
+    name = argv[0]
+    if name not in table:
+        print(f"未知的子命令: {name}\n")
+        print_usage(table, prog)
+        return 2
+    if name in NESTED:
+        return dispatch(NESTED[name], argv[1:], f"{prog} {name}")
+
+    _, module_name, func_name, fixed_args = table[name]
+    # 子命令的argparse以sys.argv[0]作为帮助信息中的程序名
+    sys.argv[0] = f"{prog} {name}"
+    module = importlib.import_module(module_name)
+    return getattr(module, func_name)(fixed_args + argv[1:])
+
+
+def main(argv=None):
+    """命令行入口"""
+    return dispatch(COMMANDS, sys.argv[1:] if argv is None else argv, PROG)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
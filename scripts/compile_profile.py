@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+按编译单元统计编译耗时
+在独立的输出目录中以 V=1 和 -ftime-trace 完整运行一次ndk-build（可选同时编译Dobby），
+收集clang为每个编译单元生成的time-trace JSON，按前端/后端耗时汇总编译单元、头文件和模板实例化，
+写出排序后的报告，用于找出拖慢每次重试的编译单元
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+from collections import defaultdict
+from pathlib import Path
+
+import build_runner
+import build_trace
+import dobby_build
+import dobby_source
+import matrix_build
+import preflight
+
+
+PROFILE_DIR = matrix_build.JNI_DIR / "build-profile"
+
+# clang time-trace的最小记录粒度(微秒)，越小越详细，文件也越大
+DEFAULT_GRANULARITY_US = 500
+DEFAULT_TOP = 15
+
+# 模板实例化事件
+TEMPLATE_EVENTS = {'InstantiateClass', 'InstantiateFunction'}
+
+
+def _env_int(name, default):
+    """读取整数类型的环境变量"""
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def time_trace_flags():
+    """clang的time-trace编译参数"""
+    granularity = _env_int('BUILD_TIME_TRACE_GRANULARITY', DEFAULT_GRANULARITY_US)
+    return f"-ftime-trace -ftime-trace-granularity={granularity}"
+
+
+def run_profiled_ndk_build(abi, ndk_build, out_dir, jobs):
+    """在全新的输出目录中完整编译一次，返回StreamResult"""
+    shutil.rmtree(out_dir, ignore_errors=True)
+    cmd = [
+        ndk_build,
+        'V=1',
+        f'APP_ABI={abi}',
+        f'NDK_OUT={out_dir / "obj"}',
+        f'NDK_LIBS_OUT={out_dir / "libs"}',
+        f'LSF_EXTRA_CFLAGS={time_trace_flags()}',
+        f'-j{jobs}',
+    ]
+    with build_trace.span('profile.ndk-build', abi=abi):
+        return build_runner.run_streaming(cmd, cwd=matrix_build.JNI_DIR,
+                                          log_path=out_dir / "ndk-build.log", echo=False)
+
+
+def run_profiled_dobby_build(abi, ndk_path, jobs):
+    """在单独的构建目录中完整编译一次Dobby，返回构建目录，失败时返回None"""
+    src_dir = matrix_build.DOBBY_SRC_DIR
+    build_type = dobby_build.get_build_type()
+    base_dir = dobby_build.build_dir_for(src_dir, abi, dobby_build.DEFAULT_API_LEVEL, build_type)
+    build_dir = base_dir.with_name(base_dir.name + "-timetrace")
+    shutil.rmtree(build_dir, ignore_errors=True)
+
+    flags = dobby_build.cmake_flags(abi, dobby_build.DEFAULT_API_LEVEL, build_type) + [
+        f'-DCMAKE_C_FLAGS={time_trace_flags()}',
+        f'-DCMAKE_CXX_FLAGS={time_trace_flags()}',
+    ]
+    with build_trace.span('profile.dobby', abi=abi):
+        if not dobby_build.configure(src_dir, build_dir, ndk_path, flags, dobby_build.select_generator(),
+                                     echo=False):
+            return None
+        if not dobby_build.build(build_dir, jobs, echo=False):
+            return None
+    return build_dir
+
+
+def find_trace_files(root):
+    """查找clang生成的time-trace文件（与目标文件同名的.json）"""
+    root = Path(root)
+    traces = []
+    for path in sorted(root.rglob('*.json')):
+        if path.name in ('compile_commands.json', dobby_build.CONFIGURE_STAMP):
+            continue
+        traces.append(path)
+    return traces
+
+
+def load_trace(path):
+    """读取time-trace事件列表，不是time-trace文件时返回None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get('traceEvents'), list):
+        return None
+    return data['traceEvents']
+
+
+def template_family(detail):
+    """模板实例化按模板名归并，去掉模板参数"""
+    return detail.split('<', 1)[0].strip() or detail
+
+
+def analyze_trace(events):
+    """汇总单个编译单元的事件，耗时单位为微秒"""
+    result = {
+        'total': 0,
+        'frontend': 0,
+        'backend': 0,
+        'headers': defaultdict(int),
+        'templates': defaultdict(int),
+    }
+    for event in events:
+        if event.get('ph') != 'X':
+            continue
+        name = event.get('name')
+        dur = event.get('dur', 0)
+        detail = (event.get('args') or {}).get('detail', '')
+        if name == 'Total ExecuteCompiler':
+            result['total'] = dur
+        elif name == 'Total Frontend':
+            result['frontend'] = dur
+        elif name == 'Total Backend':
+            result['backend'] = dur
+        elif name == 'Source' and detail:
+            result['headers'][detail] += dur
+        elif name in TEMPLATE_EVENTS and detail:
+            result['templates'][template_family(detail)] += dur
+    if not result['total']:
+        result['total'] = result['frontend'] + result['backend']
+    return result
+
+
+def aggregate(trace_roots):
+    """汇总所有编译单元，返回报告数据"""
+    units = []
+    headers = defaultdict(lambda: {'time': 0, 'units': 0})
+    templates = defaultdict(lambda: {'time': 0, 'units': 0})
+
+    for label, root in trace_roots:
+        for path in find_trace_files(root):
+            events = load_trace(path)
+            if events is None:
+                continue
+            unit = analyze_trace(events)
+            name = path.relative_to(root).as_posix()[:-len('.json')]
+            units.append({
+                'name': f"{label}/{name}",
+                'total': unit['total'],
+                'frontend': unit['frontend'],
+                'backend': unit['backend'],
+            })
+            for header, dur in unit['headers'].items():
+                headers[header]['time'] += dur
+                headers[header]['units'] += 1
+            for template, dur in unit['templates'].items():
+                templates[template]['time'] += dur
+                templates[template]['units'] += 1
+
+    def ranked(table):
+        return sorted(({'name': name, **stats} for name, stats in table.items()),
+                      key=lambda row: row['time'], reverse=True)
+
+    return {
+        'units': sorted(units, key=lambda unit: unit['total'], reverse=True),
+        'headers': ranked(headers),
+        'templates': ranked(templates),
+    }
+
+
+def format_report(report, top=DEFAULT_TOP):
+    """生成文本报告"""
+    units = report['units']
+    total = sum(unit['total'] for unit in units)
+    lines = [f"编译耗时报告: {len(units)} 个编译单元，合计 {total / 1e6:.2f}s", ""]
+
+    lines.append("编译单元（按总耗时）:")
+    for unit in units[:top]:
+        lines.append(f"  {unit['total'] / 1e6:8.2f}s  前端 {unit['frontend'] / 1e6:7.2f}s  "
+                     f"后端 {unit['backend'] / 1e6:7.2f}s  {unit['name']}")
+
+    lines += ["", "头文件（按累计解析耗时，含其嵌套包含）:"]
+    for row in report['headers'][:top]:
+        lines.append(f"  {row['time'] / 1e6:8.2f}s  {row['units']:>3} 个编译单元  {row['name']}")
+
+    lines += ["", "模板实例化（按模板归并的累计耗时）:"]
+    for row in report['templates'][:top]:
+        lines.append(f"  {row['time'] / 1e6:8.2f}s  {row['units']:>3} 个编译单元  {row['name']}")
+    return '\n'.join(lines) + '\n'
+
+
+def write_report(report, out_dir, top=DEFAULT_TOP):
+    """写出文本报告和JSON数据，返回文本报告路径"""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    text_path = out_dir / "compile-time-report.txt"
+    text_path.write_text(format_report(report, top), encoding='utf-8')
+    with open(out_dir / "compile-time-report.json", 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    return text_path
+
+
+def main(argv=None):
+    """命令行入口: 以-ftime-trace完整编译一次并输出编译耗时报告"""
+    parser = argparse.ArgumentParser(description="按编译单元统计编译耗时")
+    parser.add_argument('--abi', default=dobby_build.DEFAULT_ABI, help="要分析的ABI")
+    parser.add_argument('--include-dobby', action='store_true', help="同时分析Dobby源码的编译耗时")
+    parser.add_argument('--jobs', type=int, default=None, help="并行编译任务数")
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP, help="每个类别显示的条目数")
+    parser.add_argument('--report-only', action='store_true', help="不重新编译，只汇总已有的time-trace文件")
+    args = parser.parse_args(argv)
+
+    out_dir = PROFILE_DIR / args.abi
+    jobs = args.jobs or matrix_build.get_cpu_budget()
+    ndk_path = preflight.run_preflight().ndk_path
+    trace_roots = [('jni', out_dir / "obj")]
+
+    if not args.report_only:
+        ndk_build = matrix_build.find_ndk_build(ndk_path)
+        if ndk_build is None:
+            print("错误: 未找到ndk-build，请检查NDK安装")
+            return 1
+        print(f"以 -ftime-trace 编译 {args.abi}...")
+        result = run_profiled_ndk_build(args.abi, ndk_build, out_dir.resolve(), jobs)
+        if result.returncode != 0:
+            print(f"ndk-build失败，日志: {result.log_path}")
+            return 1
+
+    if args.include_dobby:
+        if args.report_only:
+            base_dir = dobby_build.build_dir_for(matrix_build.DOBBY_SRC_DIR, args.abi,
+                                                 dobby_build.DEFAULT_API_LEVEL, dobby_build.get_build_type())
+            dobby_dir = base_dir.with_name(base_dir.name + "-timetrace")
+        elif not dobby_source.materialize(matrix_build.DOBBY_SRC_DIR):
+            return 1
+        else:
+            print("以 -ftime-trace 编译Dobby...")
+            dobby_dir = run_profiled_dobby_build(args.abi, ndk_path, jobs)
+            if dobby_dir is None:
+                return 1
+        trace_roots.append(('Dobby', dobby_dir))
+
+    report = aggregate(trace_roots)
+    if not report['units']:
+        print("未找到time-trace文件，请确认NDK的clang版本不低于9")
+        return 1
+    text_path = write_report(report, out_dir, args.top)
+    sys.stdout.write(format_report(report, args.top))
+    print(f"\n报告已写入: {text_path}")
+    build_trace.finish()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
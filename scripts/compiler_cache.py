@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+ndk-build的编译器缓存
+检测本地的ccache或sccache，通过NDK_CCACHE让ndk-build的clang经由缓存编译，
+源码未变化的重试只需从缓存取回目标文件；每次运行结束时报告命中率和节省的时间
+"""
+
+import os
+import json
+import subprocess
+from pathlib import Path
+
+import preflight
+
+
+# 支持的缓存工具，auto时按此顺序选择
+CACHE_TOOLS = ['ccache', 'sccache']
+
+# 记录每个未命中编译单元平均耗时的文件，用于估算节省的时间
+DEFAULT_STATE_PATH = Path.home() / ".cache" / "hyperos_sf_bypass" / "compiler_cache.json"
+
+# 平均耗时的平滑系数
+EMA_ALPHA = 0.3
+
+STATS_TIMEOUT = 10
+
+_session = None
+
+
+def get_state_path():
+    """获取耗时记录文件路径"""
+    return Path(os.environ.get('COMPILER_CACHE_STATE', DEFAULT_STATE_PATH))
+
+
+def detect():
+    """按COMPILER_CACHE选择缓存工具，返回(名称, 路径)，不可用或已禁用时返回None"""
+    choice = os.environ.get('COMPILER_CACHE', 'auto').strip().lower()
+    if choice in ('', '0', 'none', 'off'):
+        return None
+
+    report = preflight.run_preflight()
+    candidates = CACHE_TOOLS if choice == 'auto' else [choice]
+    for name in candidates:
+        if name in CACHE_TOOLS and report.has_tool(name):
+            return name, report.tools[name].path
+    if choice != 'auto':
+        print(f"警告: 未找到编译器缓存工具 {choice}，本次构建不使用编译器缓存")
+    return None
+
+
+def build_env(cache, base=None):
+    """返回启用编译器缓存的环境变量"""
+    env = dict(os.environ if base is None else base)
+    if cache is None:
+        return env
+    name, path = cache
+    env['NDK_CCACHE'] = path
+    if name == 'ccache':
+        # 以仓库根目录为基准改写绝对路径，NDK或工作区位置变化时仍能命中
+        env.setdefault('CCACHE_BASEDIR', str(Path.cwd()))
+    return env
+
+
+def _run_stats(cmd):
+    """运行统计命令，失败时返回None"""
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=STATS_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if result.returncode != 0:
+        return None
+    return result.stdout
+
+
+def read_stats(cache):
+    """读取缓存工具的累计统计，返回{'hits', 'misses'}，无法读取时返回None"""
+    if cache is None:
+        return None
+    name, path = cache
+
+    if name == 'ccache':
+        output = _run_stats([path, '--print-stats'])
+        if output is None:
+            return None
+        counters = {}
+        for line in output.splitlines():
+            key, _, value = line.partition('\t')
+            if value.strip().isdigit():
+                counters[key.strip()] = int(value)
+        return {
+            'hits': counters.get('direct_cache_hit', 0) + counters.get('preprocessed_cache_hit', 0),
+            'misses': counters.get('cache_miss', 0),
+        }
+
+    output = _run_stats([path, '--show-stats', '--stats-format', 'json'])
+    if output is None:
+        return None
+    try:
+        stats = json.loads(output)['stats']
+        return {
+            'hits': sum(stats['cache_hits']['counts'].values()),
+            'misses': sum(stats['cache_misses']['counts'].values()),
+        }
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+def _stats_delta(before, after):
+    """两次统计之间的增量"""
+    if before is None or after is None:
+        return None
+    return {key: max(0, after[key] - before[key]) for key in ('hits', 'misses')}
+
+
+def _load_state():
+    """读取耗时记录"""
+    try:
+        with open(get_state_path(), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(state):
+    """保存耗时记录"""
+    state_path = get_state_path()
+    try:
+        state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = state_path.with_name(f"{state_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, state_path)
+    except OSError as e:
+        print(f"警告: 无法写入编译器缓存记录: {str(e)}")
+
+
+class CacheSession:
+    """一次运行中编译器缓存的使用情况"""
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.builds = 0
+        self.start_stats = read_stats(cache)
+        self._last_stats = self.start_stats
+        self._state = _load_state() if cache is not None else {}
+
+    @property
+    def enabled(self):
+        """是否启用了编译器缓存"""
+        return self.cache is not None
+
+    def env(self, base=None):
+        """构建命令使用的环境变量"""
+        return build_env(self.cache, base)
+
+    def estimate_saved(self, hits):
+        """按历史上每个未命中编译单元的平均耗时估算节省的秒数，没有历史时返回None"""
+        per_miss = self._state.get('seconds_per_miss')
+        if per_miss is None:
+            return None
+        return hits * per_miss
+
+    def record_build(self, elapsed, update_estimate=True):
+        """记录一次构建，更新平均耗时并打印本次的命中情况"""
+        if not self.enabled:
+            return None
+        self.builds += 1
+        stats = read_stats(self.cache)
+        delta = _stats_delta(self._last_stats, stats)
+        self._last_stats = stats
+        if delta is None:
+            return None
+
+        # 命中的编译单元耗时可以忽略，构建时间近似全部花在未命中的编译单元上
+        if update_estimate and delta['misses'] > 0:
+            per_miss = elapsed / delta['misses']
+            previous = self._state.get('seconds_per_miss')
+            if previous is not None:
+                per_miss = EMA_ALPHA * per_miss + (1 - EMA_ALPHA) * previous
+            self._state['seconds_per_miss'] = per_miss
+            _save_state(self._state)
+
+        print(f"[编译器缓存] 本次构建 {_format_stats(delta, self.estimate_saved(delta['hits']))}")
+        return delta
+
+    def report(self):
+        """打印本次运行的累计命中率和节省的时间"""
+        if not self.enabled:
+            print("[编译器缓存] 未启用 (未找到ccache/sccache或COMPILER_CACHE=none)")
+            return None
+        total = _stats_delta(self.start_stats, read_stats(self.cache))
+        if total is None:
+            print(f"[编译器缓存] {self.cache[0]}: 无法读取统计")
+            return None
+        print(f"[编译器缓存] {self.cache[0]}，{self.builds} 次构建: "
+              f"{_format_stats(total, self.estimate_saved(total['hits']))}")
+        return total
+
+
+def _format_stats(delta, saved):
+    """格式化命中统计"""
+    lookups = delta['hits'] + delta['misses']
+    rate = f"{delta['hits'] / lookups:.0%}" if lookups else "-"
+    text = f"命中 {delta['hits']} / 未命中 {delta['misses']} (命中率 {rate})"
+    if saved is not None:
+        text += f"，约节省 {saved:.1f}s"
+    return text
+
+
+def get_session():
+    """获取当前进程共享的编译器缓存会话"""
+    global _session
+    if _session is None:
+        _session = CacheSession(detect())
+    return _session
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+clang / ld / ndk-build 诊断信息的流式解析
+逐行把构建输出解析为结构化的诊断记录(文件、行、列、级别、消息、头文件包含链、附带的note和出错的编译命令)，
+相同的诊断只保留一条并计数，内存占用与不同诊断的数量成正比，与日志大小无关
+"""
+
+import re
+import sys
+import json
+import argparse
+
+
+# 保留的不同诊断数量上限，超出后只计数
+DEFAULT_MAX_DIAGNOSTICS = 500
+# 每条错误之后保留的上下文行数(note、出错的源码行和^标记行)
+DEFAULT_CONTEXT_LINES = 8
+# 单行的最大长度，过长的编译命令只保留开头
+MAX_LINE_LENGTH = 600
+
+# 编译/链接命令行，以及ndk-build的进度行
+COMMAND_RE = re.compile(
+    r'(\bclang(?:\+\+)?\b.*\s-c\s'
+    r'|\]\s+(?:Compile\+*|SharedLibrary|StaticLibrary|Executable)\s*:'
+    r'|\bld(?:\.lld)?\b.*\s-o\s)'
+)
+
+# file:line[:column]: severity: message
+CLANG_RE = re.compile(
+    r'^(?P<file>(?:[A-Za-z]:)?[^:\s][^:]*?):(?P<line>\d+):(?:(?P<column>\d+):)?\s*'
+    r'(?P<severity>fatal error|error|warning|note|remark)\s*:\s*(?P<message>.*)$'
+)
+# 链接器等工具自身的诊断，例如 ld.lld: error: undefined symbol: foo
+TOOL_RE = re.compile(
+    r'^(?:\S*/)?(?P<tool>ld(?:\.lld|\.gold|\.bfd)?|lld|clang(?:\+\+)?|llvm-ar|ar)(?:\.exe)?:\s*'
+    r'(?P<severity>fatal error|error|warning)\s*:\s*(?P<message>.*)$'
+)
+# lld的附加信息，例如 >>> referenced by hook.cpp:42
+LLD_NOTE_RE = re.compile(r'^>>>\s*(?P<message>.+)$')
+# GNU ld: hook.o:hook.cpp:function foo: undefined reference to 'bar'
+UNDEFINED_RE = re.compile(r'^(?P<file>[^:\s]+):.*?(?P<message>undefined reference to .+)$')
+# Android NDK: ERROR:jni/Android.mk:dobby: LOCAL_SRC_FILES points to a missing file
+NDK_RE = re.compile(
+    r'^Android NDK:\s*(?P<severity>ERROR|WARNING)\s*:\s*(?P<file>[^:\s]+\.mk):(?:[^:]*:)?\s*(?P<message>.*)$'
+)
+# make: *** [target] Error 1
+MAKE_RE = re.compile(r'^make(?:\[\d+\])?: \*\*\* (?P<message>.+)$')
+# 脚本输出的 Error: ... / ERROR: ...
+GENERIC_RE = re.compile(r'^(?P<severity>fatal error|Error|ERROR|error|Warning|WARNING)\s*:\s*(?P<message>.+)$')
+# 头文件包含链中的一层
+INCLUDE_RE = re.compile(r'^\s*(?:In file included from|from)\s+(?P<file>.+?):(?P<line>\d+)[:,]?\s*$')
+# make进出目录的提示，结束一条错误的上下文
+MAKE_DIRECTORY_RE = re.compile(r'^make(?:\[\d+\])?: (?:Entering|Leaving)')
+
+SEVERITY_ORDER = {'fatal': 0, 'error': 1, 'warning': 2, 'remark': 3, 'note': 4}
+
+
+def clip(line):
+    """截断过长的行"""
+    if len(line) > MAX_LINE_LENGTH:
+        return line[:MAX_LINE_LENGTH] + ' ...'
+    return line
+
+
+def _severity(text):
+    """统一级别名称"""
+    text = text.lower()
+    return 'fatal' if text == 'fatal error' else text
+
+
+class Diagnostic:
+    """一条诊断信息"""
+
+    __slots__ = ('file', 'line', 'column', 'severity', 'message', 'include_stack', 'notes', 'command', 'count',
+                 'text', 'context')
+
+    def __init__(self, file, line, column, severity, message, include_stack=(), command=None, text=None):
+        self.file = file
+        self.line = line
+        self.column = column
+        self.severity = severity
+        self.message = message
+        # 从外到内的(文件, 行号)
+        self.include_stack = tuple(include_stack)
+        # 附带的note，每条为(文件, 行号, 列号, 消息)，工具自身的note文件为None
+        self.notes = []
+        self.command = command
+        self.count = 1
+        # 诊断所在的原始行，以及错误之后的上下文原文，用于生成缩减日志
+        self.text = text
+        self.context = []
+
+    @property
+    def is_error(self):
+        """是否为错误或致命错误"""
+        return self.severity in ('fatal', 'error')
+
+    @property
+    def location(self):
+        """file:line:column形式的位置"""
+        if self.file is None:
+            return None
+        parts = [self.file] + [str(part) for part in (self.line, self.column) if part is not None]
+        return ':'.join(parts)
+
+    def to_dict(self):
+        """转换为可序列化的字典"""
+        return {
+            'file': self.file,
+            'line': self.line,
+            'column': self.column,
+            'severity': self.severity,
+            'message': self.message,
+            'include_stack': [list(frame) for frame in self.include_stack],
+            'notes': [list(note) for note in self.notes],
+            'command': self.command,
+            'count': self.count,
+        }
+
+    def __repr__(self):
+        return f"Diagnostic({self.location or '-'} {self.severity}: {self.message})"
+
+
+class DiagnosticParser:
+    """逐行喂入构建输出，返回已经完整的诊断
+
+    一条诊断之后可能还有note，所以在下一条诊断、下一个编译命令或close()时才返回
+    """
+
+    def __init__(self, max_diagnostics=DEFAULT_MAX_DIAGNOSTICS, context_lines=DEFAULT_CONTEXT_LINES):
+        self.max_diagnostics = max_diagnostics
+        self.context_lines = context_lines
+        self.diagnostics = {}
+        # 超出数量上限而没有保留的诊断数
+        self.dropped = 0
+        self._command = None
+        self._includes = []
+        self._current = None
+        # 正在收集上下文的错误的context列表，警告不保留上下文
+        self._context = None
+
+    def _match(self, line):
+        """识别一行主诊断，返回(文件, 行号, 列号, 级别, 消息)，note返回级别为note"""
+        match = CLANG_RE.match(line)
+        if match:
+            column = match.group('column')
+            return (match.group('file'), int(match.group('line')), int(column) if column else None,
+                    _severity(match.group('severity')), match.group('message').strip())
+        match = TOOL_RE.match(line)
+        if match:
+            return None, None, None, _severity(match.group('severity')), match.group('message').strip()
+        match = NDK_RE.match(line)
+        if match:
+            return match.group('file'), None, None, _severity(match.group('severity')), match.group('message').strip()
+        match = UNDEFINED_RE.match(line)
+        if match:
+            return match.group('file'), None, None, 'error', match.group('message').strip()
+        match = MAKE_RE.match(line)
+        if match:
+            return None, None, None, 'error', match.group('message').strip()
+        match = GENERIC_RE.match(line)
+        if match:
+            return None, None, None, _severity(match.group('severity')), match.group('message').strip()
+        return None
+
+    def _add_context(self, line):
+        """把一行加入当前错误的上下文，空行、make进出目录或达到行数上限时结束"""
+        if self._context is None:
+            return
+        if not line.strip() or MAKE_DIRECTORY_RE.match(line) or len(self._context) >= self.context_lines:
+            self._context = None
+            return
+        self._context.append(clip(line))
+
+    def _take_current(self):
+        """返回等待note的诊断(如果有)"""
+        current, self._current = self._current, None
+        return [current] if current is not None else []
+
+    def feed(self, line):
+        """处理一行输出，返回这一行使之完整的诊断列表"""
+        line = line.rstrip('\r\n')
+        if COMMAND_RE.search(line):
+            self._command = line.strip()
+            self._includes = []
+            self._context = None
+            return self._take_current()
+
+        match = INCLUDE_RE.match(line)
+        if match:
+            self._includes.append((match.group('file'), int(match.group('line'))))
+            self._context = None
+            return []
+
+        lld_note = LLD_NOTE_RE.match(line)
+        if lld_note:
+            if self._current is not None:
+                self._current.notes.append((None, None, None, lld_note.group('message').strip()))
+            self._add_context(line)
+            return []
+
+        parsed = self._match(line)
+        if parsed is None:
+            # 源码行、^标记行等不改变状态，其他内容打断头文件包含链
+            if not line.startswith((' ', '\t')):
+                self._includes = []
+            self._add_context(line)
+            return []
+
+        file, lineno, column, severity, message = parsed
+        if severity == 'note':
+            if self._current is not None:
+                self._current.notes.append((file, lineno, column, message))
+            self._includes = []
+            self._add_context(line)
+            return []
+
+        completed = self._take_current()
+        includes, self._includes = self._includes, []
+        self._context = None
+        key = (file, lineno, column, severity, message)
+        existing = self.diagnostics.get(key)
+        if existing is not None:
+            existing.count += 1
+        elif len(self.diagnostics) >= self.max_diagnostics:
+            self.dropped += 1
+        else:
+            diagnostic = Diagnostic(file, lineno, column, severity, message, includes, self._command, clip(line))
+            self.diagnostics[key] = diagnostic
+            self._current = diagnostic
+            if diagnostic.is_error:
+                self._context = diagnostic.context
+        return completed
+
+    def close(self):
+        """输出结束，返回最后一条诊断"""
+        return self._take_current()
+
+
+def parse(lines, max_diagnostics=DEFAULT_MAX_DIAGNOSTICS):
+    """逐行解析构建输出，依次产生不同的诊断；重复出现的诊断只增加已产生对象的count"""
+    parser = DiagnosticParser(max_diagnostics)
+    for line in lines:
+        yield from parser.feed(line)
+    yield from parser.close()
+
+
+def parse_text(text, max_diagnostics=DEFAULT_MAX_DIAGNOSTICS):
+    """解析一段构建输出，返回诊断列表"""
+    return list(parse((text or '').splitlines(), max_diagnostics))
+
+
+def first_error(diagnostics):
+    """第一条错误级别的诊断"""
+    for diagnostic in diagnostics:
+        if diagnostic.is_error:
+            return diagnostic
+    return None
+
+
+def format_diagnostic(diagnostic):
+    """格式化为一行"""
+    location = f"{diagnostic.location}: " if diagnostic.location else ""
+    repeat = f" (x{diagnostic.count})" if diagnostic.count > 1 else ""
+    return f"{location}{diagnostic.severity}: {diagnostic.message}{repeat}"
+
+
+def print_diagnostics(diagnostics, min_severity='warning'):
+    """按出现顺序打印诊断，只打印不低于min_severity的级别"""
+    limit = SEVERITY_ORDER[min_severity]
+    for diagnostic in diagnostics:
+        if SEVERITY_ORDER[diagnostic.severity] > limit:
+            continue
+        print(f"  {format_diagnostic(diagnostic)}")
+        for file, line in diagnostic.include_stack:
+            print(f"      包含自 {file}:{line}")
+        for file, line, column, message in diagnostic.notes:
+            location = ':'.join(str(part) for part in (file, line, column) if part is not None)
+            print(f"      note: {location + ': ' if location else ''}{message}")
+
+
+def main(argv=None):
+    """命令行入口: 解析构建日志并输出诊断"""
+    parser = argparse.ArgumentParser(description="解析构建日志中的诊断信息")
+    parser.add_argument('log', help="构建日志文件路径，- 表示标准输入")
+    parser.add_argument('--json', action='store_true', help="输出JSON格式")
+    parser.add_argument('--min-severity', default='warning', choices=['fatal', 'error', 'warning', 'note'],
+                        help="打印的最低级别")
+    args = parser.parse_args(argv)
+
+    if args.log == '-':
+        diagnostics = list(parse(sys.stdin))
+    else:
+        try:
+            with open(args.log, 'r', encoding='utf-8', errors='replace') as f:
+                diagnostics = list(parse(f))
+        except OSError as e:
+            print(f"错误: 无法读取日志: {str(e)}")
+            return 1
+
+    if args.json:
+        print(json.dumps([diagnostic.to_dict() for diagnostic in diagnostics], indent=2, ensure_ascii=False))
+    else:
+        print_diagnostics(diagnostics, args.min_severity)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Dobby库的增量编译
+每个(ABI, API级别, 构建类型)组合使用独立且持久的CMake构建目录，
+工具链文件和缓存变量未变化时跳过重新配置，只重新编译发生变化的源文件
+"""
+
+import os
+import json
+import shutil
+import hashlib
+from pathlib import Path
+
+import build_runner
+import build_trace
+import build_tuning
+import dobby_cache
+import preflight
+
+
+DEFAULT_ABI = 'arm64-v8a'
+DEFAULT_API_LEVEL = 21
+DEFAULT_BUILD_TYPE = 'Release'
+
+# 构建目录中记录上次配置参数的文件
+CONFIGURE_STAMP = '.configure-stamp.json'
+
+
+def get_build_type():
+    """获取构建类型"""
+    return os.environ.get('DOBBY_BUILD_TYPE', DEFAULT_BUILD_TYPE)
+
+
+def get_build_jobs():
+    """获取并行编译的任务数，未设置DOBBY_BUILD_JOBS时由自动调优决定"""
+    return build_tuning.choose_jobs('cmake')
+
+
+def cmake_flags(abi, api_level, build_type):
+    """Dobby交叉编译的CMake缓存变量，同时作为缓存键的一部分"""
+    return [
+        f'-DANDROID_ABI={abi}',
+        f'-DANDROID_PLATFORM=android-{api_level}',
+        f'-DCMAKE_BUILD_TYPE={build_type}',
+    ]
+
+
+def build_dir_for(src_dir, abi, api_level, build_type):
+    """每个构建组合各自的构建目录（以build-开头，不计入源码哈希）"""
+    return Path(src_dir) / f"build-{abi}-android{api_level}-{build_type.lower()}"
+
+
+def select_generator():
+    """有ninja时使用Ninja生成器"""
+    if preflight.run_preflight().has_tool('ninja'):
+        return 'Ninja'
+    return None
+
+
+def _configure_signature(toolchain_file, flags, generator):
+    """工具链文件内容、缓存变量和生成器的签名"""
+    digest = hashlib.sha256()
+    try:
+        digest.update(Path(toolchain_file).read_bytes())
+    except OSError:
+        digest.update(str(toolchain_file).encode('utf-8'))
+    payload = json.dumps({
+        'toolchain_file': str(toolchain_file),
+        'flags': list(flags),
+        'generator': generator,
+    }, sort_keys=True).encode('utf-8')
+    digest.update(payload)
+    return digest.hexdigest()
+
+
+def _read_stamp(build_dir):
+    """读取上次配置的签名"""
+    try:
+        with open(Path(build_dir) / CONFIGURE_STAMP, 'r', encoding='utf-8') as f:
+            return json.load(f).get('signature')
+    except (OSError, ValueError):
+        return None
+
+
+def _write_stamp(build_dir, signature):
+    """记录本次配置的签名"""
+    with open(Path(build_dir) / CONFIGURE_STAMP, 'w', encoding='utf-8') as f:
+        json.dump({'signature': signature}, f)
+
+
+def _reset_cmake_cache(build_dir):
+    """删除CMake缓存，使下次配置从头开始（生成器变化时必须如此）"""
+    build_dir = Path(build_dir)
+    for name in ('CMakeCache.txt', CONFIGURE_STAMP):
+        path = build_dir / name
+        if path.exists():
+            path.unlink()
+    shutil.rmtree(build_dir / 'CMakeFiles', ignore_errors=True)
+
+
+def configure(src_dir, build_dir, ndk_path, flags, generator=None, echo=True):
+    """配置构建目录，签名未变化时跳过"""
+    build_dir = Path(build_dir)
+    # CMake按构建目录解析相对路径，工具链文件必须使用绝对路径
+    toolchain_file = Path(ndk_path).resolve() / "build" / "cmake" / "android.toolchain.cmake"
+    signature = _configure_signature(toolchain_file, flags, generator)
+
+    if (build_dir / 'CMakeCache.txt').exists():
+        if _read_stamp(build_dir) == signature:
+            print(f"CMake配置未变化，跳过重新配置: {build_dir}")
+            return True
+        _reset_cmake_cache(build_dir)
+
+    build_dir.mkdir(parents=True, exist_ok=True)
+    cmake_cmd = ['cmake', '-S', str(src_dir), '-B', str(build_dir),
+                 f'-DCMAKE_TOOLCHAIN_FILE={toolchain_file}'] + list(flags)
+    if generator:
+        cmake_cmd += ['-G', generator]
+
+    print("运行CMake配置...")
+    result = build_runner.run_streaming(cmake_cmd, log_path=build_dir / 'configure.log', echo=echo)
+    if result.returncode != 0:
+        # 残留的缓存可能导致配置失败，清理后重试一次
+        print("CMake配置失败，清理构建目录后重试...")
+        _reset_cmake_cache(build_dir)
+        result = build_runner.run_streaming(cmake_cmd, log_path=build_dir / 'configure.log', echo=echo)
+        if result.returncode != 0:
+            print(f"CMake配置失败，日志: {result.log_path}")
+            return False
+
+    _write_stamp(build_dir, signature)
+    return True
+
+
+def build(build_dir, jobs=None, echo=True):
+    """增量编译，只重新编译发生变化的源文件"""
+    # 调用方指定并行度时(例如矩阵构建中与其他ABI共享CPU)，耗时不能代表独占机器的结果，不记录
+    tuned = jobs is None
+    jobs = jobs or get_build_jobs()
+    print(f"编译Dobby库 (并行任务数: {jobs})...")
+    result = build_runner.run_streaming(
+        ['cmake', '--build', str(build_dir), '--parallel', str(jobs)],
+        log_path=Path(build_dir) / 'build.log',
+        echo=echo
+    )
+    if tuned:
+        build_tuning.record('cmake', jobs, result)
+    if result.returncode != 0:
+        print(f"Dobby编译失败，日志: {result.log_path}")
+        return False
+    return True
+
+
+def find_library(build_dir):
+    """在构建目录中查找编译好的libdobby.a"""
+    for root, dirs, files in os.walk(build_dir):
+        if 'libdobby.a' in files:
+            return Path(root) / 'libdobby.a'
+    return None
+
+
+def compile_dobby(src_dir, ndk_path, install_targets, abi=DEFAULT_ABI, api_level=DEFAULT_API_LEVEL,
+                  build_type=None, jobs=None, echo=True, force=False):
+    """编译Dobby并安装到各目标位置，优先使用缓存和已有的构建目录
+
+    force为True时不查询缓存，并清理构建目录从头编译，编译结果覆盖缓存中的条目
+    """
+    build_type = build_type or get_build_type()
+    flags = cmake_flags(abi, api_level, build_type)
+
+    # 先查询本地缓存，命中时直接恢复库文件
+    with build_trace.span('dobby.cache_lookup', abi=abi):
+        cache_key = dobby_cache.compute_cache_key(src_dir, ndk_path, abi, api_level, flags)
+        cache_hit = not force and dobby_cache.restore(cache_key, install_targets)
+    if cache_hit:
+        print(f"Dobby缓存命中 ({cache_key[:12]})，已恢复库文件")
+        return True
+
+    print("开始编译Dobby库...")
+    build_dir = build_dir_for(src_dir, abi, api_level, build_type)
+    if force:
+        _reset_cmake_cache(build_dir)
+    with build_trace.span('dobby.configure', abi=abi):
+        configured = configure(src_dir, build_dir, ndk_path, flags, select_generator(), echo)
+    if not configured:
+        return False
+    with build_trace.span('dobby.compile', abi=abi):
+        built = build(build_dir, jobs, echo)
+    if not built:
+        return False
+
+    compiled_lib_path = find_library(build_dir)
+    if compiled_lib_path is None:
+        print("错误: 编译后的库文件不存在")
+        return False
+
+    # 存入缓存后再从缓存恢复到各目标位置，缓存不可用时直接复制编译产物
+    try:
+        dobby_cache.store(cache_key, compiled_lib_path)
+        restored = dobby_cache.restore(cache_key, install_targets)
+    except OSError as e:
+        print(f"警告: 无法写入Dobby缓存: {str(e)}")
+        restored = False
+    if not restored:
+        for target_path in install_targets:
+            target_path.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(compiled_lib_path, target_path)
+    for target_path in install_targets:
+        print(f"Dobby库已编译并复制到: {target_path}")
+    return True
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Dobby静态库的本地内容寻址缓存
+以Dobby源码树哈希、NDK版本、ABI、API级别和CMake参数为键缓存libdobby.a，
+命中时通过硬链接（或复制）直接恢复，避免每个构建节点重复交叉编译。
+条目与恢复出的库共用同一个inode，LRU使用的时间记录在条目旁的 <键>.used 文件上，
+不修改条目本身的mtime，否则检出的libdobby.a会显得刚被修改，触发监听模式重新构建
+"""
+
+import os
+import hashlib
+import json
+import shutil
+from pathlib import Path
+
+
+# 默认缓存目录和容量上限，可通过环境变量覆盖
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "hyperos_sf_bypass" / "dobby"
+DEFAULT_MAX_SIZE_MB = 512
+
+# 计算源码哈希时忽略的目录
+IGNORED_DIRS = {'.git', 'build'}
+
+# 进程内的源码哈希缓存: 源码目录 -> (各文件的状态签名, 哈希)
+_tree_hash_cache = {}
+
+
+def get_cache_dir():
+    """获取缓存目录"""
+    return Path(os.environ.get('DOBBY_CACHE_DIR', DEFAULT_CACHE_DIR))
+
+
+def get_max_cache_size():
+    """获取缓存容量上限（字节）"""
+    try:
+        max_mb = int(os.environ.get('DOBBY_CACHE_MAX_MB', DEFAULT_MAX_SIZE_MB))
+    except ValueError:
+        max_mb = DEFAULT_MAX_SIZE_MB
+    return max_mb * 1024 * 1024
+
+
+def _source_files(src_dir):
+    """按稳定的顺序列出源码树中的文件，返回[(相对路径, 路径)]"""
+    files = []
+    for root, dirs, names in os.walk(src_dir):
+        # 保证遍历顺序稳定，并跳过构建产物和版本库目录
+        dirs[:] = sorted(d for d in dirs if d not in IGNORED_DIRS and not d.startswith('build-'))
+        for name in sorted(names):
+            file_path = Path(root) / name
+            files.append((file_path.relative_to(src_dir).as_posix(), file_path))
+    return files
+
+
+def _stat_signature(files):
+    """各文件的(inode, 大小, mtime)，内容被修改时至少其中一项会变化"""
+    signature = []
+    for rel_path, file_path in files:
+        try:
+            stat = file_path.stat()
+        except OSError:
+            signature.append((rel_path, None))
+            continue
+        signature.append((rel_path, stat.st_ino, stat.st_size, stat.st_mtime_ns))
+    return tuple(signature)
+
+
+def hash_source_tree(src_dir):
+    """计算Dobby源码树的内容哈希；同一进程内各文件的状态没有变化时直接返回上次的结果"""
+    src_dir = Path(src_dir)
+    files = _source_files(src_dir)
+    signature = _stat_signature(files)
+    cache_key = str(src_dir.resolve())
+    cached = _tree_hash_cache.get(cache_key)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    digest = hashlib.sha256()
+    for rel_path, file_path in files:
+        digest.update(rel_path.encode('utf-8'))
+        digest.update(b'\0')
+        try:
+            with open(file_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+        except OSError:
+            # 损坏的符号链接等无法读取的文件只记录路径
+            pass
+        digest.update(b'\0')
+
+    tree_hash = digest.hexdigest()
+    _tree_hash_cache[cache_key] = (signature, tree_hash)
+    return tree_hash
+
+
+def get_ndk_version(ndk_path):
+    """从source.properties读取NDK版本号"""
+    props_file = Path(ndk_path) / "source.properties"
+    try:
+        with open(props_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('Pkg.Revision'):
+                    return line.split('=', 1)[1].strip()
+    except OSError:
+        pass
+    # 读取失败时退回到NDK目录名
+    return Path(ndk_path).name
+
+
+def compute_cache_key(src_dir, ndk_path, abi, api_level, cmake_flags):
+    """根据源码和构建参数计算缓存键"""
+    key_data = {
+        'source': hash_source_tree(src_dir),
+        'ndk_version': get_ndk_version(ndk_path),
+        'abi': abi,
+        'api_level': str(api_level),
+        'cmake_flags': list(cmake_flags),
+    }
+    payload = json.dumps(key_data, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()
+
+
+def _entry_path(key):
+    """缓存条目的存储路径"""
+    return get_cache_dir() / key[:2] / f"{key}.a"
+
+
+def _used_path(entry):
+    """记录条目最近使用时间的文件"""
+    return entry.with_suffix('.used')
+
+
+def _mark_used(entry):
+    """更新条目的最近使用时间，作为LRU淘汰的依据"""
+    try:
+        _used_path(entry).touch()
+    except OSError:
+        pass
+
+
+def _last_used(entry, stat):
+    """条目的最近使用时间，没有记录时使用条目的mtime"""
+    try:
+        return _used_path(entry).stat().st_mtime
+    except OSError:
+        return stat.st_mtime
+
+
+def _link_or_copy(src, dst):
+    """优先使用硬链接放置文件，失败时退回复制"""
+    dst = Path(dst)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if dst.exists() or dst.is_symlink():
+        dst.unlink()
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def restore(key, targets):
+    """缓存命中时将libdobby.a恢复到各目标位置"""
+    entry = _entry_path(key)
+    if not entry.exists():
+        return False
+
+    for target in targets:
+        _link_or_copy(entry, target)
+
+    # 条目与恢复出的库是同一个inode，只更新旁边的记录文件
+    _mark_used(entry)
+    return True
+
+
+def store(key, lib_path):
+    """将编译好的libdobby.a存入缓存"""
+    entry = _entry_path(key)
+    entry.parent.mkdir(parents=True, exist_ok=True)
+
+    # 先写临时文件再原子替换，避免并发节点读到半个文件
+    tmp_path = entry.with_name(f"{entry.name}.{os.getpid()}.tmp")
+    shutil.copy2(lib_path, tmp_path)
+    os.replace(tmp_path, entry)
+    _mark_used(entry)
+
+    # 刚存入的条目即使超过容量上限也保留，调用方接着要从缓存恢复它
+    evict(keep=entry)
+    return entry
+
+
+def evict(max_size=None, keep=None):
+    """按LRU顺序淘汰缓存条目，直到总大小不超过上限；keep指定的条目不会被淘汰"""
+    if max_size is None:
+        max_size = get_max_cache_size()
+
+    cache_dir = get_cache_dir()
+    if not cache_dir.exists():
+        return 0
+
+    entries = []
+    total_size = 0
+    for entry in cache_dir.glob("*/*.a"):
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        entries.append((_last_used(entry, stat), stat.st_size, entry))
+        total_size += stat.st_size
+
+    removed = 0
+    for _, size, entry in sorted(entries, key=lambda item: item[0]):
+        if total_size <= max_size:
+            break
+        if keep is not None and entry == keep:
+            continue
+        try:
+            entry.unlink()
+        except OSError:
+            continue
+        try:
+            _used_path(entry).unlink()
+        except OSError:
+            pass
+        total_size -= size
+        removed += 1
+
+    return removed
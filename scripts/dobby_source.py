@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Dobby源码获取
+在本地缓存中维护Dobby的裸仓库镜像和按提交展开的只读源码树，版本固定在 dobby.lock 中，
+检出时从源码树复制到 jni/external/Dobby 并按内容哈希校验；
+首次获取之后不再需要网络，DOBBY_OFFLINE=1 时完全离线，也可以导入导出源码包用于隔离网络的构建机
+"""
+
+import os
+import sys
+import json
+import shutil
+import tarfile
+import argparse
+import subprocess
+from pathlib import Path
+
+import build_trace
+import dobby_cache
+
+
+DEFAULT_REPO_URL = "https://github.com/jmpews/Dobby.git"
+DEFAULT_SOURCE_CACHE_DIR = Path.home() / ".cache" / "hyperos_sf_bypass" / "dobby-src"
+
+# 固定的Dobby版本，首次获取时写入，建议提交到仓库
+LOCK_PATH = Path("dobby.lock")
+DEST_DIR = Path("jni/external/Dobby")
+
+
+class SourceError(Exception):
+    """无法获取或校验Dobby源码"""
+
+
+def get_source_cache_dir():
+    """获取源码缓存目录"""
+    return Path(os.environ.get('DOBBY_SOURCE_CACHE_DIR', DEFAULT_SOURCE_CACHE_DIR))
+
+
+def is_offline():
+    """是否处于离线模式，DOBBY_OFFLINE=1时不访问网络"""
+    return os.environ.get('DOBBY_OFFLINE', '0') == '1'
+
+
+def load_lock():
+    """读取固定的Dobby版本"""
+    try:
+        with open(LOCK_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_lock(lock):
+    """写入固定的Dobby版本"""
+    tmp_path = LOCK_PATH.with_name(f"{LOCK_PATH.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(lock, f, indent=2, sort_keys=True)
+        f.write('\n')
+    os.replace(tmp_path, LOCK_PATH)
+
+
+def get_repo_url(lock):
+    """Dobby仓库地址，DOBBY_REPO_URL优先于dobby.lock"""
+    return os.environ.get('DOBBY_REPO_URL') or lock.get('url') or DEFAULT_REPO_URL
+
+
+def get_pinned_commit(lock):
+    """固定的提交，DOBBY_COMMIT优先于dobby.lock，都没有时返回None"""
+    return os.environ.get('DOBBY_COMMIT') or lock.get('commit')
+
+
+def mirror_dir():
+    """裸仓库镜像路径"""
+    return get_source_cache_dir() / "mirror.git"
+
+
+def tree_dir(commit):
+    """按提交展开的源码树路径"""
+    return get_source_cache_dir() / "trees" / commit
+
+
+def _tree_hash_path(commit):
+    """源码树内容哈希的记录文件"""
+    return get_source_cache_dir() / "trees" / f"{commit}.json"
+
+
+def _marker_path(dest):
+    """检出目录的版本记录，放在目录外以免影响源码哈希"""
+    dest = Path(dest)
+    return dest.parent / f".{dest.name}.source.json"
+
+
+def _read_json(path):
+    """读取JSON文件，失败时返回None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, data):
+    """原子地写入JSON文件"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def _git(args, check=True):
+    """在镜像仓库上执行git命令，返回CompletedProcess"""
+    try:
+        result = subprocess.run(['git', f'--git-dir={mirror_dir()}'] + args,
+                                capture_output=True, text=True)
+    except FileNotFoundError:
+        raise SourceError("系统中未找到Git命令")
+    if check and result.returncode != 0:
+        raise SourceError(f"git {args[0]} 失败: {result.stderr.strip()}")
+    return result
+
+
+def has_commit(commit):
+    """镜像中是否已有该提交"""
+    if not (mirror_dir() / "HEAD").exists():
+        return False
+    return _git(['cat-file', '-e', f'{commit}^{{commit}}'], check=False).returncode == 0
+
+
+def fetch(url, commit=None):
+    """把提交浅获取到镜像中，未指定提交时获取默认分支，返回获取到的提交"""
+    if is_offline():
+        raise SourceError("离线模式下无法获取Dobby源码")
+    mirror = mirror_dir()
+    if not (mirror / "HEAD").exists():
+        mirror.mkdir(parents=True, exist_ok=True)
+        _git(['init', '--bare', '--quiet'])
+
+    with build_trace.span('dobby.fetch', commit=commit or 'HEAD'):
+        result = _git(['fetch', '--quiet', '--depth=1', url, commit or 'HEAD'], check=False)
+        if result.returncode != 0 and commit:
+            # 服务器不允许按提交获取时退回到获取全部分支和标签
+            print("按提交获取失败，改为获取完整历史...")
+            _git(['fetch', '--quiet', url, '+refs/heads/*:refs/heads/*', '+refs/tags/*:refs/tags/*'])
+        elif result.returncode != 0:
+            raise SourceError(f"git fetch 失败: {result.stderr.strip()}")
+
+    if commit is None:
+        commit = _git(['rev-parse', 'FETCH_HEAD']).stdout.strip()
+    if not has_commit(commit):
+        raise SourceError(f"仓库中不存在提交 {commit}")
+    # 用引用保住固定的提交，避免被gc清理
+    _git(['update-ref', f'refs/pins/{commit}', commit])
+    return commit
+
+
+def _extract_archive(fileobj, target):
+    """把tar流解压到target，target已存在时先删除"""
+    tmp_dir = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    with tarfile.open(fileobj=fileobj, mode='r|') as archive:
+        if hasattr(tarfile, 'data_filter'):
+            archive.extractall(tmp_dir, filter='data')
+        else:
+            archive.extractall(tmp_dir)
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp_dir, target)
+
+
+def _record_tree(commit):
+    """计算并记录源码树的内容哈希"""
+    tree_hash = dobby_cache.hash_source_tree(tree_dir(commit))
+    _write_json(_tree_hash_path(commit), {'commit': commit, 'tree_sha256': tree_hash})
+    return tree_hash
+
+
+def extract_tree(commit):
+    """从镜像中导出提交对应的源码树，返回内容哈希"""
+    with build_trace.span('dobby.extract', commit=commit):
+        cmd = ['git', f'--git-dir={mirror_dir()}', 'archive', '--format=tar', commit]
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            _extract_archive(proc.stdout, tree_dir(commit))
+        finally:
+            proc.stdout.close()
+            stderr = proc.stderr.read().decode('utf-8', errors='replace')
+            proc.stderr.close()
+            proc.wait()
+        if proc.returncode != 0:
+            shutil.rmtree(tree_dir(commit), ignore_errors=True)
+            raise SourceError(f"git archive 失败: {stderr.strip()}")
+        return _record_tree(commit)
+
+
+def cached_tree(commit):
+    """返回缓存中完好的源码树的内容哈希，不存在或已被改动时返回None"""
+    tree = tree_dir(commit)
+    record = _read_json(_tree_hash_path(commit))
+    if not tree.is_dir() or not record:
+        return None
+    with build_trace.span('dobby.verify', commit=commit):
+        tree_hash = dobby_cache.hash_source_tree(tree)
+    if tree_hash != record.get('tree_sha256'):
+        print(f"警告: 缓存的Dobby源码树 {commit[:12]} 已被修改，重新导出")
+        shutil.rmtree(tree, ignore_errors=True)
+        return None
+    return tree_hash
+
+
+def ensure_tree(lock):
+    """确保缓存中有固定版本的源码树，返回(提交, 内容哈希)"""
+    url = get_repo_url(lock)
+    commit = get_pinned_commit(lock)
+
+    if commit:
+        tree_hash = cached_tree(commit)
+        if tree_hash:
+            return commit, tree_hash
+        if not has_commit(commit):
+            if is_offline():
+                raise SourceError(f"离线模式下缓存中没有Dobby提交 {commit}，"
+                                  f"请先在联网环境运行 fetch，或用 import 导入源码包")
+            print(f"正在获取Dobby提交 {commit[:12]}...")
+            fetch(url, commit)
+    else:
+        if is_offline():
+            raise SourceError("离线模式下需要在 dobby.lock 或 DOBBY_COMMIT 中固定Dobby版本")
+        print("正在获取Dobby最新提交...")
+        commit = fetch(url)
+
+    return commit, extract_tree(commit)
+
+
+def _copy_tree(src, dst):
+    """把源码树复制到dst；检出的源码可能被修改或打补丁，不能与缓存共享文件"""
+    src = Path(src)
+    dst = Path(dst)
+    tmp_dir = dst.with_name(f".{dst.name}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    shutil.copytree(src, tmp_dir, symlinks=True)
+    if dst.exists():
+        shutil.rmtree(dst)
+    os.replace(tmp_dir, dst)
+
+
+def checkout_intact(dest, marker):
+    """检出目录的内容是否仍与记录的内容哈希一致"""
+    if not Path(dest).is_dir() or not marker.get('tree_sha256'):
+        return False
+    with build_trace.span('dobby.verify_checkout'):
+        return dobby_cache.hash_source_tree(dest) == marker['tree_sha256']
+
+
+def materialize(dest=DEST_DIR):
+    """检出固定版本的Dobby源码到dest，返回是否成功"""
+    dest = Path(dest)
+    lock = load_lock()
+    pinned = get_pinned_commit(lock)
+    marker = _read_json(_marker_path(dest))
+
+    if dest.exists():
+        if marker is None:
+            print(f"使用已有的Dobby源码: {dest}（非缓存检出，未校验版本）")
+            return True
+        if pinned is not None and marker.get('commit') != pinned:
+            print(f"Dobby版本已变更 ({marker.get('commit', '')[:12]} -> {pinned[:12]})，重新检出")
+        elif checkout_intact(dest, marker):
+            return True
+        else:
+            print(f"检出的Dobby源码已被修改或不完整，重新检出: {dest}")
+
+    try:
+        with build_trace.span('dobby.checkout'):
+            commit, tree_hash = ensure_tree(lock)
+            expected = lock.get('tree_sha256') if lock.get('commit') == commit else None
+            if expected and tree_hash != expected:
+                raise SourceError(f"Dobby源码哈希与 {LOCK_PATH} 不一致: {tree_hash} != {expected}")
+            _copy_tree(tree_dir(commit), dest)
+    except (SourceError, OSError) as e:
+        print(f"无法获取Dobby源码: {str(e)}")
+        return False
+
+    _write_json(_marker_path(dest), {'commit': commit, 'tree_sha256': tree_hash})
+    if not lock.get('commit') and not os.environ.get('DOBBY_COMMIT'):
+        save_lock({'url': get_repo_url(lock), 'commit': commit, 'tree_sha256': tree_hash})
+        print(f"已将Dobby版本 {commit[:12]} 固定到 {LOCK_PATH}")
+    print(f"Dobby源码 {commit[:12]} 已检出到 {dest}")
+    return True
+
+
+def export_archive(out_path):
+    """把固定版本的源码树导出为tar包，用于离线构建机"""
+    lock = load_lock()
+    commit, tree_hash = ensure_tree(lock)
+    out_path = Path(out_path)
+    # 与git archive一致，把提交写入pax头，导入时据此还原
+    with tarfile.open(out_path, 'w', format=tarfile.PAX_FORMAT, pax_headers={'comment': commit}) as archive:
+        archive.add(tree_dir(commit), arcname='.')
+    print(f"已导出Dobby源码 {commit[:12]} (sha256 {tree_hash[:12]}) 到 {out_path}")
+    return commit
+
+
+def import_archive(archive_path, commit=None):
+    """导入export或git archive生成的tar包到缓存，返回提交"""
+    archive_path = Path(archive_path)
+    lock = load_lock()
+    with open(archive_path, 'rb') as f:
+        with tarfile.open(fileobj=f, mode='r') as archive:
+            commit = commit or archive.pax_headers.get('comment') or get_pinned_commit(lock)
+        if not commit:
+            raise SourceError("无法从源码包确定提交，请通过 --commit 指定")
+        f.seek(0)
+        _extract_archive(f, tree_dir(commit))
+    tree_hash = _record_tree(commit)
+    expected = lock.get('tree_sha256') if lock.get('commit') == commit else None
+    if expected and tree_hash != expected:
+        shutil.rmtree(tree_dir(commit), ignore_errors=True)
+        raise SourceError(f"源码包哈希与 {LOCK_PATH} 不一致: {tree_hash} != {expected}")
+    print(f"已导入Dobby源码 {commit[:12]} (sha256 {tree_hash[:12]})")
+    return commit
+
+
+def main(argv=None):
+    """命令行入口: 预先获取、检出、导出或导入Dobby源码"""
+    parser = argparse.ArgumentParser(description="获取并缓存固定版本的Dobby源码")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('fetch', help="获取固定版本到本地缓存")
+    subparsers.add_parser('checkout', help="检出到 jni/external/Dobby")
+    export_parser = subparsers.add_parser('export', help="导出源码包用于离线构建机")
+    export_parser.add_argument('path')
+    import_parser = subparsers.add_parser('import', help="导入export生成的源码包")
+    import_parser.add_argument('path')
+    import_parser.add_argument('--commit', default=None, help="源码包对应的提交")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'fetch':
+            commit, tree_hash = ensure_tree(load_lock())
+            print(f"Dobby源码 {commit[:12]} 已缓存 (sha256 {tree_hash[:12]})")
+        elif args.command == 'checkout':
+            return 0 if materialize() else 1
+        elif args.command == 'export':
+            export_archive(args.path)
+        else:
+            import_archive(args.path, args.commit)
+    except (SourceError, OSError) as e:
+        print(f"错误: {str(e)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+构建错误指纹
+去掉路径、行号、时间戳、十六进制地址等易变内容后对错误信息做哈希，
+使同一类错误在不同节点、不同重试中得到相同的指纹
+"""
+
+import re
+import hashlib
+
+
+# 按顺序应用的归一化规则
+NORMALIZE_RULES = [
+    # ISO时间戳和时:分:秒
+    (re.compile(r'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?'), '<time>'),
+    (re.compile(r'\b\d{2}:\d{2}:\d{2}(?:[.,]\d+)?\b'), '<time>'),
+    # 十六进制地址和较长的哈希值
+    (re.compile(r'\b0x[0-9a-fA-F]+\b'), '<hex>'),
+    (re.compile(r'\b[0-9a-f]{12,}\b'), '<hex>'),
+    # 去掉目录部分，只保留文件名
+    (re.compile(r'(?:[A-Za-z]:)?(?:[\w.+~-]*[\\/])+(?=[\w.+~-])'), ''),
+    # 文件名后的行号和列号
+    (re.compile(r':\d+(?::\d+)?(?=[:\s)]|$)'), ':<n>'),
+    (re.compile(r'\bline \d+\b'), 'line <n>'),
+    # make[2]、进程号等其他数字
+    (re.compile(r'\[\d+\]'), '[<n>]'),
+    (re.compile(r'\bpid[ =:]?\d+\b', re.IGNORECASE), 'pid <n>'),
+    # 连续空白
+    (re.compile(r'[ \t]+'), ' '),
+]
+
+
+def normalize_error(error_msg):
+    """归一化错误信息，去掉与具体环境相关的易变内容"""
+    text = error_msg or ''
+    for pattern, replacement in NORMALIZE_RULES:
+        text = pattern.sub(replacement, text)
+    lines = [line.strip() for line in text.splitlines()]
+    return '\n'.join(line for line in lines if line)
+
+
+def fingerprint(error_msg, salt=''):
+    """计算错误信息的指纹，salt用于区分不同的模型等上下文"""
+    digest = hashlib.sha256()
+    digest.update(salt.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(normalize_error(error_msg).encode('utf-8'))
+    return digest.hexdigest()
@@ -0,0 +1,488 @@
+#!/usr/bin/env python3
+"""
+历史构建失败的相似度索引
+把已解决的失败日志归一化为诊断词元集合，计算MinHash签名并按LSH分桶，
+新的失败在毫秒级找到最相似的历史失败和当时的修复方法，精确规则没有匹配时不必等待AI分析
+
+索引由两个文件组成:
+  cases.jsonl: 追加写入的失败记录，每行一个JSON(指纹、首个错误、修复方法、签名)，插入只追加一行
+  index.bin:   由cases.jsonl压缩生成、可以直接mmap的二进制索引(小端)
+    头部 48 字节: magic 'SFFI', 版本 u16, 头部长度 u16, 记录数 n u32, 签名长度 u32, 分段数 u32,
+                 已压缩的cases.jsonl字节数 u32, 签名区位置 u32, 分桶区位置 u32, 记录区位置 u32, 保留 u32,
+                 压缩时cases.jsonl的inode u64
+    签名区: n 个签名，每个为签名长度个 u32
+    分桶区: 每个分段 n 个(桶哈希 u32, 记录号 u32)，按桶哈希排序
+    记录区: n 个(cases.jsonl中的偏移 u32, 长度 u32)
+cases.jsonl中超出已压缩部分的记录在打开时读入内存逐个比较，积累到一定数量后重新压缩。
+裁剪会替换cases.jsonl，index.bin中记录的inode或字节数与cases.jsonl不符时(例如裁剪中途退出)打开时重新生成；
+追加和压缩都持有cases.jsonl的文件锁，裁剪期间并发插入的记录不会丢失
+"""
+
+import os
+import re
+import sys
+import json
+import mmap
+import time
+import zlib
+import random
+import struct
+import operator
+import hashlib
+import argparse
+from pathlib import Path
+
+import diagnostics
+import error_fingerprint
+import file_lock
+import log_reducer
+
+
+DEFAULT_INDEX_DIR = Path.home() / ".cache" / "hyperos_sf_bypass" / "failure_index"
+CASES_FILE = "cases.jsonl"
+INDEX_FILE = "index.bin"
+
+MAGIC = b'SFFI'
+VERSION = 2
+HEADER = struct.Struct('<4sHHIIIIIIIIQ')
+U32 = struct.Struct('<I')
+
+# 签名长度 = 分段数 * 每段行数；每段4行时相似度约0.5以上的失败大概率落入同一个桶
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+DEFAULT_TOP_K = 5
+DEFAULT_MIN_SIMILARITY = 0.5
+# 与历史失败的相似度达到该值时直接使用历史上的修复方法，不再请求AI分析
+SKIP_ANALYSIS_SIMILARITY = 0.9
+# 未压缩的记录达到该数量后重新生成index.bin
+COMPACT_EVERY = 64
+DEFAULT_MAX_CASES = 10000
+
+# MinHash的哈希族 (a * h + b) mod p，参数固定以便不同进程生成的签名可以比较
+_PRIME = (1 << 61) - 1
+_rng = random.Random(0x5F1D)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+del _rng
+
+# 诊断消息中的词元: 标识符、带引号的符号名、归一化后的占位符
+WORD_RE = re.compile(r"<\w+>|'[^']+'|[A-Za-z_][\w.+-]*")
+
+
+def _env_int(name, default):
+    """读取整数类型的环境变量"""
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def enabled():
+    """是否使用相似度索引，FAILURE_INDEX=0时关闭"""
+    return os.environ.get('FAILURE_INDEX', '1') != '0'
+
+
+def get_index_dir():
+    """获取索引目录"""
+    return Path(os.environ.get('FAILURE_INDEX_DIR', DEFAULT_INDEX_DIR))
+
+
+def tokenize(error_msg):
+    """把构建输出归一化为词元集合: 每条错误诊断的单词和相邻单词对，以及出错文件名"""
+    reduced = log_reducer.reduce_log(error_msg)
+    errors = [item for item in diagnostics.parse_text(reduced) if item.is_error]
+    if errors:
+        messages = [(item.file, item.message) for item in errors]
+    else:
+        # 没有可识别的诊断时退化为缩减后日志中的每一行
+        messages = [(None, line) for line in reduced.splitlines()]
+
+    tokens = set()
+    for file, message in messages:
+        words = WORD_RE.findall(error_fingerprint.normalize_error(message))
+        tokens.update(words)
+        tokens.update(f"{first} {second}" for first, second in zip(words, words[1:]))
+        if file:
+            tokens.add(f"file:{os.path.basename(file)}")
+    return tokens
+
+
+def signature(tokens):
+    """词元集合的MinHash签名，空集合返回None"""
+    if not tokens:
+        return None
+    hashes = [int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'little')
+              for token in tokens]
+    return [min((a * h + b) % _PRIME for h in hashes) & 0xFFFFFFFF for a, b in _PERMUTATIONS]
+
+
+def similarity(first, second):
+    """两个签名估计的Jaccard相似度"""
+    return sum(map(operator.eq, first, second)) / NUM_PERM
+
+
+def band_hashes(sig):
+    """签名每个分段的桶哈希"""
+    return [zlib.crc32(struct.pack(f'<{ROWS}I', *sig[band * ROWS:(band + 1) * ROWS])) for band in range(BANDS)]
+
+
+def _u32_array(buffer, start, end):
+    """把一段小端u32数据视为数组，大端主机上复制一份并转换字节序"""
+    view = memoryview(buffer)[start:end]
+    if sys.byteorder == 'little':
+        return view.cast('I')
+    import array
+    values = array.array('I', view)
+    values.byteswap()
+    return values
+
+
+def _read_cases(cases_path, start=0):
+    """从start字节开始读取cases.jsonl，返回[(偏移, 长度, 记录)]，写了一半的行被跳过"""
+    cases = []
+    try:
+        with open(cases_path, 'rb') as f:
+            f.seek(start)
+            offset = start
+            for line in f:
+                if line.endswith(b'\n'):
+                    try:
+                        cases.append((offset, len(line), json.loads(line)))
+                    except ValueError:
+                        pass
+                offset += len(line)
+    except OSError:
+        pass
+    return cases
+
+
+class FailureIndex:
+    """打开的相似度索引: mmap的index.bin加上其后追加的记录"""
+
+    def __init__(self, index_dir=None):
+        self.index_dir = Path(index_dir or get_index_dir())
+        self.cases_path = self.index_dir / CASES_FILE
+        self.index_path = self.index_dir / INDEX_FILE
+        self._mmap = None
+        self._arrays = []
+        self.count = 0
+        self._log_size = 0
+        self._log_inode = 0
+        if self._open_index():
+            # 还没有压缩进index.bin的记录
+            self.tail = _read_cases(self.cases_path, self._log_size)
+        else:
+            try:
+                self.compact()
+            except OSError:
+                # 无法写入时退化为逐个比较全部记录
+                self.tail = _read_cases(self.cases_path)
+
+    def _open_index(self):
+        """mmap打开index.bin，返回索引是否可用；不存在时视为空索引，
+        格式不符或与当前的cases.jsonl不一致时返回False，需要重新生成"""
+        try:
+            with open(self.index_path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size < HEADER.size:
+                    return False
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return True
+        except (OSError, ValueError):
+            return False
+        magic, version, header_size, count, num_perm, bands, log_size, signatures_pos, buckets_pos, \
+            cases_pos, _, log_inode = HEADER.unpack_from(self._mmap, 0)
+        if (magic != MAGIC or version != VERSION or header_size != HEADER.size or num_perm != NUM_PERM
+                or bands != BANDS or buckets_pos != signatures_pos + U32.size * count * NUM_PERM
+                or cases_pos != buckets_pos + U32.size * 2 * count * BANDS
+                or cases_pos + U32.size * 2 * count != len(self._mmap)):
+            self.close()
+            return False
+        size, inode = _log_identity(self.cases_path)
+        if inode != log_inode or size < log_size:
+            # cases.jsonl在压缩之后被替换或截断，记录区中的偏移已经失效
+            self.close()
+            return False
+        self.count = count
+        self._log_size = log_size
+        self._log_inode = log_inode
+        self._signatures = _u32_array(self._mmap, signatures_pos, buckets_pos)
+        self._buckets = _u32_array(self._mmap, buckets_pos, cases_pos)
+        self._cases = _u32_array(self._mmap, cases_pos, len(self._mmap))
+        self._arrays = [self._signatures, self._buckets, self._cases]
+        return True
+
+    def __len__(self):
+        return self.count + len(self.tail)
+
+    def _signature_at(self, index):
+        """第index个已压缩记录的签名"""
+        return self._signatures[index * NUM_PERM:(index + 1) * NUM_PERM]
+
+    def _bucket(self, band, value):
+        """某个分段中桶哈希为value的记录号"""
+        base = band * self.count
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._buckets[2 * (base + middle)] < value:
+                low = middle + 1
+            else:
+                high = middle
+        while low < self.count and self._buckets[2 * (base + low)] == value:
+            yield self._buckets[2 * (base + low) + 1]
+            low += 1
+
+    def _case_at(self, index):
+        """从cases.jsonl读取第index个已压缩记录，打开索引之后cases.jsonl被其他进程替换时返回None"""
+        offset, length = self._cases[2 * index], self._cases[2 * index + 1]
+        try:
+            with open(self.cases_path, 'rb') as f:
+                if os.fstat(f.fileno()).st_ino != self._log_inode:
+                    return None
+                f.seek(offset)
+                return json.loads(f.read(length))
+        except (OSError, ValueError):
+            return None
+
+    def query_signature(self, sig, k=DEFAULT_TOP_K, min_similarity=DEFAULT_MIN_SIMILARITY):
+        """返回与签名最相似的k个历史失败，按相似度降序"""
+        scored = []
+        candidates = set()
+        for band, value in enumerate(band_hashes(sig)):
+            candidates.update(self._bucket(band, value))
+        for index in candidates:
+            score = similarity(sig, self._signature_at(index))
+            if score >= min_similarity:
+                scored.append((score, self._cases[2 * index], index, None))
+        for offset, _, case in self.tail:
+            score = similarity(sig, case['signature'])
+            if score >= min_similarity:
+                scored.append((score, offset, None, case))
+        # 相似度相同时较新(在cases.jsonl中更靠后)的记录优先
+        scored.sort(key=lambda item: (-item[0], -item[1]))
+        matches = []
+        for score, _, index, case in scored:
+            if len(matches) >= k:
+                break
+            if case is None:
+                case = self._case_at(index)
+                if case is None:
+                    continue
+            case = dict(case)
+            case.pop('signature', None)
+            case['similarity'] = score
+            matches.append(case)
+        return matches
+
+    def query(self, error_msg, k=DEFAULT_TOP_K, min_similarity=DEFAULT_MIN_SIMILARITY):
+        """返回与构建输出最相似的k个历史失败"""
+        sig = signature(tokenize(error_msg))
+        return self.query_signature(sig, k, min_similarity) if sig else []
+
+    def insert(self, error_msg, fix, source='manual'):
+        """追加一个已解决的失败，返回是否插入；未压缩的记录足够多时重新压缩"""
+        sig = signature(tokenize(error_msg))
+        if sig is None:
+            return False
+        reduced = log_reducer.reduce_log(error_msg)
+        first = diagnostics.first_error(diagnostics.parse_text(reduced))
+        case = {
+            'fingerprint': log_reducer.fingerprint(reduced),
+            'first_error': diagnostics.format_diagnostic(first) if first else None,
+            'fix': fix,
+            'source': source,
+            'recorded_at': time.time(),
+            'signature': sig,
+        }
+        line = (json.dumps(case, ensure_ascii=False) + '\n').encode('utf-8')
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        # 追加模式下一次写入一整行，并发的进程不会交错；持有文件锁，避免写入正在被裁剪替换的旧文件
+        with file_lock.locked(self.cases_path), open(self.cases_path, 'ab') as f:
+            offset = f.tell()
+            f.write(line)
+        self.tail.append((offset, len(line), case))
+        if len(self.tail) >= COMPACT_EVERY:
+            self.compact()
+        return True
+
+    def compact(self, max_cases=None):
+        """把cases.jsonl中的全部记录重新生成为index.bin，超出数量上限时只保留最新的记录"""
+        max_cases = max_cases or _env_int('FAILURE_INDEX_MAX_CASES', DEFAULT_MAX_CASES)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        # 从读取到写完index.bin都持有锁: 裁剪期间的插入等到新文件就位后再追加
+        with file_lock.locked(self.cases_path):
+            count = self._compact_locked(max_cases)
+
+        # 重新打开压缩后的索引
+        self.close()
+        self._open_index()
+        self.tail = _read_cases(self.cases_path, self._log_size)
+        return count
+
+    def _compact_locked(self, max_cases):
+        """持有锁时重新生成index.bin，先替换cases.jsonl再替换index.bin，中途退出时由inode不符检测出来"""
+        cases = _read_cases(self.cases_path)
+        if len(cases) > max_cases:
+            cases = cases[-max_cases:]
+            data = b''.join(json.dumps(case, ensure_ascii=False).encode('utf-8') + b'\n' for _, _, case in cases)
+            _replace(self.cases_path, data)
+            cases = _read_cases(self.cases_path)
+        log_size = cases[-1][0] + cases[-1][1] if cases else 0
+        _, log_inode = _log_identity(self.cases_path)
+
+        count = len(cases)
+        signatures = bytearray()
+        buckets = [[] for _ in range(BANDS)]
+        locations = bytearray()
+        for index, (offset, length, case) in enumerate(cases):
+            signatures += struct.pack(f'<{NUM_PERM}I', *case['signature'])
+            for band, value in enumerate(band_hashes(case['signature'])):
+                buckets[band].append((value, index))
+            locations += struct.pack('<II', offset, length)
+        bucket_data = b''.join(struct.pack('<II', value, index)
+                               for band in buckets for value, index in sorted(band))
+
+        signatures_pos = HEADER.size
+        buckets_pos = signatures_pos + len(signatures)
+        cases_pos = buckets_pos + len(bucket_data)
+        header = HEADER.pack(MAGIC, VERSION, HEADER.size, count, NUM_PERM, BANDS, log_size,
+                             signatures_pos, buckets_pos, cases_pos, 0, log_inode)
+        _replace(self.index_path, header + bytes(signatures) + bucket_data + bytes(locations))
+        return count
+
+    def close(self):
+        """释放mmap"""
+        for values in self._arrays:
+            if isinstance(values, memoryview):
+                values.release()
+        self._arrays = []
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self.count = 0
+        self._log_size = 0
+        self._log_inode = 0
+
+
+def _log_identity(cases_path):
+    """cases.jsonl当前的(字节数, inode)，不存在时为(0, 0)"""
+    try:
+        stat = os.stat(cases_path)
+    except OSError:
+        return 0, 0
+    return stat.st_size, stat.st_ino
+
+
+def _replace(path, data):
+    """原子地替换文件内容，已经mmap旧文件的进程不受影响"""
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def find_similar(error_msg, k=DEFAULT_TOP_K, min_similarity=DEFAULT_MIN_SIMILARITY):
+    """查询与构建输出相似的历史失败，索引不可用时返回空列表"""
+    if not enabled():
+        return []
+    try:
+        index = FailureIndex()
+    except OSError:
+        return []
+    try:
+        # 空索引不需要计算签名
+        return index.query(error_msg, k, min_similarity) if len(index) else []
+    finally:
+        index.close()
+
+
+def record_fix(error_msg, fix, source):
+    """记录一个已解决的失败和解决它的修复方法"""
+    if not enabled() or not fix:
+        return
+    try:
+        index = FailureIndex()
+        try:
+            index.insert(error_msg, fix, source)
+        finally:
+            index.close()
+    except OSError as e:
+        print(f"警告: 无法写入失败相似度索引: {str(e)}")
+
+
+def suggested_fixes(matches):
+    """按修复方法汇总相似的历史失败，返回[{'fix', 'similarity', 'count'}]，按最高相似度和次数降序"""
+    fixes = {}
+    for match in matches:
+        entry = fixes.setdefault(match['fix'], {'fix': match['fix'], 'similarity': 0.0, 'count': 0})
+        entry['similarity'] = max(entry['similarity'], match['similarity'])
+        entry['count'] += 1
+    return sorted(fixes.values(), key=lambda entry: (-entry['similarity'], -entry['count']))
+
+
+def print_matches(matches):
+    """打印相似的历史失败及其修复方法"""
+    print(f"相似的历史失败 ({len(matches)} 个):")
+    for match in matches:
+        recorded = time.strftime('%Y-%m-%d', time.localtime(match['recorded_at']))
+        print(f"  [{match['similarity']:.0%}] 修复方法: {match['fix']}  ({recorded}，{match['source']})")
+        if match['first_error']:
+            print(f"        首个错误: {match['first_error']}")
+
+
+def main(argv=None):
+    """命令行入口: 查询相似的历史失败，或把已解决的失败日志加入索引"""
+    parser = argparse.ArgumentParser(description="在历史构建失败中查找相似的失败及其修复方法")
+    parser.add_argument('log', nargs='?', help="构建日志文件路径，- 表示标准输入")
+    parser.add_argument('--add', metavar='FIX', help="把该日志作为已解决的失败加入索引，FIX为解决它的修复方法")
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP_K, help="返回的相似失败数量")
+    parser.add_argument('--min-similarity', type=float, default=DEFAULT_MIN_SIMILARITY, help="最低相似度")
+    parser.add_argument('--compact', action='store_true', help="重新生成可mmap的二进制索引")
+    parser.add_argument('--json', action='store_true', help="输出JSON格式")
+    args = parser.parse_args(argv)
+
+    if args.log is None and not args.compact:
+        parser.error("需要日志文件路径或 --compact")
+
+    index = FailureIndex()
+    try:
+        if args.log is not None:
+            try:
+                if args.log == '-':
+                    error_msg = sys.stdin.read()
+                else:
+                    with open(args.log, 'r', encoding='utf-8', errors='replace') as f:
+                        error_msg = f.read()
+            except OSError as e:
+                print(f"错误: 无法读取日志: {str(e)}")
+                return 1
+
+            if args.add:
+                if not index.insert(error_msg, args.add, source='manual'):
+                    print("错误: 日志中没有可以索引的错误信息")
+                    return 1
+                print(f"已加入索引 (共 {len(index)} 个历史失败)")
+            else:
+                start = time.perf_counter()
+                matches = index.query(error_msg, args.top, args.min_similarity)
+                elapsed = time.perf_counter() - start
+                if args.json:
+                    print(json.dumps(matches, indent=2, ensure_ascii=False))
+                elif matches:
+                    print_matches(matches)
+                    print(f"\n在 {len(index)} 个历史失败中查询，用时 {elapsed * 1000:.1f}ms")
+                else:
+                    print(f"没有相似的历史失败 (共 {len(index)} 个，用时 {elapsed * 1000:.1f}ms)")
+
+        if args.compact:
+            count = index.compact()
+            print(f"已压缩索引: {index.index_path} ({count} 个历史失败)")
+    finally:
+        index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
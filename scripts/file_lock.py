@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+跨进程的文件锁
+~/.cache 下的状态文件可能被同时运行的多个进程（例如监听模式和自动修复）读-改-写，
+修改期间持有同目录下 <文件名>.lock 的排他锁；posix上使用fcntl.flock，Windows上使用msvcrt.locking
+"""
+
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+
+def lock_path_for(path):
+    """path对应的锁文件"""
+    path = Path(path)
+    return path.with_name(f"{path.name}.lock")
+
+
+def _acquire(fd):
+    """阻塞直到取得排他锁"""
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+    elif msvcrt is not None:
+        # LK_LOCK在锁被占用时每秒重试一次，共10次，之后抛出OSError
+        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+
+
+def _release(fd):
+    """释放排他锁"""
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    elif msvcrt is not None:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def locked(path):
+    """持有path对应的排他锁；无法创建锁文件时(例如缓存目录不可写)不加锁，由调用方处理之后的写入失败"""
+    lock_path = lock_path_for(path)
+    try:
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    except OSError:
+        yield
+        return
+    try:
+        _acquire(fd)
+    except OSError:
+        os.close(fd)
+        raise
+    try:
+        yield
+    finally:
+        _release(fd)
+        os.close(fd)
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+文件变化监听
+Linux上通过ctypes直接使用inotify，递归监听目录并跟踪新建的子目录；
+其他平台或inotify不可用时退化为按修改时间轮询
+"""
+
+import os
+import time
+import platform
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+from pathlib import Path
+
+
+# inotify事件掩码，见 <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_ATTRIB)
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+# 编辑器产生的临时文件
+IGNORED_SUFFIXES = ('~', '.swp', '.swx', '.tmp')
+IGNORED_PREFIXES = ('.#',)
+
+DEFAULT_POLL_INTERVAL = 0.5
+
+
+def _is_ignored_name(name):
+    """是否为编辑器临时文件"""
+    return name.endswith(IGNORED_SUFFIXES) or name.startswith(IGNORED_PREFIXES)
+
+
+class InotifyWatcher:
+    """基于inotify的递归目录监听"""
+
+    def __init__(self, roots, files=(), ignored_dirs=()):
+        libc_name = ctypes.util.find_library('c') or 'libc.so.6'
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_init1失败: {os.strerror(err)}")
+        self.ignored_dirs = set(ignored_dirs)
+        # 监听描述符到目录的映射，以及递归监听中的目录
+        self._dirs = {}
+        self._tree_dirs = set()
+        # 单独监听的文件：监听其所在目录并按文件名过滤，编辑器先写临时文件再重命名时也能捕获
+        self._files = {}
+        for root in roots:
+            self._add_tree(Path(root))
+        for file_path in files:
+            file_path = Path(file_path)
+            parent = str(file_path.parent)
+            self._files.setdefault(parent, set()).add(file_path.name)
+            if parent not in self._dirs.values():
+                self._add_watch(parent)
+
+    def _add_watch(self, path):
+        """为单个目录添加监听"""
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(str(path)), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR):
+                return
+            raise OSError(err, f"inotify_add_watch失败 {path}: {os.strerror(err)}")
+        self._dirs[wd] = str(path)
+
+    def _add_tree(self, root):
+        """递归监听目录，跳过构建产物目录"""
+        for current, dirs, files in os.walk(root):
+            dirs[:] = [d for d in dirs if d not in self.ignored_dirs]
+            self._add_watch(current)
+            self._tree_dirs.add(str(current))
+
+    def _parse(self, data):
+        """解析inotify事件，返回变化的路径集合"""
+        changed = set()
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0').decode('utf-8', errors='replace')
+            offset += length
+
+            directory = self._dirs.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                # 目录已被删除
+                self._dirs.pop(wd, None)
+                self._tree_dirs.discard(directory)
+                continue
+            if not name or _is_ignored_name(name):
+                continue
+            if directory not in self._tree_dirs:
+                # 只为单独的文件而监听的目录，忽略其他文件
+                if name not in self._files.get(directory, ()):
+                    continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if name in self.ignored_dirs:
+                    continue
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # 新建的子目录需要补充监听
+                    self._add_tree(Path(path))
+            changed.add(path)
+        return changed
+
+    def wait(self, timeout=None):
+        """等待文件变化，返回变化的路径集合，超时返回空集合"""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        return self._parse(os.read(self._fd, 64 * 1024))
+
+    def close(self):
+        """关闭inotify"""
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """按修改时间轮询的监听，用于不支持inotify的平台"""
+
+    def __init__(self, roots, files=(), ignored_dirs=(), interval=DEFAULT_POLL_INTERVAL):
+        self.roots = [Path(root) for root in roots]
+        self.files = [Path(file_path) for file_path in files]
+        self.ignored_dirs = set(ignored_dirs)
+        self.interval = interval
+        self._snapshot = self._scan()
+
+    def _scan(self):
+        """记录所有被监听文件的修改时间和大小"""
+        snapshot = {}
+        paths = list(self.files)
+        for root in self.roots:
+            for current, dirs, files in os.walk(root):
+                dirs[:] = [d for d in dirs if d not in self.ignored_dirs]
+                paths.extend(Path(current) / name for name in files if not _is_ignored_name(name))
+        for path in paths:
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            snapshot[str(path)] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def wait(self, timeout=None):
+        """等待文件变化，返回变化的路径集合，超时返回空集合"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = self._scan()
+            if snapshot != self._snapshot:
+                changed = {path for path in set(snapshot) | set(self._snapshot)
+                           if snapshot.get(path) != self._snapshot.get(path)}
+                self._snapshot = snapshot
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            remaining = self.interval if deadline is None else min(self.interval, deadline - time.monotonic())
+            time.sleep(max(0.0, remaining))
+
+    def close(self):
+        """轮询监听无需释放资源"""
+
+
+def create_watcher(roots, files=(), ignored_dirs=()):
+    """创建文件监听器，优先使用inotify"""
+    if platform.system() == 'Linux':
+        try:
+            return InotifyWatcher(roots, files, ignored_dirs)
+        except (OSError, AttributeError) as e:
+            print(f"inotify不可用，改为轮询监听: {str(e)}")
+    return PollingWatcher(roots, files, ignored_dirs)
+
+
+def wait_for_quiet(watcher, changed, debounce_seconds):
+    """在debounce_seconds内不再有新的变化时返回累计变化的路径"""
+    changed = set(changed)
+    while True:
+        more = watcher.wait(debounce_seconds)
+        if not more:
+            return changed
+        changed |= more
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+构建错误修复规则
+从 auto_fix_config.json 的 common_fixes 加载错误模式并编译为索引，
+对日志分类后按优先级排序映射到对应的修复动作
+"""
+
+import os
+import re
+import json
+from pathlib import Path
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+
+# 默认配置文件位于仓库根目录
+DEFAULT_CONFIG_PATH = Path(__file__).resolve().parent.parent / "auto_fix_config.json"
+
+# 分块读取日志文件时每块的大小
+READ_CHUNK_SIZE = 4 * 1024 * 1024
+
+# 作为索引使用的必需字面量的最小长度，过短的字面量起不到过滤作用
+MIN_LITERAL_LENGTH = 3
+
+_config_cache = {}
+_matcher_cache = {}
+
+
+def load_config(config_path=None):
+    """加载自动修复配置，同一路径只读取一次"""
+    config_path = Path(config_path or os.environ.get('AUTO_FIX_CONFIG', DEFAULT_CONFIG_PATH))
+    key = str(config_path)
+    if key not in _config_cache:
+        try:
+            with open(config_path, 'r', encoding='utf-8') as f:
+                _config_cache[key] = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"警告: 无法读取配置文件 {config_path}: {str(e)}")
+            _config_cache[key] = {}
+    return _config_cache[key]
+
+
+def load_fix_rules(config_path=None):
+    """编译 common_fixes 中的错误模式"""
+    rules = []
+    for index, entry in enumerate(load_config(config_path).get('common_fixes', [])):
+        flags = re.IGNORECASE if entry.get('ignore_case') else 0
+        try:
+            pattern = re.compile(entry['error_pattern'], flags)
+        except (KeyError, re.error) as e:
+            print(f"警告: 忽略无效的修复规则 {entry}: {str(e)}")
+            continue
+        rules.append({
+            'pattern': pattern,
+            'fix_action': entry.get('fix_action'),
+            'description': entry.get('description', ''),
+            'fatal': bool(entry.get('fatal', False)),
+            'priority': int(entry.get('priority', 0)),
+            'index': index,
+        })
+    return rules
+
+
+def extract_literal(pattern):
+    """提取正则中任何匹配都必须包含的最长字面量，无法提取时返回None"""
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except (re.error, TypeError):
+        return None
+
+    # 只看顶层顺序结构中连续的LITERAL，分支、重复等结构处截断
+    best = ''
+    current = []
+    for op, av in parsed:
+        if op is sre_parse.LITERAL:
+            current.append(chr(av))
+            continue
+        if len(current) > len(best):
+            best = ''.join(current)
+        current = []
+    if len(current) > len(best):
+        best = ''.join(current)
+
+    if len(best) < MIN_LITERAL_LENGTH:
+        return None
+    return best.lower() if pattern.flags & re.IGNORECASE else best
+
+
+# 可以匹配换行符的字符类别
+NEWLINE_CATEGORIES = {
+    'CATEGORY_SPACE', 'CATEGORY_NOT_DIGIT', 'CATEGORY_NOT_WORD', 'CATEGORY_LINEBREAK',
+    'CATEGORY_UNI_SPACE', 'CATEGORY_UNI_NOT_DIGIT', 'CATEGORY_UNI_NOT_WORD', 'CATEGORY_UNI_LINEBREAK',
+}
+
+
+def _set_matches_newline(items):
+    """字符集合 [...] 是否包含换行符"""
+    negate = bool(items) and items[0][0] is sre_parse.NEGATE
+    contains = False
+    for op, av in items:
+        if op is sre_parse.LITERAL and av == 10:
+            contains = True
+        elif op is sre_parse.RANGE and av[0] <= 10 <= av[1]:
+            contains = True
+        elif op is sre_parse.CATEGORY and str(av) in NEWLINE_CATEGORIES:
+            contains = True
+    return contains != negate
+
+
+def _may_match_newline(items, dotall):
+    """解析后的正则中是否有可能匹配换行符的部分"""
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            if av == 10:
+                return True
+        elif op is sre_parse.NOT_LITERAL:
+            if av != 10:
+                return True
+        elif op is sre_parse.ANY:
+            if dotall:
+                return True
+        elif op is sre_parse.IN:
+            if _set_matches_newline(av):
+                return True
+        elif op is sre_parse.SUBPATTERN:
+            if _may_match_newline(av[-1], dotall or bool(av[1] & re.DOTALL)):
+                return True
+        else:
+            # 分支、重复、断言等结构递归检查其中的子模式
+            nested = av if isinstance(av, (list, tuple)) else ()
+            for item in nested:
+                children = item if isinstance(item, list) else [item]
+                for child in children:
+                    if isinstance(child, sre_parse.SubPattern) and _may_match_newline(child, dotall):
+                        return True
+    return False
+
+
+def spans_lines(pattern):
+    """正则的匹配是否可能跨越多行，无法解析时按可能跨行处理"""
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except (re.error, TypeError):
+        return True
+    return _may_match_newline(parsed, bool(parsed.state.flags & re.DOTALL))
+
+
+class RuleMatcher:
+    """编译后的规则索引，单次调用即可对日志分类
+
+    每条规则在编译时提取一个必需字面量，全部字面量转为小写后合并为一个分支正则，
+    在小写的日志上单遍扫描定位候选位置，只对候选所在的行运行规则正则进行确认，命中的规则移出分支正则。
+    无法提取字面量的规则和可能跨行匹配的规则合并为一个非捕获分组的组合正则，
+    在整段文本上搜索，命中后把已确定的规则移出组合正则并从同一位置继续扫描，扫描位置单调前进。
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self._literal_plan = []
+        self._regex_positions = []
+        self._combined_cache = {}
+        self._literal_cache = {}
+
+        for position, rule in enumerate(self.rules):
+            literal = extract_literal(rule['pattern'])
+            # 跨行的匹配可能从字面量所在行之前开始，只在候选行上确认会漏掉
+            if literal is None or spans_lines(rule['pattern']):
+                self._regex_positions.append(position)
+            else:
+                # 区分大小写的字面量也按小写查找，多出的候选由规则正则排除
+                self._literal_plan.append((position, literal.lower()))
+
+    def _combined(self, active):
+        """获取由尚未命中的正则规则组成的组合正则"""
+        key = tuple(active)
+        combined = self._combined_cache.get(key)
+        if combined is None:
+            alternatives = []
+            for position in active:
+                pattern = self.rules[position]['pattern']
+                # 大小写选项通过局部标志保留
+                if pattern.flags & re.IGNORECASE:
+                    alternatives.append(f"(?i:{pattern.pattern})")
+                else:
+                    alternatives.append(f"(?:{pattern.pattern})")
+            try:
+                combined = re.compile('|'.join(alternatives))
+            except re.error:
+                # 规则之间的分组名或反向引用冲突时退回逐条匹配
+                combined = False
+            self._combined_cache[key] = combined
+        return combined
+
+    def _literals(self, plan, flags):
+        """获取由尚未命中的规则的字面量组成的分支正则"""
+        key = (tuple(position for position, _ in plan), flags)
+        combined = self._literal_cache.get(key)
+        if combined is None:
+            combined = re.compile('|'.join(re.escape(literal) for _, literal in plan), flags)
+            self._literal_cache[key] = combined
+        return combined
+
+    def _scan(self, text, offset, found, active):
+        """扫描一段文本，命中的规则记录到found并从active中移除"""
+        self._scan_literals(text, offset, found, active)
+
+        regex_active = [position for position in self._regex_positions if position in active]
+        pos = 0
+        while regex_active:
+            combined = self._combined(regex_active)
+            if combined is False:
+                for position in regex_active:
+                    match_pos = self._search_rule(position, text, 0, len(text))
+                    if match_pos is not None:
+                        self._record(found, self.rules[position], text, match_pos, offset)
+                        active.discard(position)
+                return
+            m = combined.search(text, pos)
+            if m is None:
+                return
+            pos = m.start()
+            hits = [position for position in regex_active
+                    if self.rules[position]['pattern'].match(text, pos)]
+            if not hits:
+                # 锚定匹配与组合正则的语义不一致时（如使用了^等断言）逐条确认
+                hits = [position for position in regex_active
+                        if self._search_rule(position, text, pos, len(text)) is not None]
+                if not hits:
+                    return
+            for position in hits:
+                self._record(found, self.rules[position], text, pos, offset)
+                active.discard(position)
+                regex_active.remove(position)
+
+    def _search_rule(self, position, text, start, end):
+        """在指定范围内运行规则正则，返回命中位置"""
+        m = self.rules[position]['pattern'].search(text, start, end)
+        return m.start() if m else None
+
+    def _scan_literals(self, text, offset, found, active):
+        """单遍扫描全部字面量，在候选行上确认对应的规则；按位置前进，每条规则的首个命中行最先被确认"""
+        plan = [item for item in self._literal_plan if item[0] in active]
+        if not plan:
+            return
+        haystack = text.lower()
+        flags = 0
+        if len(haystack) != len(text):
+            # 个别Unicode字符小写后长度变化，位置无法对应，改为在原文上忽略大小写查找
+            haystack = text
+            flags = re.IGNORECASE
+        # 每条规则已经确认过的最后一行，同一行中重复出现的字面量不再确认
+        checked = {}
+        pos = 0
+        while plan:
+            m = self._literals(plan, flags).search(haystack, pos)
+            if m is None:
+                return
+            index = m.start()
+            line_start = text.rfind('\n', 0, index) + 1
+            line_end = text.find('\n', index)
+            if line_end == -1:
+                line_end = len(text)
+            hits = []
+            for item in plan:
+                position, literal = item
+                if checked.get(position) == line_end or haystack[index:index + len(literal)].lower() != literal:
+                    continue
+                checked[position] = line_end
+                match_pos = self._search_rule(position, text, line_start, line_end)
+                if match_pos is not None:
+                    self._record(found, self.rules[position], text, match_pos, offset)
+                    active.discard(position)
+                    hits.append(item)
+            for item in hits:
+                plan.remove(item)
+            pos = index + 1
+
+    @staticmethod
+    def _record(found, rule, text, position, offset):
+        """记录规则的首次命中位置和所在行"""
+        line_start = text.rfind('\n', 0, position) + 1
+        line_end = text.find('\n', position)
+        if line_end == -1:
+            line_end = len(text)
+        found.append({
+            'rule': rule,
+            'first_offset': offset + position,
+            'first_line': text[line_start:line_end],
+        })
+
+    @staticmethod
+    def _rank(found):
+        """按优先级从高到低排序，优先级相同时先出现的在前"""
+        return sorted(found, key=lambda item: (-item['rule']['priority'], item['first_offset']))
+
+    def classify(self, text):
+        """对整段日志分类，返回按优先级排序的命中列表"""
+        found = []
+        if text:
+            self._scan(text, 0, found, set(range(len(self.rules))))
+        return self._rank(found)
+
+    def classify_file(self, log_path, chunk_size=READ_CHUNK_SIZE):
+        """分块读取日志文件并分类，内存占用与块大小成正比"""
+        found = []
+        active = set(range(len(self.rules)))
+        offset = 0
+        remainder = ''
+        with open(log_path, 'r', encoding='utf-8', errors='replace') as f:
+            while active:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                # 只扫描完整的行，末尾不完整的行留到下一块
+                chunk = remainder + chunk
+                cut = chunk.rfind('\n') + 1
+                if cut == 0:
+                    remainder = chunk
+                    continue
+                self._scan(chunk[:cut], offset, found, active)
+                offset += cut
+                remainder = chunk[cut:]
+        if remainder and active:
+            self._scan(remainder, offset, found, active)
+        return self._rank(found)
+
+
+def get_matcher(config_path=None):
+    """获取指定配置对应的规则匹配器，同一配置只编译一次"""
+    key = str(config_path or os.environ.get('AUTO_FIX_CONFIG', DEFAULT_CONFIG_PATH))
+    if key not in _matcher_cache:
+        _matcher_cache[key] = RuleMatcher(load_fix_rules(config_path))
+    return _matcher_cache[key]
+
+
+def reload():
+    """丢弃缓存的配置和规则匹配器，下次使用时重新读取配置文件"""
+    _config_cache.clear()
+    _matcher_cache.clear()
+
+
+def early_abort_enabled(config_path=None):
+    """是否在匹配到致命错误时提前终止构建，环境变量BUILD_EARLY_ABORT优先"""
+    env_value = os.environ.get('BUILD_EARLY_ABORT')
+    if env_value is not None:
+        return env_value.lower() in ('1', 'true', 'yes', 'on')
+    system_config = load_config(config_path).get('auto_fix_system', {})
+    return bool(system_config.get('early_abort_on_fatal', False))
+
+
+def make_fatal_matcher(rules):
+    """生成逐行匹配致命错误的回调，匹配成功时返回优先级最高的致命规则"""
+    fatal_matcher = RuleMatcher([rule for rule in rules if rule['fatal']])
+
+    def match_line(line):
+        matches = fatal_matcher.classify(line)
+        return matches[0]['rule'] if matches else None
+
+    return match_line
+
+
+def match_rule(error_msg, rules=None):
+    """返回匹配错误信息且优先级最高的规则"""
+    matcher = get_matcher() if rules is None else RuleMatcher(rules)
+    matches = matcher.classify(error_msg)
+    return matches[0]['rule'] if matches else None
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+有状态的修复尝试调度
+每次修复前后对工作区状态（工具链环境变量、jni/源码、libdobby.a）取指纹，
+修复动作没有改变任何状态时不重新构建，直接尝试优先级队列中的下一个修复动作，
+并记录哪些修复动作真正改变了构建结果，用于调整以后同优先级动作的顺序；
+修复成功的失败存入相似度索引，之后相似的失败即使没有匹配到规则也会尝试同样的修复动作
+"""
+
+import os
+import json
+import hashlib
+from pathlib import Path
+
+import build_trace
+import failure_index
+import fix_rules
+import log_reducer
+import run_history
+
+
+JNI_DIR = Path("jni")
+
+# 影响ndk-build结果的环境变量
+TOOLCHAIN_ENV = ['ANDROID_NDK_HOME', 'NDK_HOME', 'PATH', 'COMPILER_CACHE']
+
+# jni/下不属于模块源码的目录：Dobby源码只通过编译出的libdobby.a影响构建，其余为构建产物
+IGNORED_SOURCE_DIRS = {'Dobby', 'build-matrix', 'build-profile', 'libs', 'obj'}
+
+# 相似度索引建议的修复动作的优先级，排在所有匹配到的规则之后
+SIMILAR_PRIORITY = 0
+
+# 修复动作效果记录
+DEFAULT_HISTORY_PATH = Path.home() / ".cache" / "hyperos_sf_bypass" / "fix_history.json"
+
+
+def get_history_path():
+    """获取修复动作效果记录的路径"""
+    return Path(os.environ.get('FIX_HISTORY_PATH', DEFAULT_HISTORY_PATH))
+
+
+def _hash_file(digest, file_path):
+    """把文件内容加入哈希，无法读取的文件只记录路径"""
+    try:
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+    except OSError:
+        pass
+    digest.update(b'\0')
+
+
+def workspace_fingerprint(jni_dir=JNI_DIR):
+    """返回工作区各组成部分的指纹: toolchain / sources / dobby"""
+    jni_dir = Path(jni_dir)
+
+    toolchain = hashlib.sha256()
+    for name in TOOLCHAIN_ENV:
+        toolchain.update(f"{name}={os.environ.get(name, '')}\0".encode('utf-8'))
+
+    sources = hashlib.sha256()
+    dobby = hashlib.sha256()
+    for root, dirs, files in os.walk(jni_dir):
+        dirs[:] = sorted(d for d in dirs if d not in IGNORED_SOURCE_DIRS)
+        for name in sorted(files):
+            file_path = Path(root) / name
+            rel_path = file_path.relative_to(jni_dir).as_posix()
+            # 预编译的静态库单独计入dobby部分
+            digest = dobby if name.endswith('.a') else sources
+            digest.update(rel_path.encode('utf-8') + b'\0')
+            _hash_file(digest, file_path)
+
+    return {
+        'toolchain': toolchain.hexdigest(),
+        'sources': sources.hexdigest(),
+        'dobby': dobby.hexdigest(),
+    }
+
+
+def changed_components(before, after):
+    """返回两次指纹之间发生变化的部分"""
+    return [name for name in before if before[name] != after.get(name)]
+
+
+def error_signature(error_msg):
+    """构建错误的指纹，用于判断修复后错误是否发生了变化"""
+    return log_reducer.fingerprint(log_reducer.reduce_log(error_msg))
+
+
+def load_history():
+    """读取修复动作效果记录"""
+    try:
+        with open(get_history_path(), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_history(history):
+    """保存修复动作效果记录"""
+    history_path = get_history_path()
+    try:
+        history_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = history_path.with_name(f"{history_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(history, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, history_path)
+    except OSError as e:
+        print(f"警告: 无法写入修复记录: {str(e)}")
+
+
+class FixScheduler:
+    """按优先级队列执行修复动作，只在工作区状态变化后重新构建"""
+
+    def __init__(self, actions, build, matcher=None, max_rebuilds=3):
+        # 修复动作名称到函数的映射，函数返回是否执行成功
+        self.actions = actions
+        # 构建函数，返回(是否成功, 错误输出)
+        self.build = build
+        self.matcher = matcher or fix_rules.get_matcher()
+        self.max_rebuilds = max_rebuilds
+        self.history = load_history()
+        # 本次运行中每个修复动作的执行结果
+        self.attempts = []
+        # 已在某个工作区状态下尝试过的(动作, 状态)组合
+        self._tried = set()
+
+    def _effectiveness(self, action):
+        """修复动作历史上改变构建结果的比例"""
+        stats = self.history.get(action)
+        if not stats or not stats.get('rebuilds'):
+            return 0.0
+        return (stats.get('fixed', 0) + stats.get('error_changed', 0)) / stats['rebuilds']
+
+    def plan(self, error_msg, state_key):
+        """根据错误日志生成修复队列：按规则优先级排序，同优先级时历史上更有效的动作优先"""
+        queue = []
+        seen = set()
+        matches = self.matcher.classify(error_msg)
+        run_history.record_classification(matches)
+        for match in matches:
+            rule = match['rule']
+            action = rule['fix_action']
+            if action not in self.actions or action in seen or (action, state_key) in self._tried:
+                continue
+            seen.add(action)
+            queue.append(rule)
+        # 相似的历史失败被某个修复动作解决过时，也把该动作加入队列
+        for suggestion in failure_index.suggested_fixes(failure_index.find_similar(error_msg)):
+            action = suggestion['fix']
+            if action not in self.actions or action in seen or (action, state_key) in self._tried:
+                continue
+            seen.add(action)
+            queue.append({
+                'description': f"与历史失败相似 (相似度 {suggestion['similarity']:.0%}，解决过 {suggestion['count']} 次)",
+                'fix_action': action,
+                'priority': SIMILAR_PRIORITY,
+            })
+        # 排序是稳定的，同优先级且同效果时保持错误在日志中出现的顺序
+        queue.sort(key=lambda rule: (-rule['priority'], -self._effectiveness(rule['fix_action'])))
+        return queue
+
+    def _record(self, rule, outcome, changed):
+        """记录一次修复动作的结果"""
+        action = rule['fix_action']
+        self.attempts.append({
+            'action': action,
+            'description': rule['description'],
+            'outcome': outcome,
+            'changed': changed,
+        })
+        run_history.record_fix_attempt(self.attempts[-1])
+        stats = self.history.setdefault(action, {})
+        stats['runs'] = stats.get('runs', 0) + 1
+        stats[outcome] = stats.get(outcome, 0) + 1
+        if outcome in ('fixed', 'error_changed', 'no_effect'):
+            stats['rebuilds'] = stats.get('rebuilds', 0) + 1
+
+    def run(self, error_msg):
+        """执行修复队列，返回(是否构建成功, 最后的错误输出)"""
+        state = workspace_fingerprint()
+        state_key = tuple(sorted(state.items()))
+        signature = error_signature(error_msg)
+        queue = self.plan(error_msg, state_key)
+        rebuilds = 0
+        success = False
+
+        try:
+            while queue and rebuilds < self.max_rebuilds:
+                rule = queue.pop(0)
+                action = rule['fix_action']
+                self._tried.add((action, state_key))
+                print(f"检测到{rule['description']}，执行修复动作: {action}")
+
+                with build_trace.span(f'fix.{action}', category='fix'):
+                    action_ok = self.actions[action]()
+                if not action_ok:
+                    print(f"修复动作 {action} 执行失败，尝试下一个修复动作")
+                    self._record(rule, 'failed', [])
+                    continue
+
+                new_state = workspace_fingerprint()
+                changed = changed_components(state, new_state)
+                if not changed:
+                    print(f"修复动作 {action} 未改变工作区状态，跳过重新构建")
+                    self._record(rule, 'unchanged', [])
+                    continue
+
+                rebuilds += 1
+                print(f"工作区已变化 ({', '.join(changed)})，第 {rebuilds} 次重新构建...")
+                fixed_error = error_msg
+                success, error_msg = self.build()
+                if success:
+                    self._record(rule, 'fixed', changed)
+                    failure_index.record_fix(fixed_error, action, 'fix_action')
+                    break
+
+                new_signature = error_signature(error_msg)
+                self._record(rule, 'error_changed' if new_signature != signature else 'no_effect', changed)
+                # 状态和错误都可能已经变化，按新的错误重新生成队列
+                state = new_state
+                state_key = tuple(sorted(state.items()))
+                signature = new_signature
+                queue = self.plan(error_msg, state_key)
+        finally:
+            save_history(self.history)
+
+        return success, error_msg
+
+    def print_summary(self):
+        """打印本次运行中各修复动作的效果"""
+        if not self.attempts:
+            return
+        labels = {
+            'fixed': "构建成功",
+            'error_changed': "错误已变化",
+            'no_effect': "无效果",
+            'unchanged': "未改变工作区，已跳过构建",
+            'failed': "执行失败",
+        }
+        print("\n修复动作记录:")
+        for attempt in self.attempts:
+            changed = f" [{', '.join(attempt['changed'])}]" if attempt['changed'] else ""
+            print(f"  {attempt['action']:<28} {labels[attempt['outcome']]}{changed}")
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+构建日志缩减
+在分析之前对构建日志去重、折叠头文件包含链，只保留前N个不同的错误块及产生它们的编译命令，
+并限制总字节数，使分析请求的大小与构建日志的大小无关；
+错误块由diagnostics的流式解析结果生成，流式构建的结果可以直接使用构建时已经解析出的诊断
+"""
+
+import os
+import re
+import sys
+import argparse
+from collections import deque
+
+import diagnostics
+import error_fingerprint
+
+
+# 默认保留的错误块数量、每块的上下文行数和总字节预算
+DEFAULT_MAX_BLOCKS = 5
+DEFAULT_CONTEXT_LINES = diagnostics.DEFAULT_CONTEXT_LINES
+DEFAULT_MAX_BYTES = 12000
+
+# 没有识别出错误时保留的日志尾部行数
+TAIL_LINES = 50
+
+# 缩减结果中的统计行、截断提示、编译命令行和重复次数，取决于日志长度和并行构建的输出顺序
+SUMMARY_PREFIX = "[日志缩减]"
+COMMAND_PREFIX = "$ "
+REPEAT_RE = re.compile(r' \(重复 \d+ 次\)$')
+
+
+def _env_int(name, default):
+    """读取整数类型的环境变量"""
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _collapse_includes(include_chain):
+    """折叠头文件包含链，只保留最外层和最内层"""
+    if len(include_chain) <= 2:
+        return list(include_chain)
+    return [
+        include_chain[0],
+        f"    ... (省略 {len(include_chain) - 2} 层包含)",
+        include_chain[-1],
+    ]
+
+
+def _group_errors(items, max_blocks):
+    """按归一化后的错误行合并错误诊断，返回(保留的错误块, 错误总数, 不同错误数)"""
+    groups = {}
+    blocks = []
+    total_errors = 0
+    for item in items:
+        if not item.is_error:
+            continue
+        total_errors += item.count
+        text = item.text or diagnostics.format_diagnostic(item)
+        key = error_fingerprint.normalize_error(text)
+        block = groups.get(key)
+        if block is not None:
+            block['count'] += item.count
+            continue
+        block = groups[key] = {'diagnostic': item, 'text': text, 'count': item.count}
+        # 超出数量的错误只计数，不保留内容
+        if len(blocks) < max_blocks:
+            blocks.append(block)
+    return blocks, total_errors, len(groups)
+
+
+def reduce_diagnostics(items, tail=(), max_blocks=None, max_bytes=None, stats=''):
+    """由解析出的诊断生成缩减后的文本，没有错误时退回到日志尾部
+
+    stats为统计行中错误数之前的内容(原始日志的行数和字节数)，流式构建不统计时为空
+    """
+    if max_blocks is None:
+        max_blocks = _env_int('ANALYSIS_MAX_BLOCKS', DEFAULT_MAX_BLOCKS)
+    if max_bytes is None:
+        max_bytes = _env_int('ANALYSIS_MAX_BYTES', DEFAULT_MAX_BYTES)
+
+    blocks, total_errors, distinct = _group_errors(items, max_blocks)
+    header = (f"{SUMMARY_PREFIX} {stats}错误 {total_errors} 处，"
+              f"不同错误 {distinct} 个，保留 {len(blocks)} 个")
+
+    if not blocks:
+        tail = list(tail)[-TAIL_LINES:]
+        sections = [[diagnostics.clip(line.rstrip('\r\n')) for line in tail]]
+    else:
+        sections = []
+        for index, block in enumerate(blocks, 1):
+            item = block['diagnostic']
+            section = [f"### 错误 {index}" + (f" (重复 {block['count']} 次)" if block['count'] > 1 else "")]
+            if item.command:
+                section.append(f"{COMMAND_PREFIX}{diagnostics.clip(item.command)}")
+            section.extend(_collapse_includes([f"In file included from {file}:{line}:"
+                                               for file, line in item.include_stack]))
+            section.append(block['text'])
+            section.extend(item.context)
+            sections.append(section)
+
+    return _apply_budget(header, sections, max_bytes)
+
+
+def reduce_lines(lines, max_blocks=None, max_bytes=None, context_lines=DEFAULT_CONTEXT_LINES):
+    """逐行处理构建日志，返回缩减后的文本
+
+    内存占用只与保留的错误块数量和不同诊断的数量有关，与日志大小无关
+    """
+    parser = diagnostics.DiagnosticParser(context_lines=context_lines)
+    total_lines = 0
+    total_bytes = 0
+    tail = deque(maxlen=TAIL_LINES)
+    for raw_line in lines:
+        total_lines += 1
+        total_bytes += len(raw_line.encode('utf-8', errors='replace'))
+        line = raw_line.rstrip('\r\n')
+        tail.append(line)
+        parser.feed(line)
+    parser.close()
+    return reduce_diagnostics(parser.diagnostics.values(), tail, max_blocks, max_bytes,
+                              stats=f"原始 {total_lines} 行 / {total_bytes} 字节，")
+
+
+def reduce_result(result, max_blocks=None, max_bytes=None):
+    """缩减流式构建的结果，直接使用构建时解析出的诊断，不重新扫描输出"""
+    return reduce_diagnostics(result.diagnostics, result.tail, max_blocks, max_bytes)
+
+
+def _apply_budget(header, sections, max_bytes):
+    """按字节预算拼接输出，超出预算的内容被截断"""
+    output = [header]
+    used = len(header.encode('utf-8')) + 1
+    truncated = False
+
+    for section in sections:
+        for line in section:
+            size = len(line.encode('utf-8')) + 1
+            if max_bytes and used + size > max_bytes:
+                truncated = True
+                break
+            output.append(line)
+            used += size
+        if truncated:
+            break
+        output.append('')
+        used += 1
+
+    if truncated:
+        output.append(f"{SUMMARY_PREFIX} 已达到字节预算，其余内容被省略")
+    return '\n'.join(output).rstrip('\n') + '\n'
+
+
+def error_text(reduced):
+    """缩减结果中只由保留的错误块决定的部分
+
+    去掉统计行、截断提示、重复次数和编译命令行(ndk-build的进度行与并行构建的输出顺序有关)，
+    同一个错误在长短不同的日志中得到相同的文本
+    """
+    lines = []
+    for line in reduced.splitlines():
+        if line.startswith((SUMMARY_PREFIX, COMMAND_PREFIX)):
+            continue
+        lines.append(REPEAT_RE.sub('', line))
+    return '\n'.join(lines)
+
+
+def fingerprint(reduced, salt=''):
+    """缩减后日志的错误指纹，分析缓存、修复调度、批量分析和运行历史使用同一个指纹"""
+    return error_fingerprint.fingerprint(error_text(reduced), salt=salt)
+
+
+def reduce_log(text, max_blocks=None, max_bytes=None):
+    """缩减一段构建日志文本"""
+    return reduce_lines((text or '').splitlines(), max_blocks=max_blocks, max_bytes=max_bytes)
+
+
+def reduce_file(log_path, max_blocks=None, max_bytes=None):
+    """逐行读取并缩减构建日志文件"""
+    with open(log_path, 'r', encoding='utf-8', errors='replace') as f:
+        return reduce_lines(f, max_blocks=max_blocks, max_bytes=max_bytes)
+
+
+def main(argv=None):
+    """命令行入口: 缩减日志文件并输出到标准输出"""
+    parser = argparse.ArgumentParser(description="构建日志缩减")
+    parser.add_argument('log', help="构建日志文件路径，- 表示标准输入")
+    parser.add_argument('--max-blocks', type=int, default=None, help="保留的不同错误块数量")
+    parser.add_argument('--max-bytes', type=int, default=None, help="输出的字节预算")
+    args = parser.parse_args(argv)
+
+    if args.log == '-':
+        reduced = reduce_lines(sys.stdin, max_blocks=args.max_blocks, max_bytes=args.max_bytes)
+    else:
+        try:
+            reduced = reduce_file(args.log, max_blocks=args.max_blocks, max_bytes=args.max_bytes)
+        except OSError as e:
+            print(f"错误: 无法读取日志: {str(e)}")
+            return 1
+    sys.stdout.write(reduced)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+多ABI并行矩阵构建
+同时为多个ABI编译Dobby和liblsfbypass.so，每个ABI使用独立的输出目录，
+所有并发的ndk-build通过GNU make的jobserver共享同一个全局CPU预算，结束后输出每个ABI的耗时
+"""
+
+import os
+import sys
+import time
+import select
+import shutil
+import argparse
+import platform
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import build_runner
+import build_trace
+import build_tuning
+import compiler_cache
+import dobby_build
+import dobby_source
+import preflight
+import run_history
+
+
+# 支持的ABI，以及未指定时构建的ABI
+SUPPORTED_ABIS = ['arm64-v8a', 'armeabi-v7a', 'x86_64', 'x86']
+DEFAULT_ABIS = ['arm64-v8a']
+
+JNI_DIR = Path("jni")
+DOBBY_SRC_DIR = JNI_DIR / "external" / "Dobby"
+# 各ABI独立的中间文件和输出目录
+MATRIX_DIR = JNI_DIR / "build-matrix"
+# 最终产物的位置，与build.sh的输出位置一致
+LIBS_DIR = JNI_DIR / "libs"
+
+MODULE_LIBRARY = "liblsfbypass.so"
+
+
+def get_abis():
+    """获取要构建的ABI列表"""
+    value = os.environ.get('BUILD_ABIS', '')
+    abis = [abi.strip() for abi in value.split(',') if abi.strip()]
+    return abis or list(DEFAULT_ABIS)
+
+
+def get_cpu_budget():
+    """获取所有并发构建共享的CPU预算，未设置BUILD_CPU_BUDGET时由自动调优决定"""
+    return build_tuning.choose_jobs('ndk-build')
+
+
+def find_ndk_build(ndk_path):
+    """查找ndk-build可执行文件"""
+    name = 'ndk-build.cmd' if platform.system().lower() == "windows" else 'ndk-build'
+    if ndk_path:
+        candidate = Path(ndk_path) / name
+        if candidate.exists():
+            return str(candidate)
+    return shutil.which(name)
+
+
+class JobServer:
+    """GNU make的jobserver令牌池，让多个并发的ndk-build共享同一个并行度上限
+
+    每个正在运行的make自带一个隐含的任务槽，管道中只放入其余的令牌；
+    某个ABI构建结束且没有等待中的ABI时，把它的任务槽作为令牌归还给仍在运行的构建。
+    不支持传递文件描述符的平台(Windows)退化为按并发数平分预算
+    """
+
+    def __init__(self, total, workers, builds=None):
+        self.total = total
+        self.workers = workers
+        # 还没有结束的构建数，用于计算不接入jobserver的构建可以取走的份额
+        self.unfinished = builds or workers
+        self._lock = threading.Lock()
+        self.enabled = os.name == 'posix'
+        self._read_fd = None
+        self._write_fd = None
+        if self.enabled:
+            self._read_fd, self._write_fd = os.pipe()
+            self._put(max(0, total - workers))
+
+    def _put(self, count):
+        """向管道中放入令牌"""
+        if count > 0:
+            os.write(self._write_fd, b'+' * count)
+
+    @property
+    def pass_fds(self):
+        """需要由make继承的文件描述符"""
+        return (self._read_fd, self._write_fd) if self.enabled else ()
+
+    def static_share(self):
+        """不使用jobserver时每个构建分到的并行度"""
+        return max(1, self.total // max(1, self.workers))
+
+    def make_env(self, base=None):
+        """ndk-build的环境变量，通过MAKEFLAGS接入jobserver"""
+        env = dict(os.environ if base is None else base)
+        if self.enabled:
+            env['MAKEFLAGS'] = f" -j --jobserver-auth={self._read_fd},{self._write_fd}"
+        return env
+
+    def make_args(self):
+        """ndk-build的并行参数；使用jobserver时不能再传-j，否则make会关闭jobserver"""
+        return [] if self.enabled else [f'-j{self.static_share()}']
+
+    def fair_share(self):
+        """不接入jobserver的构建最多占用的并行度: 预算由仍在并发竞争的构建平分"""
+        with self._lock:
+            competing = max(1, min(self.workers, self.unfinished))
+        return max(1, self.total // competing)
+
+    def finish_build(self):
+        """一个构建结束，之后的公平份额按剩余的构建计算"""
+        with self._lock:
+            self.unfinished -= 1
+
+    def acquire(self, limit):
+        """为不接入jobserver的构建(Dobby的cmake)从令牌池取出当前空闲的令牌，返回可用的并行度
+
+        除隐含的任务槽外最多取limit-1个令牌，不等待正在被其他构建占用的令牌；
+        取出的令牌在release之前不会被其他ABI的ndk-build使用，总并行度不超过预算
+        """
+        if not self.enabled:
+            return self.static_share()
+        taken = 0
+        while taken < limit - 1:
+            ready, _, _ = select.select([self._read_fd], [], [], 0)
+            if not ready:
+                break
+            taken += len(os.read(self._read_fd, 1))
+        return taken + 1
+
+    def release(self, jobs):
+        """归还acquire取出的令牌，隐含的任务槽留给随后的ndk-build"""
+        if self.enabled:
+            self._put(jobs - 1)
+
+    def release_slot(self):
+        """把一个结束的构建的任务槽归还给令牌池"""
+        if self.enabled:
+            self._put(1)
+
+    def close(self):
+        """关闭管道"""
+        if self.enabled:
+            os.close(self._read_fd)
+            os.close(self._write_fd)
+            self.enabled = False
+
+
+def build_dobby_for_abi(abi, ndk_path, jobs):
+    """为指定ABI准备Dobby库，返回库文件路径，失败时返回None"""
+    lib_path = JNI_DIR / "external" / abi / "libdobby.a"
+    if not DOBBY_SRC_DIR.exists():
+        if lib_path.exists():
+            return lib_path
+        print(f"[{abi}] 错误: Dobby源码不存在，且没有可用的预编译库")
+        return None
+    if not dobby_build.compile_dobby(DOBBY_SRC_DIR, ndk_path, [lib_path.resolve()], abi=abi,
+                                     api_level=dobby_build.DEFAULT_API_LEVEL, jobs=jobs, echo=False):
+        return None
+    return lib_path
+
+
+def run_ndk_build(abi, ndk_build, jobserver, cache_session):
+    """在独立的输出目录中为指定ABI运行ndk-build，返回StreamResult"""
+    out_dir = (MATRIX_DIR / abi).resolve()
+    cmd = [
+        ndk_build,
+        f'APP_ABI={abi}',
+        f'NDK_OUT={out_dir / "obj"}',
+        f'NDK_LIBS_OUT={out_dir / "libs"}',
+    ] + jobserver.make_args()
+    result = build_runner.run_streaming(
+        cmd,
+        cwd=JNI_DIR,
+        log_path=out_dir / "ndk-build.log",
+        echo=False,
+        env=jobserver.make_env(cache_session.env()),
+        pass_fds=jobserver.pass_fds
+    )
+    # 只构建一个ABI时整个CPU预算都属于这次ndk-build，结果可以用于调优
+    if jobserver.workers == 1:
+        build_tuning.record('ndk-build', jobserver.total, result)
+    return result
+
+
+def build_abi(abi, ndk_path, ndk_build, jobserver, cache_session):
+    """构建单个ABI，返回包含各阶段耗时的结果字典"""
+    result = {
+        'abi': abi,
+        'success': False,
+        'dobby_seconds': 0.0,
+        'ndk_seconds': 0.0,
+        'total_seconds': 0.0,
+        'output': None,
+        'log_path': None,
+        'error': None,
+    }
+    start_time = time.monotonic()
+    try:
+        print(f"[{abi}] 准备Dobby库...")
+        # Dobby的cmake构建不读取jobserver，先从令牌池中取出它要用的并行度；
+        # 最多取公平份额，否则第一个开始的ABI会取走全部令牌，其他ABI的构建只剩隐含的任务槽
+        jobs = jobserver.acquire(jobserver.fair_share())
+        try:
+            with build_trace.span('dobby', abi=abi, jobs=jobs):
+                dobby_lib = build_dobby_for_abi(abi, ndk_path, jobs)
+        finally:
+            jobserver.release(jobs)
+        result['dobby_seconds'] = time.monotonic() - start_time
+        if dobby_lib is None:
+            result['error'] = "Dobby库准备失败"
+            return result
+
+        print(f"[{abi}] 运行ndk-build...")
+        with build_trace.span('ndk-build', abi=abi):
+            stream = run_ndk_build(abi, ndk_build, jobserver, cache_session)
+        result['ndk_seconds'] = stream.elapsed
+        result['log_path'] = stream.log_path
+        if stream.returncode != 0:
+            result['error'] = stream.first_error_line or f"ndk-build退出码 {stream.returncode}"
+            print(f"[{abi}] 构建失败，日志: {stream.log_path}")
+            return result
+
+        built = MATRIX_DIR / abi / "libs" / abi / MODULE_LIBRARY
+        if not built.exists():
+            result['error'] = f"未找到构建产物 {built}"
+            return result
+        output = LIBS_DIR / abi / MODULE_LIBRARY
+        output.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(built, output)
+        result['output'] = str(output)
+        result['success'] = True
+        print(f"[{abi}] 构建完成: {output}")
+        return result
+    finally:
+        result['total_seconds'] = time.monotonic() - start_time
+
+
+def build_matrix(abis=None, cpu_budget=None):
+    """并行构建多个ABI，返回各ABI的结果列表（顺序与abis一致）"""
+    abis = abis or get_abis()
+    cpu_budget = cpu_budget or get_cpu_budget()
+    unsupported = [abi for abi in abis if abi not in SUPPORTED_ABIS]
+    if unsupported:
+        raise ValueError(f"不支持的ABI: {', '.join(unsupported)}")
+
+    ndk_path = preflight.run_preflight().ndk_path
+    ndk_build = find_ndk_build(ndk_path)
+    if ndk_build is None:
+        raise RuntimeError("未找到ndk-build，请检查NDK安装")
+
+    # 在并发构建之前统一检出Dobby源码，避免多个ABI同时检出
+    if any(not (JNI_DIR / "external" / abi / "libdobby.a").exists() for abi in abis):
+        dobby_source.materialize(DOBBY_SRC_DIR)
+
+    cache_session = compiler_cache.get_session()
+    # 每个并发构建至少占用一个任务槽
+    workers = max(1, min(len(abis), cpu_budget))
+    jobserver = JobServer(cpu_budget, workers, builds=len(abis))
+    started = [0]
+    lock = threading.Lock()
+
+    def run(abi):
+        with lock:
+            started[0] += 1
+        try:
+            return build_abi(abi, ndk_path, ndk_build, jobserver, cache_session)
+        finally:
+            # 没有等待中的ABI时，把任务槽让给仍在运行的构建
+            with lock:
+                jobserver.finish_build()
+                if started[0] >= len(abis):
+                    jobserver.release_slot()
+
+    print(f"矩阵构建: {', '.join(abis)} (CPU预算 {cpu_budget}，并发 {workers})")
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='matrix') as executor:
+            return list(executor.map(run, abis))
+    finally:
+        jobserver.close()
+
+
+def print_summary(results, wall_seconds, cpu_budget):
+    """打印每个ABI的耗时汇总"""
+    print("\n矩阵构建耗时:")
+    print(f"  {'ABI':<12} {'Dobby':>8} {'ndk-build':>10} {'合计':>8}  结果")
+    for result in results:
+        status = "成功" if result['success'] else f"失败: {result['error']}"
+        print(f"  {result['abi']:<12} {result['dobby_seconds']:>7.1f}s {result['ndk_seconds']:>9.1f}s "
+              f"{result['total_seconds']:>7.1f}s  {status}")
+    serial_seconds = sum(result['total_seconds'] for result in results)
+    print(f"  总耗时 {wall_seconds:.1f}s，各ABI耗时之和 {serial_seconds:.1f}s，CPU预算 {cpu_budget}")
+
+
+def main(argv=None):
+    """命令行入口: 并行构建多个ABI并打印耗时汇总"""
+    parser = argparse.ArgumentParser(description="多ABI并行矩阵构建")
+    parser.add_argument('--abis', default=None,
+                        help=f"逗号分隔的ABI列表，可选: {', '.join(SUPPORTED_ABIS)}，all表示全部")
+    parser.add_argument('--jobs', type=int, default=None, help="所有ABI共享的CPU预算")
+    args = parser.parse_args(argv)
+
+    if args.abis == 'all':
+        abis = list(SUPPORTED_ABIS)
+    elif args.abis:
+        abis = [abi.strip() for abi in args.abis.split(',') if abi.strip()]
+    else:
+        abis = get_abis()
+    cpu_budget = args.jobs or get_cpu_budget()
+
+    start_time = time.monotonic()
+    try:
+        results = build_matrix(abis, cpu_budget)
+    except (ValueError, RuntimeError) as e:
+        print(f"错误: {str(e)}")
+        return 1
+    print_summary(results, time.monotonic() - start_time, cpu_budget)
+    # 各ABI并发编译，统计只能按整次运行汇总
+    compiler_cache.get_session().report()
+    build_trace.finish()
+    success = all(result['success'] for result in results)
+    run_history.finish('build', success)
+    return 0 if success else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
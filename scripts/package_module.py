@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Magisk模块打包
+把 module.prop、service.sh、sepolicy.rule、zygisk_next.xml、白名单和各ABI的 liblsfbypass.so 打包为可刷入的zip；
+以内容哈希清单记录每个条目，只重新压缩变化的条目，较大的条目并行压缩，
+条目顺序、时间戳和权限固定，相同的输入总是得到逐字节相同的zip
+"""
+
+import os
+import sys
+import json
+import stat
+import time
+import zlib
+import struct
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import build_trace
+import matrix_build
+import whitelist_table
+
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DIST_DIR = REPO_ROOT / "dist"
+MANIFEST_PATH = DIST_DIR / ".package-manifest.json"
+MEMBER_CACHE_DIR = DIST_DIR / ".package-cache"
+
+# 模块根目录下的文件: (源文件, zip中的路径, 权限)
+MODULE_FILES = [
+    ('module.prop', 'module.prop', 0o644),
+    ('service.sh', 'service.sh', 0o755),
+    ('sepolicy.rule', 'sepolicy.rule', 0o644),
+    ('zygisk_next.xml', 'zygisk_next.xml', 0o644),
+    ('whitelist.txt', 'whitelist.txt', 0o644),
+    ('whitelist.bin', 'whitelist.bin', 0o644),
+]
+
+DEFAULT_COMPRESSION_LEVEL = 9
+# 超过该大小的条目放到线程池中压缩(zlib压缩时释放GIL)
+PARALLEL_THRESHOLD = 256 * 1024
+
+# zip格式的固定字段
+LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+END_RECORD = struct.Struct('<IHHHHIIH')
+LOCAL_SIGNATURE = 0x04034b50
+CENTRAL_SIGNATURE = 0x02014b50
+END_SIGNATURE = 0x06054b50
+ZIP_VERSION = 20
+MADE_BY_UNIX = (3 << 8) | ZIP_VERSION
+METHOD_STORED = 0
+METHOD_DEFLATED = 8
+
+
+def _env_int(name, default):
+    """读取整数类型的环境变量"""
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def dos_timestamp():
+    """zip条目使用的固定时间戳，设置SOURCE_DATE_EPOCH时使用该时间，否则为1980-01-01"""
+    epoch = _env_int('SOURCE_DATE_EPOCH', 0)
+    year, month, day, hour, minute, second = time.gmtime(epoch)[:6]
+    if year < 1980:
+        return 0, (1 << 5) | 1
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+
+def read_module_version():
+    """从module.prop读取版本号"""
+    try:
+        with open(REPO_ROOT / "module.prop", 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('version='):
+                    return line.split('=', 1)[1].strip()
+    except OSError:
+        pass
+    return 'dev'
+
+
+def collect_entries(abis=None):
+    """列出要打包的条目，返回按zip中路径排序的[(zip中的路径, 源文件, 权限)]"""
+    entries = []
+    for source, arcname, mode in MODULE_FILES:
+        path = REPO_ROOT / source
+        if not path.exists():
+            raise FileNotFoundError(f"缺少模块文件 {source}")
+        entries.append((arcname, path, mode))
+
+    libs_dir = REPO_ROOT / matrix_build.LIBS_DIR
+    found = []
+    for abi in abis or matrix_build.SUPPORTED_ABIS:
+        lib_path = libs_dir / abi / matrix_build.MODULE_LIBRARY
+        if lib_path.exists():
+            found.append(abi)
+            entries.append((f"lib/{abi}/{matrix_build.MODULE_LIBRARY}", lib_path, 0o644))
+        elif abis:
+            raise FileNotFoundError(f"未找到 {abi} 的构建产物 {lib_path}")
+    if not found:
+        raise FileNotFoundError(f"{libs_dir} 下没有任何ABI的 {matrix_build.MODULE_LIBRARY}，请先构建")
+    return sorted(entries)
+
+
+def load_manifest(path=None):
+    """读取上次打包的清单"""
+    path = path or MANIFEST_PATH
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(manifest, path=None):
+    """原子地写出清单"""
+    path = path or MANIFEST_PATH
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def hash_file(path, previous=None):
+    """计算文件的sha256；大小和修改时间与上次清单相同时直接沿用上次的哈希"""
+    st = os.stat(path)
+    if previous and previous.get('size') == st.st_size and previous.get('mtime_ns') == st.st_mtime_ns:
+        return previous['sha256'], st
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest(), st
+
+
+def _member_path(sha256, level):
+    """压缩后的条目在缓存中的路径"""
+    return MEMBER_CACHE_DIR / f"{sha256}-{level}.deflate"
+
+
+def compress_member(source, sha256, level):
+    """压缩一个条目并存入缓存，压缩后没有变小时改为不压缩，返回条目信息"""
+    with open(source, 'rb') as f:
+        data = f.read()
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data) + compressor.flush()
+    method = METHOD_DEFLATED
+    if len(compressed) >= len(data):
+        compressed = data
+        method = METHOD_STORED
+    member_path = _member_path(sha256, level)
+    tmp_path = member_path.with_name(f"{member_path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(compressed)
+    os.replace(tmp_path, member_path)
+    return {
+        'crc32': zlib.crc32(data),
+        'size': len(data),
+        'compressed_size': len(compressed),
+        'method': method,
+    }
+
+
+def _write_archive(output, members):
+    """按顺序写出zip，members为[(zip中的路径, 权限, 条目信息, 压缩数据路径)]，返回文件的sha256"""
+    mod_time, mod_date = dos_timestamp()
+    digest = hashlib.sha256()
+    central = []
+    offset = 0
+    tmp_path = output.with_name(output.name + '.tmp')
+
+    def write(f, data):
+        f.write(data)
+        digest.update(data)
+
+    with open(tmp_path, 'wb') as f:
+        for arcname, mode, info, member_path in members:
+            name = arcname.encode('utf-8')
+            write(f, LOCAL_HEADER.pack(
+                LOCAL_SIGNATURE, ZIP_VERSION, 0, info['method'], mod_time, mod_date,
+                info['crc32'], info['compressed_size'], info['size'], len(name), 0
+            ) + name)
+            with open(member_path, 'rb') as member:
+                write(f, member.read())
+            central.append(CENTRAL_HEADER.pack(
+                CENTRAL_SIGNATURE, MADE_BY_UNIX, ZIP_VERSION, 0, info['method'], mod_time, mod_date,
+                info['crc32'], info['compressed_size'], info['size'], len(name), 0, 0, 0, 0,
+                (stat.S_IFREG | mode) << 16, offset
+            ) + name)
+            offset += LOCAL_HEADER.size + len(name) + info['compressed_size']
+
+        directory = b''.join(central)
+        write(f, directory)
+        write(f, END_RECORD.pack(END_SIGNATURE, 0, 0, len(central), len(central), len(directory), offset, 0))
+    os.replace(tmp_path, output)
+    return digest.hexdigest()
+
+
+def package(output=None, abis=None, level=None, jobs=None):
+    """打包模块zip，返回(输出路径, 是否重新写出, 重新压缩的条目数)"""
+    level = _env_int('PACKAGE_COMPRESSION_LEVEL', DEFAULT_COMPRESSION_LEVEL) if level is None else level
+    output = Path(output or DIST_DIR / f"HyperOS_SF_Bypass-{read_module_version()}.zip")
+    DIST_DIR.mkdir(parents=True, exist_ok=True)
+    MEMBER_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    output.parent.mkdir(parents=True, exist_ok=True)
+
+    # 白名单与二进制表一起打包，设备端可以直接mmap
+    whitelist_table.compile_whitelist(REPO_ROOT / "whitelist.txt", REPO_ROOT / "whitelist.bin")
+
+    previous = load_manifest()
+    previous_files = previous.get('files', {}) if previous.get('level') == level else {}
+    files = {}
+    with build_trace.span('package.hash', category='package'):
+        entries = collect_entries(abis)
+        for arcname, source, mode in entries:
+            sha256, st = hash_file(source, previous_files.get(arcname))
+            files[arcname] = {
+                'source': os.path.relpath(source, REPO_ROOT),
+                'sha256': sha256,
+                'size': st.st_size,
+                'mtime_ns': st.st_mtime_ns,
+                'mode': mode,
+            }
+
+    # 清单和已有zip都未变化时不需要重新写出
+    archive = previous.get('archive', {})
+    contents = {name: (entry['sha256'], entry['mode']) for name, entry in files.items()}
+    previous_contents = {name: (entry['sha256'], entry['mode']) for name, entry in previous_files.items()}
+    try:
+        output_st = output.stat()
+    except OSError:
+        output_st = None
+    if (contents == previous_contents and archive.get('path') == str(output) and output_st is not None
+            and archive.get('size') == output_st.st_size and archive.get('mtime_ns') == output_st.st_mtime_ns):
+        return output, False, 0
+
+    # 只重新压缩内容变化(缓存中没有)的条目
+    pending = []
+    for arcname, entry in files.items():
+        cached = previous_files.get(arcname)
+        if (cached and cached['sha256'] == entry['sha256'] and 'member' in cached
+                and _member_path(entry['sha256'], level).exists()):
+            entry['member'] = cached['member']
+        else:
+            pending.append(arcname)
+
+    with build_trace.span('package.compress', category='package', members=len(pending)):
+        large = [name for name in pending if files[name]['size'] >= PARALLEL_THRESHOLD]
+        with ThreadPoolExecutor(max_workers=jobs or matrix_build.get_cpu_budget()) as executor:
+            futures = {name: executor.submit(compress_member, REPO_ROOT / files[name]['source'],
+                                             files[name]['sha256'], level) for name in large}
+            for name in pending:
+                if name not in futures:
+                    files[name]['member'] = compress_member(REPO_ROOT / files[name]['source'],
+                                                            files[name]['sha256'], level)
+            for name, future in futures.items():
+                files[name]['member'] = future.result()
+
+    with build_trace.span('package.write', category='package'):
+        members = [(arcname, entry['mode'], entry['member'], _member_path(entry['sha256'], level))
+                   for arcname, entry in sorted(files.items())]
+        sha256 = _write_archive(output, members)
+    output_st = output.stat()
+
+    save_manifest({
+        'level': level,
+        'files': files,
+        'archive': {
+            'path': str(output),
+            'sha256': sha256,
+            'size': output_st.st_size,
+            'mtime_ns': output_st.st_mtime_ns,
+        },
+    })
+    # 删除不再被清单引用的压缩条目
+    keep = {_member_path(entry['sha256'], level).name for entry in files.values()}
+    for member_path in MEMBER_CACHE_DIR.iterdir():
+        if member_path.name not in keep:
+            member_path.unlink()
+    return output, True, len(pending)
+
+
+def main(argv=None):
+    """命令行入口: 打包模块zip"""
+    parser = argparse.ArgumentParser(description="打包可刷入的Magisk模块zip")
+    parser.add_argument('--output', default=None, help="zip路径，默认为 dist/HyperOS_SF_Bypass-<版本>.zip")
+    parser.add_argument('--abis', default=None, help="逗号分隔的ABI列表，默认打包 jni/libs 下已构建的全部ABI")
+    parser.add_argument('--level', type=int, default=None, help="压缩级别 0-9，默认为 9")
+    parser.add_argument('--jobs', type=int, default=None, help="并行压缩的线程数")
+    args = parser.parse_args(argv)
+
+    abis = [abi.strip() for abi in args.abis.split(',') if abi.strip()] if args.abis else None
+    start_time = time.monotonic()
+    try:
+        output, written, compressed = package(args.output, abis, args.level, args.jobs)
+    except (OSError, whitelist_table.WhitelistError) as e:
+        print(f"错误: {str(e)}")
+        return 1
+    elapsed = time.monotonic() - start_time
+    if written:
+        print(f"模块已打包: {output} (重新压缩 {compressed} 个条目，用时 {elapsed:.2f}s)")
+    else:
+        print(f"模块未变化: {output}")
+    build_trace.finish()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+构建环境预检
+在线程池中同时探测构建工具和NDK，生成环境报告，
+并以PATH和工具可执行文件的修改时间为键缓存到文件，环境未变化时直接复用上次的结果
+"""
+
+import os
+import sys
+import json
+import argparse
+import time
+import shutil
+import hashlib
+import platform
+import subprocess
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import build_trace
+import dobby_cache
+import run_history
+
+
+# 需要探测的工具；ninja为可选工具，用于加速CMake构建；ccache/sccache为可选的编译器缓存
+TOOL_NAMES = ['git', 'make', 'cmake', 'ninja', 'ccache', 'sccache']
+
+# 默认缓存位置
+DEFAULT_CACHE_PATH = Path.home() / ".cache" / "hyperos_sf_bypass" / "preflight.json"
+
+# 单个工具探测的超时时间
+PROBE_TIMEOUT = 15
+
+# 缓存格式版本，报告结构变化时递增
+CACHE_VERSION = 1
+
+ToolInfo = namedtuple('ToolInfo', ['name', 'path', 'version'])
+
+
+class EnvironmentReport:
+    """构建环境报告"""
+
+    def __init__(self, tools, ndk_path, ndk_source, ndk_version, elapsed, from_cache=False):
+        # 工具名到ToolInfo的映射，未找到的工具path为None
+        self.tools = tools
+        # NDK路径及其来源: env(环境变量) / discovered(在常见位置发现) / None
+        self.ndk_path = ndk_path
+        self.ndk_source = ndk_source
+        self.ndk_version = ndk_version
+        self.elapsed = elapsed
+        self.from_cache = from_cache
+
+    def has_tool(self, name):
+        """工具是否可用"""
+        tool = self.tools.get(name)
+        return tool is not None and tool.path is not None and tool.version is not None
+
+    def missing_tools(self, names):
+        """返回缺少的工具列表"""
+        return [name for name in names if not self.has_tool(name)]
+
+    def to_dict(self):
+        """转换为可序列化的字典"""
+        return {
+            'tools': {name: tool._asdict() for name, tool in self.tools.items()},
+            'ndk_path': self.ndk_path,
+            'ndk_source': self.ndk_source,
+            'ndk_version': self.ndk_version,
+            'elapsed': self.elapsed,
+        }
+
+    @classmethod
+    def from_dict(cls, data, from_cache=False):
+        """从字典恢复报告"""
+        tools = {name: ToolInfo(**tool) for name, tool in data['tools'].items()}
+        return cls(tools, data['ndk_path'], data['ndk_source'], data['ndk_version'],
+                   data['elapsed'], from_cache)
+
+
+def get_cache_path():
+    """获取预检缓存文件路径"""
+    return Path(os.environ.get('PREFLIGHT_CACHE_PATH', DEFAULT_CACHE_PATH))
+
+
+def required_tools():
+    """根据平台确定必需的构建工具"""
+    if platform.system().lower() == "windows":
+        # Windows上可能使用mingw或其他make工具
+        return ['git', 'make']
+    return ['git', 'make', 'cmake']
+
+
+def ndk_candidate_paths():
+    """常见的NDK安装位置"""
+    return [
+        Path.home() / "Android" / "Sdk" / "ndk",
+        Path.home() / "Library" / "Android" / "sdk" / "ndk",
+        Path("C:") / "Android" / "Sdk" / "ndk",
+        Path("C:") / "android-ndk-*",  # Windows通配符
+    ]
+
+
+def _probe_tool(name):
+    """探测单个工具的路径和版本"""
+    tool_path = shutil.which(name)
+    if tool_path is None:
+        return ToolInfo(name, None, None)
+    try:
+        result = subprocess.run([tool_path, '--version'],
+                                check=True,
+                                capture_output=True,
+                                text=True,
+                                timeout=PROBE_TIMEOUT)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError):
+        return ToolInfo(name, tool_path, None)
+    lines = (result.stdout or result.stderr).strip().splitlines()
+    return ToolInfo(name, tool_path, lines[0] if lines else '')
+
+
+def _probe_ndk():
+    """查找NDK，返回(路径, 来源, 版本)"""
+    ndk_env = os.environ.get('ANDROID_NDK_HOME') or os.environ.get('NDK_HOME')
+    if ndk_env and Path(ndk_env).exists():
+        return ndk_env, 'env', dobby_cache.get_ndk_version(ndk_env)
+
+    for path in ndk_candidate_paths():
+        # 如果是通配符路径，展开它并使用最新的NDK版本
+        if '*' in str(path):
+            expanded = list(Path(path.parent).glob(path.name))
+            if expanded:
+                latest_ndk = sorted(expanded, key=os.path.getmtime, reverse=True)[0]
+                return str(latest_ndk), 'discovered', dobby_cache.get_ndk_version(latest_ndk)
+        elif path.exists():
+            return str(path), 'discovered', dobby_cache.get_ndk_version(path)
+
+    return None, None, None
+
+
+def _stat_signature(path):
+    """文件或目录的修改时间签名，不存在时为None"""
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError, ValueError):
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def compute_cache_key():
+    """以PATH、NDK环境变量、工具可执行文件和NDK候选位置的状态计算缓存键"""
+    key_data = {
+        'version': CACHE_VERSION,
+        'platform': platform.system(),
+        'PATH': os.environ.get('PATH', ''),
+        'ANDROID_NDK_HOME': os.environ.get('ANDROID_NDK_HOME'),
+        'NDK_HOME': os.environ.get('NDK_HOME'),
+        'tools': {},
+        'ndk_candidates': {},
+    }
+    for name in TOOL_NAMES:
+        tool_path = shutil.which(name)
+        key_data['tools'][name] = [tool_path, _stat_signature(tool_path)]
+    for path in ndk_candidate_paths():
+        target = path.parent if '*' in str(path) else path
+        key_data['ndk_candidates'][str(path)] = _stat_signature(target)
+    for env_name in ('ANDROID_NDK_HOME', 'NDK_HOME'):
+        if os.environ.get(env_name):
+            key_data['ndk_candidates'][env_name] = _stat_signature(os.environ[env_name])
+
+    payload = json.dumps(key_data, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()
+
+
+def _load_cached(cache_key):
+    """读取缓存的报告，键不一致时返回None"""
+    try:
+        with open(get_cache_path(), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get('key') != cache_key:
+        return None
+    try:
+        return EnvironmentReport.from_dict(data['report'], from_cache=True)
+    except (KeyError, TypeError):
+        return None
+
+
+def _save_cached(cache_key, report):
+    """保存报告到缓存文件"""
+    cache_path = get_cache_path()
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'key': cache_key, 'report': report.to_dict()}, f, indent=2)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"警告: 无法写入预检缓存: {str(e)}")
+
+
+def run_preflight(use_cache=True):
+    """并行探测构建环境，返回EnvironmentReport"""
+    if os.environ.get('PREFLIGHT_CACHE', '1') == '0':
+        use_cache = False
+
+    cache_key = compute_cache_key()
+    if use_cache:
+        report = _load_cached(cache_key)
+        if report is not None:
+            run_history.record_preflight(report)
+            return report
+
+    start_time = time.monotonic()
+    with build_trace.span('preflight'), ThreadPoolExecutor(max_workers=len(TOOL_NAMES) + 1) as executor:
+        tool_futures = {name: executor.submit(_probe_tool, name) for name in TOOL_NAMES}
+        ndk_future = executor.submit(_probe_ndk)
+        tools = {name: future.result() for name, future in tool_futures.items()}
+        ndk_path, ndk_source, ndk_version = ndk_future.result()
+
+    report = EnvironmentReport(tools, ndk_path, ndk_source, ndk_version,
+                               time.monotonic() - start_time)
+    if use_cache:
+        _save_cached(cache_key, report)
+    run_history.record_preflight(report)
+    return report
+
+
+def print_report(report):
+    """打印环境报告"""
+    source = "缓存" if report.from_cache else f"探测用时 {report.elapsed:.2f}s"
+    print(f"构建环境预检 ({source}):")
+    for name in TOOL_NAMES:
+        tool = report.tools.get(name)
+        if tool is None or tool.path is None:
+            print(f"  {name:<7} 未找到")
+        elif tool.version is None:
+            print(f"  {name:<7} {tool.path} (无法执行)")
+        else:
+            print(f"  {name:<7} {tool.version}")
+    if report.ndk_path:
+        print(f"  NDK     {report.ndk_path} ({report.ndk_version})")
+    else:
+        print("  NDK     未找到")
+
+
+def main(argv=None):
+    """命令行入口: 打印环境报告，缺少必需工具或NDK时返回非零"""
+    parser = argparse.ArgumentParser(description="构建环境预检")
+    parser.add_argument('--json', action='store_true', help="输出JSON格式的报告")
+    parser.add_argument('--no-cache', action='store_true', help="忽略缓存，重新探测")
+    args = parser.parse_args(argv)
+
+    report = run_preflight(use_cache=not args.no_cache)
+    if args.json:
+        print(json.dumps(report.to_dict(), indent=2, ensure_ascii=False))
+    else:
+        print_report(report)
+    if report.missing_tools(required_tools()) or not report.ndk_path:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+结构化的运行记录和历史查询
+记录每次运行的预检结果、构建命令、错误分类、修复动作、AI分析缓存命中情况和各阶段耗时，
+运行结束时写出JSON格式的运行记录并追加到本地SQLite历史库，
+命令行查询最近N次运行中最慢的阶段、最常见的失败和平均恢复时间(time-to-green)
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import threading
+from pathlib import Path
+
+import build_trace
+
+
+DEFAULT_HISTORY_PATH = Path.home() / ".cache" / "hyperos_sf_bypass" / "run_history.sqlite3"
+DEFAULT_REPORT_PATH = "run-report.json"
+
+DEFAULT_LAST_RUNS = 50
+DEFAULT_TOP = 10
+
+# 实际运行了构建的命令，只有它们计入成功率和恢复时间；analyze只分析已有的日志，结果不代表构建状态
+BUILD_COMMANDS = ('build', 'fix', 'watch', 'monitor', 'auto_fix_build', 'enhanced_auto_fix')
+
+_lock = threading.Lock()
+_started_at = time.time()
+_preflight = None
+_commands = []
+_classification = []
+_fix_actions = []
+_analyses = []
+# 已计入之前运行记录的trace事件数
+_phase_offset = 0
+
+
+def enabled():
+    """是否记录运行历史，RUN_HISTORY=0时关闭"""
+    return os.environ.get('RUN_HISTORY', '1') != '0'
+
+
+def get_history_path():
+    """获取历史库路径"""
+    return Path(os.environ.get('RUN_HISTORY_PATH', DEFAULT_HISTORY_PATH))
+
+
+def get_report_path():
+    """获取本次运行记录的JSON文件路径"""
+    return Path(os.environ.get('RUN_REPORT_PATH', DEFAULT_REPORT_PATH))
+
+
+def record_preflight(report):
+    """记录预检结果，多次预检时保留最后一次"""
+    global _preflight
+    _preflight = {
+        'from_cache': report.from_cache,
+        'elapsed_s': round(report.elapsed, 3),
+        'ndk_version': report.ndk_version,
+        'ndk_source': report.ndk_source,
+        'tools': sorted(name for name, tool in report.tools.items() if tool.path),
+    }
+
+
+def record_command(cmd, result):
+    """记录一次构建命令，失败时由构建中解析出的诊断生成缩减日志，结束时再计算错误指纹"""
+    # bash build.sh 这类命令以脚本名标识
+    name = os.path.basename(str(cmd[0]))
+    if name in ('bash', 'sh', 'powershell') and len(cmd) > 1:
+        name = os.path.basename(str(cmd[1]))
+    failed = result.returncode != 0 and not result.cancelled
+    with _lock:
+        _commands.append({
+            'command': name,
+            'returncode': result.returncode,
+            'elapsed_s': round(result.elapsed, 3),
+            'aborted': bool(result.aborted_by),
+            'cancelled': result.cancelled,
+            'first_error': result.first_error_line,
+            'errors': sum(1 for item in result.diagnostics if item.is_error),
+            'warnings': sum(1 for item in result.diagnostics if item.severity == 'warning'),
+            'reduced': _reduce(result) if failed else None,
+        })
+
+
+def record_classification(matches):
+    """记录错误分类的结果(RuleMatcher.classify的返回值)"""
+    with _lock:
+        _classification[:] = [
+            {'fix_action': match['rule']['fix_action'], 'priority': match['rule']['priority']}
+            for match in matches
+        ]
+
+
+def record_fix_attempt(attempt):
+    """记录一次修复动作的结果"""
+    with _lock:
+        _fix_actions.append(dict(attempt))
+
+
+def record_analysis(fingerprint, outcome):
+    """记录一次AI分析: hit / miss / shared / skipped / error / cancelled"""
+    with _lock:
+        _analyses.append({'fingerprint': fingerprint, 'outcome': outcome})
+
+
+def _reduce(result):
+    """失败命令的缩减日志"""
+    import log_reducer
+    return log_reducer.reduce_result(result)
+
+
+def _command_fingerprint(reduced):
+    """失败命令的错误指纹"""
+    import log_reducer
+    return log_reducer.fingerprint(reduced)
+
+
+def _take():
+    """取出自上次结束以来记录的内容并重新开始计时"""
+    global _started_at, _phase_offset
+    with _lock:
+        taken = {
+            'started_at': _started_at,
+            'commands': _commands[:],
+            'classification': _classification[:],
+            'fix_actions': _fix_actions[:],
+            'analyses': _analyses[:],
+            'events': build_trace.get_events()[_phase_offset:],
+        }
+        del _commands[:], _classification[:], _fix_actions[:], _analyses[:]
+        _phase_offset += len(taken['events'])
+        _started_at = time.time()
+    return taken
+
+
+def build_record(command, success):
+    """生成本次运行的记录，监听模式下每次构建各生成一条"""
+    import uuid
+
+    taken = _take()
+    finished_at = time.time()
+
+    error_fingerprint = None
+    commands = []
+    for entry in taken['commands']:
+        entry = dict(entry)
+        reduced = entry.pop('reduced')
+        entry['fingerprint'] = _command_fingerprint(reduced) if reduced is not None else None
+        if entry['fingerprint']:
+            error_fingerprint = entry['fingerprint']
+        commands.append(entry)
+
+    return {
+        'run_id': uuid.uuid4().hex,
+        'command': command,
+        'host': platform.node(),
+        'started_at': taken['started_at'],
+        'finished_at': finished_at,
+        'duration_s': round(finished_at - taken['started_at'], 3),
+        'success': bool(success),
+        # 失败时为最后一个失败命令的指纹，成功时为None
+        'error_fingerprint': None if success else error_fingerprint,
+        'preflight': _preflight,
+        'commands': commands,
+        'classification': taken['classification'],
+        'fix_actions': taken['fix_actions'],
+        'analyses': taken['analyses'],
+        'phases': [
+            {'name': row['name'], 'count': row['count'], 'wall_s': round(row['wall_s'], 6)}
+            for row in build_trace.summarize(taken['events'])
+        ],
+    }
+
+
+def _connect(path=None):
+    """打开历史库，不存在时建表"""
+    import sqlite3
+
+    path = Path(path or get_history_path())
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path), timeout=10, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS runs (
+            run_id TEXT PRIMARY KEY,
+            command TEXT NOT NULL,
+            host TEXT,
+            started_at REAL NOT NULL,
+            finished_at REAL NOT NULL,
+            duration_s REAL NOT NULL,
+            success INTEGER NOT NULL,
+            failed_commands INTEGER NOT NULL,
+            error_fingerprint TEXT,
+            record TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS phases (
+            run_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            wall_s REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS failures (
+            run_id TEXT NOT NULL,
+            started_at REAL NOT NULL,
+            fingerprint TEXT NOT NULL,
+            command TEXT NOT NULL,
+            elapsed_s REAL NOT NULL,
+            first_error TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_runs_started_at ON runs(started_at);
+        CREATE INDEX IF NOT EXISTS idx_runs_fingerprint ON runs(error_fingerprint);
+        CREATE INDEX IF NOT EXISTS idx_phases_run ON phases(run_id);
+        CREATE INDEX IF NOT EXISTS idx_failures_fingerprint ON failures(fingerprint);
+        CREATE INDEX IF NOT EXISTS idx_failures_started_at ON failures(started_at);
+    """)
+    return conn
+
+
+def store(record, path=None):
+    """把运行记录追加到历史库"""
+    failed = [entry for entry in record['commands'] if entry['fingerprint']]
+    conn = _connect(path)
+    try:
+        conn.execute("BEGIN")
+        conn.execute(
+            "INSERT INTO runs (run_id, command, host, started_at, finished_at, duration_s, success, "
+            "failed_commands, error_fingerprint, record) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (record['run_id'], record['command'], record['host'], record['started_at'], record['finished_at'],
+             record['duration_s'], int(record['success']), len(failed), record['error_fingerprint'],
+             json.dumps(record, ensure_ascii=False))
+        )
+        conn.executemany(
+            "INSERT INTO phases (run_id, name, count, wall_s) VALUES (?, ?, ?, ?)",
+            [(record['run_id'], phase['name'], phase['count'], phase['wall_s']) for phase in record['phases']]
+        )
+        conn.executemany(
+            "INSERT INTO failures (run_id, started_at, fingerprint, command, elapsed_s, first_error) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(record['run_id'], record['started_at'], entry['fingerprint'], entry['command'],
+              entry['elapsed_s'], entry['first_error']) for entry in failed]
+        )
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+
+def finish(command, success):
+    """运行结束时写出JSON运行记录并追加到历史库，返回记录"""
+    if not enabled():
+        return None
+    record = build_record(command, success)
+
+    report_path = get_report_path()
+    try:
+        report_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, indent=2, ensure_ascii=False)
+    except OSError as e:
+        print(f"警告: 无法写入运行记录: {str(e)}")
+
+    import sqlite3
+    try:
+        store(record)
+    except (OSError, sqlite3.Error) as e:
+        print(f"警告: 无法写入运行历史: {str(e)}")
+    return record
+
+
+_RECENT_RUNS = "SELECT run_id FROM runs ORDER BY started_at DESC LIMIT ?"
+
+
+def slowest_phases(conn, last, top=DEFAULT_TOP):
+    """最近last次运行中按累计耗时排序的阶段"""
+    rows = conn.execute(
+        f"SELECT name, COUNT(DISTINCT run_id), SUM(count), SUM(wall_s), MAX(wall_s) FROM phases "
+        f"WHERE run_id IN ({_RECENT_RUNS}) GROUP BY name ORDER BY SUM(wall_s) DESC LIMIT ?",
+        (last, top)
+    ).fetchall()
+    return [
+        {'name': name, 'runs': runs, 'count': count, 'total_s': total, 'mean_s': total / runs, 'max_s': max_s}
+        for name, runs, count, total, max_s in rows
+    ]
+
+
+def frequent_failures(conn, last, top=DEFAULT_TOP):
+    """最近last次运行中按出现次数排序的失败"""
+    rows = conn.execute(
+        f"SELECT fingerprint, COUNT(*), COUNT(DISTINCT run_id), SUM(elapsed_s), MAX(first_error), "
+        f"MAX(started_at) FROM failures WHERE run_id IN ({_RECENT_RUNS}) "
+        f"GROUP BY fingerprint ORDER BY COUNT(*) DESC, SUM(elapsed_s) DESC LIMIT ?",
+        (last, top)
+    ).fetchall()
+    return [
+        {'fingerprint': fingerprint, 'count': count, 'runs': runs, 'build_time_s': elapsed,
+         'first_error': first_error, 'last_seen': last_seen}
+        for fingerprint, count, runs, elapsed, first_error, last_seen in rows
+    ]
+
+
+def time_to_green(conn, last):
+    """最近last次构建运行(BUILD_COMMANDS)的成功率和平均恢复时间
+
+    从第一次失败(失败的运行，或运行中有失败的构建)开始计时，到之后第一次成功的运行结束为止
+    """
+    placeholders = ', '.join('?' * len(BUILD_COMMANDS))
+    rows = conn.execute(
+        f"SELECT started_at, finished_at, success, failed_commands FROM "
+        f"(SELECT * FROM runs WHERE command IN ({placeholders}) ORDER BY started_at DESC LIMIT ?) "
+        f"ORDER BY started_at",
+        (*BUILD_COMMANDS, last)
+    ).fetchall()
+    recoveries = []
+    failing_since = None
+    for started_at, finished_at, success, failed_commands in rows:
+        if not success:
+            if failing_since is None:
+                failing_since = started_at
+        elif failing_since is not None or failed_commands:
+            recoveries.append(finished_at - (failing_since if failing_since is not None else started_at))
+            failing_since = None
+    return {
+        'runs': len(rows),
+        'successes': sum(1 for row in rows if row[2]),
+        'recoveries': len(recoveries),
+        'mean_time_to_green_s': sum(recoveries) / len(recoveries) if recoveries else None,
+        'still_failing_since': failing_since,
+    }
+
+
+def query(last=DEFAULT_LAST_RUNS, top=DEFAULT_TOP, path=None):
+    """汇总最近last次运行"""
+    conn = _connect(path)
+    try:
+        return {
+            'last': last,
+            'summary': time_to_green(conn, last),
+            'slowest_phases': slowest_phases(conn, last, top),
+            'frequent_failures': frequent_failures(conn, last, top),
+        }
+    finally:
+        conn.close()
+
+
+def _format_duration(seconds):
+    """格式化时长"""
+    if seconds >= 3600:
+        return f"{seconds / 3600:.1f}h"
+    if seconds >= 60:
+        return f"{seconds / 60:.1f}min"
+    return f"{seconds:.1f}s"
+
+
+def print_query(result):
+    """打印查询结果"""
+    summary = result['summary']
+    if not summary['runs'] and not result['slowest_phases'] and not result['frequent_failures']:
+        print("运行历史为空")
+        return
+    print(f"最近 {summary['runs']} 次构建: 成功 {summary['successes']} 次")
+    if summary['mean_time_to_green_s'] is not None:
+        print(f"平均恢复时间: {_format_duration(summary['mean_time_to_green_s'])} "
+              f"(共 {summary['recoveries']} 次从失败恢复)")
+    if summary['still_failing_since'] is not None:
+        since = time.strftime('%Y-%m-%d %H:%M', time.localtime(summary['still_failing_since']))
+        print(f"当前仍处于失败状态，开始于 {since}")
+
+    print("\n最慢的阶段:")
+    for phase in result['slowest_phases']:
+        print(f"  {phase['name']:<28} 累计 {_format_duration(phase['total_s']):>8}  "
+              f"平均 {_format_duration(phase['mean_s']):>8}  最长 {_format_duration(phase['max_s']):>8}  "
+              f"{phase['runs']} 次运行")
+
+    print("\n最常见的失败:")
+    for failure in result['frequent_failures']:
+        print(f"  {failure['count']:>4} 次  {failure['runs']:>3} 次运行  构建耗时 "
+              f"{_format_duration(failure['build_time_s']):>8}  {failure['fingerprint'][:12]}  "
+              f"{(failure['first_error'] or '')[:80]}")
+
+
+def main(argv=None):
+    """命令行入口: 查询运行历史"""
+    parser = argparse.ArgumentParser(description="查询运行历史")
+    parser.add_argument('--last', type=int, default=DEFAULT_LAST_RUNS, help="统计最近的运行次数")
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP, help="每个类别显示的条目数")
+    parser.add_argument('--json', action='store_true', help="输出JSON格式")
+    args = parser.parse_args(argv)
+
+    import sqlite3
+    try:
+        result = query(args.last, args.top)
+    except sqlite3.Error as e:
+        print(f"错误: 无法读取运行历史: {str(e)}")
+        return 1
+    if args.json:
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+    else:
+        print_query(result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
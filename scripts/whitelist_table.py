@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+白名单编译器
+校验、去重并排序 whitelist.txt，输出紧凑的二进制有序字符串表 whitelist.bin，
+设备端可以直接mmap后二分查找，加载时不需要解析、不需要为每个条目分配内存
+
+文件格式(小端):
+  头部 32 字节: magic 'SFWL', 版本 u16, 头部长度 u16, 条目数 n u32,
+               偏移数组位置 u32, 字符串区位置 u32, 字符串区长度 u32, CRC32 u32, 保留 u32
+  偏移数组: n + 1 个 u32，第 i 个条目为字符串区中 [off[i], off[i+1]) 的字节
+  字符串区: 按字节序排序的UTF-8包名，不含分隔符
+CRC32 覆盖头部之后的全部内容
+"""
+
+import os
+import re
+import sys
+import mmap
+import struct
+import zlib
+import argparse
+from pathlib import Path
+
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+WHITELIST_PATH = REPO_ROOT / "whitelist.txt"
+TABLE_PATH = REPO_ROOT / "whitelist.bin"
+
+MAGIC = b'SFWL'
+VERSION = 1
+HEADER = struct.Struct('<4sHHIIIIII')
+OFFSET = struct.Struct('<I')
+
+# Android包名，允许 /proc/<pid>/cmdline 中的 :进程名 后缀
+PACKAGE_RE = re.compile(r'^[A-Za-z][A-Za-z0-9_]*(?:\.[A-Za-z][A-Za-z0-9_]*)+(?::[A-Za-z0-9_.]+)?$')
+MAX_PACKAGE_LENGTH = 255
+
+
+class WhitelistError(Exception):
+    """白名单内容或二进制表格式不正确"""
+
+
+def parse_text(lines):
+    """解析白名单文本，返回(排序去重后的包名列表, 错误列表, 重复列表)
+
+    错误和重复为(行号, 内容)，#开头的行和空行被忽略
+    """
+    entries = set()
+    errors = []
+    duplicates = []
+    for lineno, line in enumerate(lines, 1):
+        name = line.strip()
+        if not name or name.startswith('#'):
+            continue
+        if len(name) > MAX_PACKAGE_LENGTH or not PACKAGE_RE.match(name):
+            errors.append((lineno, name))
+        elif name in entries:
+            duplicates.append((lineno, name))
+        else:
+            entries.add(name)
+    # 按UTF-8字节序排序，设备端可以直接用memcmp二分查找
+    return sorted(entries, key=lambda name: name.encode('utf-8')), errors, duplicates
+
+
+def read_text(path=WHITELIST_PATH):
+    """读取并解析白名单文本文件"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return parse_text(f)
+
+
+def encode_table(entries):
+    """把已排序的包名列表编码为二进制表"""
+    encoded = [name.encode('utf-8') for name in entries]
+    offsets = bytearray(OFFSET.size * (len(encoded) + 1))
+    position = 0
+    for index, name in enumerate(encoded):
+        OFFSET.pack_into(offsets, OFFSET.size * index, position)
+        position += len(name)
+    OFFSET.pack_into(offsets, OFFSET.size * len(encoded), position)
+
+    body = bytes(offsets) + b''.join(encoded)
+    offsets_pos = HEADER.size
+    strings_pos = offsets_pos + len(offsets)
+    header = HEADER.pack(MAGIC, VERSION, HEADER.size, len(encoded), offsets_pos, strings_pos,
+                         position, zlib.crc32(body), 0)
+    return header + body
+
+
+def write_table(entries, path=TABLE_PATH):
+    """原子地写出二进制表，内容未变时不改写文件，返回是否写入"""
+    data = encode_table(entries)
+    path = Path(path)
+    try:
+        if path.read_bytes() == data:
+            return False
+    except OSError:
+        pass
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return True
+
+
+def write_text(entries, path=WHITELIST_PATH):
+    """把排序去重后的包名写回白名单文本，保留文件开头的注释，返回是否改写"""
+    path = Path(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        original = f.read()
+    header = []
+    for line in original.splitlines():
+        if line.strip() and not line.lstrip().startswith('#'):
+            break
+        if line.strip():
+            header.append(line.rstrip())
+    content = ''.join(line + '\n' for line in header + list(entries))
+    if content == original:
+        return False
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+    return True
+
+
+class WhitelistTable:
+    """mmap方式打开的二进制表，查找时在有序字符串表上二分"""
+
+    def __init__(self, path=TABLE_PATH, verify=True):
+        self._offsets = None
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER.size:
+                raise WhitelistError(f"{path}: 文件过短")
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_size, count, offsets_pos, strings_pos, strings_size, crc, _ = \
+            HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION or header_size != HEADER.size:
+            self.close()
+            raise WhitelistError(f"{path}: 不是版本 {VERSION} 的白名单表")
+        if strings_pos != offsets_pos + OFFSET.size * (count + 1) or strings_pos + strings_size != size:
+            self.close()
+            raise WhitelistError(f"{path}: 表结构不完整")
+        if verify and zlib.crc32(memoryview(self._mmap)[HEADER.size:]) != crc:
+            self.close()
+            raise WhitelistError(f"{path}: CRC校验失败")
+        self.count = count
+        self._strings_pos = strings_pos
+        view = memoryview(self._mmap)[offsets_pos:strings_pos]
+        if sys.byteorder == 'little':
+            self._offsets = view.cast('I')
+        else:
+            # 大端主机上复制一份并转换字节序，只用于主机端检查
+            import array
+            self._offsets = array.array('I', view)
+            self._offsets.byteswap()
+
+    def __len__(self):
+        return self.count
+
+    def _key(self, index):
+        """第index个条目的字节串"""
+        start = self._strings_pos + self._offsets[index]
+        return self._mmap[start:self._strings_pos + self._offsets[index + 1]]
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return self._key(index).decode('utf-8')
+
+    def __contains__(self, name):
+        key = name.encode('utf-8') if isinstance(name, str) else name
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            current = self._key(middle)
+            if current < key:
+                low = middle + 1
+            elif current > key:
+                high = middle
+            else:
+                return True
+        return False
+
+    def close(self):
+        """释放mmap"""
+        if isinstance(self._offsets, memoryview):
+            self._offsets.release()
+        self._mmap.close()
+
+
+def _print_problems(source, errors, duplicates):
+    """打印无效和重复的条目"""
+    for lineno, name in errors:
+        print(f"{source}:{lineno}: 无效的包名: {name}")
+    for lineno, name in duplicates:
+        print(f"{source}:{lineno}: 重复的包名: {name}")
+
+
+def compile_whitelist(source=WHITELIST_PATH, output=TABLE_PATH, fix=False):
+    """校验白名单并编译为二进制表，返回条目数
+
+    存在无效条目时抛出WhitelistError；fix为True时改为删除无效和重复条目，并把排序后的结果写回文本
+    """
+    entries, errors, duplicates = read_text(source)
+    _print_problems(source, errors, duplicates)
+    if fix:
+        if write_text(entries, source):
+            print(f"已整理 {source}: 删除 {len(errors)} 个无效条目和 {len(duplicates)} 个重复条目，并按字节序排序")
+    elif errors:
+        raise WhitelistError(f"{source} 中有 {len(errors)} 个无效的包名")
+    changed = write_table(entries, output)
+    print(f"白名单表: {output} ({len(entries)} 个条目{'' if changed else '，未变化'})")
+    return len(entries)
+
+
+def main(argv=None):
+    """命令行入口: 编译白名单"""
+    parser = argparse.ArgumentParser(description="校验白名单并编译为可mmap的二进制表")
+    parser.add_argument('source', nargs='?', default=str(WHITELIST_PATH), help="白名单文本路径")
+    parser.add_argument('--output', default=str(TABLE_PATH), help="二进制表路径")
+    parser.add_argument('--check', action='store_true', help="只校验，存在无效或重复条目时返回非零")
+    parser.add_argument('--fix', action='store_true', help="删除无效和重复条目并按字节序排序，写回白名单文本")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.check:
+            entries, errors, duplicates = read_text(args.source)
+            _print_problems(args.source, errors, duplicates)
+            print(f"{len(entries)} 个有效条目")
+            return 1 if errors or duplicates else 0
+        compile_whitelist(args.source, args.output, fix=args.fix)
+    except OSError as e:
+        print(f"错误: {str(e)}")
+        return 1
+    except WhitelistError as e:
+        print(f"错误: {str(e)}，可以使用 --fix 删除无效条目")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
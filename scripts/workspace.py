@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+构建工作区的检查和准备
+各自动修复入口共用的Dobby库、NDK和构建工具检查，以及按需获取和编译Dobby
+"""
+
+import os
+from pathlib import Path
+
+import dobby_build
+import dobby_source
+import preflight
+
+
+DOBBY_LIB_PATH = Path("jni/external/libdobby.a")
+DOBBY_SRC_PATH = dobby_source.DEST_DIR
+
+# Dobby交叉编译的目标参数
+DOBBY_ABI = dobby_build.DEFAULT_ABI
+DOBBY_API_LEVEL = dobby_build.DEFAULT_API_LEVEL
+
+
+def check_dobby_library():
+    """检查Dobby库是否存在"""
+    return DOBBY_LIB_PATH.exists()
+
+
+def download_dobby():
+    """下载Dobby库的函数"""
+    print("正在准备Dobby源码...")
+
+    # 从本地缓存检出固定版本的Dobby源码，缓存中没有时才访问网络
+    return dobby_source.materialize(DOBBY_SRC_PATH)
+
+
+def check_ndk_installed():
+    """检查NDK是否已安装并配置"""
+    report = preflight.run_preflight()
+
+    if report.ndk_source == 'env':
+        print(f"NDK已配置: {report.ndk_path}")
+        return True
+
+    if report.ndk_path:
+        os.environ['ANDROID_NDK_HOME'] = report.ndk_path
+        print(f"发现NDK: {report.ndk_path}")
+        return True
+
+    print("警告: 未找到ANDROID_NDK_HOME或NDK_HOME环境变量")
+    return False
+
+
+def check_build_tools():
+    """检查构建工具是否安装"""
+    tools_needed = preflight.required_tools()
+    missing_tools = preflight.run_preflight().missing_tools(tools_needed)
+
+    if missing_tools:
+        print(f"警告: 缺少构建工具: {', '.join(missing_tools)}")
+        return False
+
+    print("构建工具齐全")
+    return True
+
+
+def compile_dobby_if_needed(force=False):
+    """如果需要，编译Dobby库；force为True时忽略已有的库和缓存重新编译"""
+    # 检查是否已经有预编译的库
+    if DOBBY_LIB_PATH.exists() and not force:
+        print("Dobby库已存在，跳过编译")
+        return True
+
+    # 检查Dobby源码是否存在
+    if not DOBBY_SRC_PATH.exists():
+        print("错误: Dobby源码不存在")
+        return False
+
+    # 获取NDK路径
+    ndk_path = os.environ.get('ANDROID_NDK_HOME') or os.environ.get('NDK_HOME')
+    if not ndk_path:
+        print("错误: 未设置NDK路径")
+        return False
+
+    # 库文件的安装位置
+    install_targets = [
+        Path.cwd() / DOBBY_LIB_PATH,
+        Path.cwd() / "libs" / DOBBY_ABI / "libdobby.a",
+    ]
+
+    return dobby_build.compile_dobby(
+        DOBBY_SRC_PATH, ndk_path, install_targets,
+        abi=DOBBY_ABI, api_level=DOBBY_API_LEVEL, force=force
+    )
+
+
+def ensure_dobby():
+    """确保Dobby库可用: 缺少时获取源码，返回是否成功"""
+    if check_dobby_library():
+        print("Dobby库已存在")
+        return True
+
+    print("检测到问题: 缺少Dobby库文件")
+    if download_dobby():
+        print("Dobby库下载成功!")
+        return True
+
+    print("无法自动下载Dobby库，请手动下载并放置到 jni/external/libdobby.a")
+    print("下载链接: https://github.com/jmpews/Dobby")
+    return False
@@ -1,11 +1,24 @@
 #!/bin/bash
 # 模拟构建失败的脚本，用于测试自动修复功能
+# 用法: simulate_build_failure.sh [场景]
+# 指定场景时回放 bench/corpus/<场景>.log 中录制的构建日志
 
 echo "模拟构建过程..."
 
+SCENARIO="$1"
+if [ -n "$SCENARIO" ]; then
+    LOG_FILE="$(dirname "$0")/bench/corpus/${SCENARIO}.log"
+    if [ ! -f "$LOG_FILE" ]; then
+        echo "未知的场景: ${SCENARIO}" >&2
+        exit 2
+    fi
+    cat "$LOG_FILE" >&2
+    exit 1
+fi
+
 # 模拟Dobby库缺失错误
 echo "Error: jni/external/libdobby.a: No such file or directory" >&2
 echo "Build failed due to missing Dobby library" >&2
 
 # 返回非零退出码表示失败
-exit 1
\ No newline at end of file
+exit 1
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+测试AI分析结果缓存的过期、LRU淘汰和命中统计
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+
+import analysis_cache
+
+
+class AnalysisCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.env = {'ANALYSIS_CACHE_PATH': str(Path(self.tmp.name) / "analysis.sqlite3")}
+        patcher = mock.patch.dict(os.environ, self.env)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.now = [1000.0]
+        patcher = mock.patch.object(analysis_cache.time, 'time', lambda: self.now[0])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        for conn in getattr(analysis_cache._local, 'connections', {}).values():
+            conn.close()
+        analysis_cache._local.connections = {}
+
+    def test_put_then_get(self):
+        self.assertIsNone(analysis_cache.get('a'))
+        analysis_cache.put('a', "分析结果")
+        self.assertEqual(analysis_cache.get('a'), "分析结果")
+        self.assertEqual(analysis_cache.get_stats(), {'hits': 1, 'misses': 1, 'entries': 1})
+
+    def test_expired_entry_is_a_miss(self):
+        with mock.patch.dict(os.environ, {'ANALYSIS_CACHE_TTL': '60'}):
+            analysis_cache.put('a', "old")
+            self.now[0] += 61
+            self.assertIsNone(analysis_cache.get('a'))
+
+    def test_least_recently_used_is_evicted(self):
+        with mock.patch.dict(os.environ, {'ANALYSIS_CACHE_MAX_ENTRIES': '2'}):
+            analysis_cache.put('a', "A")
+            self.now[0] += 1
+            analysis_cache.put('b', "B")
+            self.now[0] += 1
+            # 访问a后b成为最久未使用的条目
+            analysis_cache.get('a')
+            self.now[0] += 1
+            analysis_cache.put('c', "C")
+            self.assertIsNone(analysis_cache.get('b'))
+            self.assertEqual(analysis_cache.get('a'), "A")
+            self.assertEqual(analysis_cache.get('c'), "C")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+测试AI分析接口客户端: 使用本地http.server桩服务验证重试、Retry-After、熔断器、限速和连接复用
+"""
+
+import json
+import sys
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+
+import analysis_client
+
+
+def reply(content):
+    """chat/completions格式的成功响应"""
+    return 200, json.dumps({'choices': [{'message': {'content': content}}]}), {}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """按顺序返回服务器脚本中的响应，脚本用完后一直返回成功"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        server = self.server
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with server.lock:
+            server.requests.append(self.client_address)
+            status, body, headers = server.script.pop(0) if server.script else reply("ok")
+        data = body.encode('utf-8')
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.script = []
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        host, port = self.server.server_address
+        self.url = f"http://{host}:{port}/v1/chat/completions"
+        # 不真正等待退避时间，只记录
+        self.delays = []
+        patcher = mock.patch.object(analysis_client.time, 'sleep', self.delays.append)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def client(self, **kwargs):
+        client = analysis_client.AnalysisClient(self.url, 'key', 'model', **kwargs)
+        self.addCleanup(client.close)
+        return client
+
+    def test_retries_until_success(self):
+        self.server.script = [(503, '{}', {}), (502, '{}', {}), reply("fixed")]
+        self.assertEqual(self.client(max_retries=3).analyze("prompt"), "fixed")
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(self.delays), 2)
+
+    def test_gives_up_after_max_retries(self):
+        self.server.script = [(500, '{}', {})] * 5
+        with self.assertRaises(analysis_client.AnalysisError):
+            self.client(max_retries=2).analyze("prompt")
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_client_error_is_not_retried(self):
+        self.server.script = [(400, '{"error": "bad"}', {})]
+        with self.assertRaises(analysis_client.AnalysisError):
+            self.client(max_retries=3).analyze("prompt")
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_retry_after_is_honoured(self):
+        self.server.script = [(429, '{}', {'Retry-After': '7'}), reply("ok")]
+        self.client(max_retries=1, backoff_base=0.01).analyze("prompt")
+        self.assertEqual(len(self.delays), 1)
+        self.assertGreaterEqual(self.delays[0], 7)
+
+    def test_retry_after_is_capped(self):
+        self.server.script = [(429, '{}', {'Retry-After': '3600'}), reply("ok")]
+        self.client(max_retries=1, backoff_cap=5).analyze("prompt")
+        self.assertLessEqual(self.delays[0], 5)
+
+    def test_breaker_open_half_open_closed(self):
+        client = self.client(max_retries=0, breaker_threshold=2, breaker_cooldown=0.05)
+        self.server.script = [(500, '{}', {})] * 2
+        for _ in range(2):
+            with self.assertRaises(analysis_client.AnalysisError):
+                client.analyze("prompt")
+        self.assertTrue(client.breaker.is_open)
+
+        # 打开状态下不发出请求
+        with self.assertRaises(analysis_client.CircuitOpenError):
+            client.analyze("prompt")
+        self.assertEqual(len(self.server.requests), 2)
+
+        # 冷却结束后放行一个试探请求，成功后关闭
+        threading.Event().wait(0.06)
+        self.assertEqual(client.analyze("prompt"), "ok")
+        self.assertFalse(client.breaker.is_open)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_connection_is_reused(self):
+        client = self.client(pool_size=1)
+        for _ in range(3):
+            client.analyze("prompt")
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(set(self.server.requests)), 1)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def test_half_open_allows_single_probe(self):
+        breaker = analysis_client.CircuitBreaker(threshold=1, cooldown=0)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        # 试探失败时重新打开
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertFalse(breaker.is_open)
+        self.assertTrue(breaker.allow())
+
+
+    def test_probe_released_after_unexpected_error(self):
+        breaker = analysis_client.CircuitBreaker(threshold=1, cooldown=0)
+        client = analysis_client.AnalysisClient("http://127.0.0.1:9/v1", 'key', 'model', max_retries=0)
+        client.breaker = breaker
+        breaker.record_failure()
+        with mock.patch.object(client, '_send_once', side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                client.post_json({})
+        # 试探请求没有记录结果就退出，之后仍然可以再试探
+        self.assertTrue(breaker.allow())
+        client.close()
+
+
+class DaemonExecutorTest(unittest.TestCase):
+
+    def test_runs_tasks_on_daemon_threads(self):
+        executor = analysis_client.DaemonExecutor(2, thread_name_prefix='test')
+        self.addCleanup(executor.shutdown)
+        future = executor.submit(lambda: threading.current_thread())
+        self.assertTrue(future.result(timeout=5).daemon)
+        failing = executor.submit(lambda: 1 / 0)
+        self.assertIsInstance(failing.exception(timeout=5), ZeroDivisionError)
+
+    def test_shutdown_cancels_queued_tasks(self):
+        executor = analysis_client.DaemonExecutor(1)
+        started = threading.Event()
+        release = threading.Event()
+
+        def block():
+            started.set()
+            release.wait(5)
+            return 'done'
+
+        running = executor.submit(block)
+        started.wait(5)
+        queued = executor.submit(lambda: 'never')
+        executor.shutdown(wait=False, cancel_futures=True)
+        self.assertTrue(queued.cancelled())
+        release.set()
+        self.assertEqual(running.result(timeout=5), 'done')
+        with self.assertRaises(RuntimeError):
+            executor.submit(lambda: None)
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def test_burst_then_rate(self):
+        now = [100.0]
+        waits = []
+
+        def sleep(seconds):
+            waits.append(seconds)
+            now[0] += seconds
+
+        with mock.patch.object(analysis_client.time, 'monotonic', lambda: now[0]), \
+                mock.patch.object(analysis_client.time, 'sleep', sleep):
+            limiter = analysis_client.RateLimiter(rate=2, burst=3)
+            for _ in range(5):
+                limiter.acquire()
+        # 前3个请求属于突发量，之后每0.5秒放行一个
+        self.assertEqual(len(waits), 2)
+        self.assertAlmostEqual(now[0] - 100.0, 1.0)
+
+    def test_zero_rate_is_unlimited(self):
+        limiter = analysis_client.RateLimiter(rate=0)
+        with mock.patch.object(analysis_client.time, 'sleep') as sleep:
+            for _ in range(100):
+                limiter.acquire()
+        sleep.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+测试自动修复流程中后台AI分析的生命周期
+"""
+
+import sys
+import unittest
+import concurrent.futures
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+
+import auto_fix_on_build_failure as auto_fix
+
+
+class BackgroundAnalysisTest(unittest.TestCase):
+
+    def setUp(self):
+        self.futures = []
+
+        def start(error_msg):
+            future = concurrent.futures.Future()
+            self.futures.append((error_msg, future))
+            return future
+
+        patcher = mock.patch.object(auto_fix, 'start_ai_analysis', side_effect=start)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(auto_fix.cancel_background_analysis)
+
+    def test_started_once_per_run(self):
+        first = auto_fix.start_background_analysis("error: first")
+        # 修复后的重新构建再次失败时不再发起新的请求
+        self.assertIs(auto_fix.start_background_analysis("error: second"), first)
+        self.assertEqual([error_msg for error_msg, _ in self.futures], ["error: first"])
+
+    def test_cancelled_when_run_ends(self):
+        future = auto_fix.start_background_analysis("error: first")
+        auto_fix.cancel_background_analysis()
+        self.assertTrue(future.cancelled())
+        # 下一次运行重新发起
+        auto_fix.start_background_analysis("error: next")
+        self.assertEqual(len(self.futures), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+测试批量分析的聚类和失败隔离
+"""
+
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+
+import batch_analysis
+import fix_rules
+import log_reducer
+from test_log_reducer import make_log
+
+
+class ClusterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.dir = Path(self.tmp.name)
+
+    def write(self, name, text):
+        path = self.dir / name
+        path.write_text(text, encoding='utf-8')
+        return path
+
+    def test_same_error_different_length_is_one_cluster(self):
+        self.write("short.log", make_log(2, 0))
+        self.write("long.log", make_log(8, 30, repeat=2))
+        self.write("other.log", make_log(2, 0).replace("unordered_set", "shared_mutex"))
+        clusters = batch_analysis.cluster_logs(batch_analysis.find_logs([self.dir]))
+        self.assertEqual([len(cluster.logs) for cluster in clusters], [2, 1])
+
+    def test_matches_come_from_cluster_error_text(self):
+        path = self.write("a.log", make_log(3, 3))
+        cluster = batch_analysis.cluster_logs([path])[0]
+        expected = fix_rules.get_matcher().classify(log_reducer.error_text(cluster.reduced))
+        self.assertEqual(cluster.matches, expected)
+
+
+class AnalyzeOneTest(unittest.TestCase):
+
+    def test_unexpected_error_is_recorded_on_cluster(self):
+        class BrokenClient:
+            def analyze(self, prompt, temperature=None):
+                raise ValueError("bad response")
+
+        class NoLimit:
+            def acquire(self):
+                pass
+
+        cluster = batch_analysis.Cluster('x', "jni/hook.cpp:1:1: error: x")
+        batch_analysis._analyze_one(BrokenClient(), NoLimit(), cluster)
+        self.assertEqual(cluster.source, 'error')
+        self.assertIn("bad response", cluster.error)
+
+
+if __name__ == "__main__":
+    unittest.main()
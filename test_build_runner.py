@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+测试流式构建运行器
+"""
+
+import os
+import sys
+import time
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+
+import build_runner
+
+
+def _alive(pid):
+    """进程是否仍在运行(僵尸进程视为已结束)"""
+    try:
+        with open(f"/proc/{pid}/stat", encoding='utf-8') as f:
+            return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except OSError:
+        return False
+
+
+@unittest.skipUnless(os.name == 'posix', "测试使用sh作为构建命令")
+class RunStreamingTest(unittest.TestCase):
+
+    def setUp(self):
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        self.root = Path(temp.name)
+        self.log_path = self.root / "build.log"
+        # 不把测试命令计入运行历史
+        patcher = mock.patch.object(build_runner.run_history, 'record_command')
+        self.record_command = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_sh(self, script, **kwargs):
+        return build_runner.run_streaming(['sh', '-c', script], log_path=self.log_path, echo=False, **kwargs)
+
+    def test_tail_is_bounded_and_log_keeps_everything(self):
+        result = self.run_sh('i=0; while [ $i -lt 50 ]; do echo "line $i"; i=$((i+1)); done', tail_lines=5)
+
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.tail, [f"line {i}\n" for i in range(45, 50)])
+        self.assertEqual(len(self.log_path.read_text(encoding='utf-8').splitlines()), 50)
+
+    def test_abort_on_kills_process_group(self):
+        pid_file = self.root / "child.pid"
+        start = time.monotonic()
+        result = self.run_sh(f'sleep 30 & echo $! > "{pid_file}"; echo "fatal: stop"; wait',
+                             abort_on=lambda line: 'stop' if 'fatal' in line else None)
+
+        self.assertLess(time.monotonic() - start, 10)
+        self.assertEqual(result.aborted_by, 'stop')
+        self.assertNotEqual(result.returncode, 0)
+        # 构建命令的子进程(sleep)属于同一进程组，应一起被终止
+        child = int(pid_file.read_text().strip())
+        deadline = time.monotonic() + 5
+        while _alive(child) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertFalse(_alive(child))
+
+    def test_returncode_and_usage(self):
+        result = self.run_sh('echo done; exit 3')
+
+        self.assertEqual(result.returncode, 3)
+        self.assertFalse(result.cancelled)
+        self.assertIsNone(result.aborted_by)
+        if hasattr(os, 'wait4'):
+            self.assertIsNotNone(result.usage)
+            self.assertGreaterEqual(result.usage.ru_maxrss, 0)
+        self.record_command.assert_called_once_with(['sh', '-c', 'echo done; exit 3'], result)
+
+    def test_output_is_parsed_into_diagnostics(self):
+        result = self.run_sh(
+            'echo "jni/hook.cpp:25:6: error: unknown type name \'foo\'"; '
+            'echo "jni/hook.cpp:25:6: error: unknown type name \'foo\'"; '
+            'echo "jni/util.cpp:3:1: warning: unused variable \'x\'"; exit 1'
+        )
+
+        self.assertEqual([(item.file, item.line, item.severity) for item in result.diagnostics],
+                         [('jni/hook.cpp', 25, 'error'), ('jni/util.cpp', 3, 'warning')])
+        # 相同的诊断只保留一条并计数
+        self.assertEqual(result.diagnostics[0].count, 2)
+        self.assertEqual(result.first_error_line, "jni/hook.cpp:25:6: error: unknown type name 'foo'")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+测试构建阶段计时和trace输出
+"""
+
+import os
+import sys
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+
+import build_trace
+
+
+class BuildTraceTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.dict(os.environ, {'BUILD_TRACE': '1'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.offset = len(build_trace.get_events())
+
+    def new_events(self):
+        return build_trace.get_events()[self.offset:]
+
+    def test_nested_spans(self):
+        with build_trace.span('test.outer', category='test', abi='arm64-v8a'):
+            with build_trace.span('test.inner'):
+                pass
+
+        inner, outer = self.new_events()
+        self.assertEqual((inner['name'], inner['cat']), ('test.inner', 'build'))
+        self.assertEqual((outer['name'], outer['cat'], outer['ph']), ('test.outer', 'test', 'X'))
+        self.assertEqual(outer['args']['abi'], 'arm64-v8a')
+        for key in ('wall_s', 'cpu_s', 'child_cpu_s', 'child_peak_rss_kb'):
+            self.assertIn(key, outer['args'])
+        # 内层阶段包含在外层阶段的时间范围内
+        self.assertLessEqual(outer['ts'], inner['ts'])
+        self.assertGreaterEqual(outer['ts'] + outer['dur'], inner['ts'] + inner['dur'])
+
+    def test_disabled(self):
+        with mock.patch.dict(os.environ, {'BUILD_TRACE': '0'}):
+            with build_trace.span('test.disabled') as current:
+                self.assertIsNone(current)
+        self.assertEqual(self.new_events(), [])
+
+    def test_traced_decorator(self):
+        @build_trace.traced('test.traced', category='test')
+        def work(value):
+            return value * 2
+
+        self.assertEqual(work(21), 42)
+        self.assertEqual([event['name'] for event in self.new_events()], ['test.traced'])
+
+    def test_record_child_applies_to_open_spans(self):
+        usage = SimpleNamespace(ru_maxrss=2048 * build_trace._MAXRSS_SCALE)
+        with build_trace.span('test.outer'):
+            with build_trace.span('test.inner'):
+                build_trace.record_child(usage)
+            build_trace.record_child(None)
+
+        inner, outer = self.new_events()
+        self.assertGreaterEqual(inner['args']['child_peak_rss_kb'], 2048)
+        self.assertGreaterEqual(outer['args']['child_peak_rss_kb'], 2048)
+
+    def test_summarize(self):
+        events = [
+            {'name': 'compile', 'ts': 0, 'args': {'wall_s': 1.0, 'cpu_s': 0.1, 'child_cpu_s': 4.0,
+                                                   'child_peak_rss_kb': 100}},
+            {'name': 'link', 'ts': 1, 'args': {'wall_s': 0.5, 'cpu_s': 0.0, 'child_cpu_s': 0.5,
+                                                'child_peak_rss_kb': None}},
+            {'name': 'compile', 'ts': 2, 'args': {'wall_s': 2.0, 'cpu_s': 0.2, 'child_cpu_s': 6.0,
+                                                   'child_peak_rss_kb': 300}},
+        ]
+        rows = build_trace.summarize(events)
+        self.assertEqual([row['name'] for row in rows], ['compile', 'link'])
+        self.assertEqual(rows[0]['count'], 2)
+        self.assertAlmostEqual(rows[0]['wall_s'], 3.0)
+        self.assertAlmostEqual(rows[0]['child_cpu_s'], 10.0)
+        self.assertEqual(rows[0]['child_peak_rss_kb'], 300)
+        self.assertIsNone(rows[1]['child_peak_rss_kb'])
+
+    def test_write_trace(self):
+        with build_trace.span('test.write'):
+            pass
+        with tempfile.TemporaryDirectory() as temp:
+            path = build_trace.write_trace(Path(temp) / "trace" / "build-trace.json")
+            with open(path, 'r', encoding='utf-8') as f:
+                trace = json.load(f)
+        self.assertEqual(trace['displayTimeUnit'], 'ms')
+        self.assertIn('test.write', [event['name'] for event in trace['traceEvents']])
+        timestamps = [event['ts'] for event in trace['traceEvents']]
+        self.assertEqual(timestamps, sorted(timestamps))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+测试构建并行度自动调优
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+
+import build_tuning
+
+
+GB = 1 << 30
+
+
+def build_result(returncode=0, elapsed=60.0, cpu_seconds=200.0, maxrss_kb=800 * 1024, output=""):
+    """构造一次构建的结果"""
+    usage = SimpleNamespace(ru_utime=cpu_seconds, ru_stime=0.0, ru_maxrss=maxrss_kb * build_tuning._MAXRSS_SCALE)
+    return SimpleNamespace(returncode=returncode, elapsed=elapsed, usage=usage, cancelled=False,
+                           aborted_by=None, output=output)
+
+
+def entry(trials=None, peak_rss_kb=None):
+    """一条调优记录，trials为{并行度: 墙钟时间}，时间为'oom'表示OOM"""
+    result = {'peak_rss_kb': peak_rss_kb, 'trials': {}}
+    for jobs, seconds in (trials or {}).items():
+        oom = seconds == 'oom'
+        result['trials'][str(jobs)] = {'runs': 1, 'seconds': None if oom else seconds, 'oom': oom}
+    return result
+
+
+class SuggestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.resources = build_tuning.Resources(16, 64 * GB, 48 * GB)
+
+    def test_ceiling(self):
+        self.assertEqual(build_tuning.ceiling(self.resources, entry()), 16)
+        # 可用内存按每个编译单元的峰值内存加余量计算
+        small = build_tuning.Resources(16, 8 * GB, 4 * GB)
+        self.assertEqual(build_tuning.ceiling(small, entry(peak_rss_kb=512 * 1024)), 5)
+        self.assertEqual(build_tuning.ceiling(self.resources, entry({12: 'oom'})), 11)
+        self.assertEqual(build_tuning.ceiling(build_tuning.Resources(2, None, None), entry({1: 'oom'})), 1)
+
+    def test_search_converges_on_fastest(self):
+        self.assertEqual(build_tuning.suggest(self.resources, entry()), (16, "资源上限"))
+        # 最快的16两侧: 16+4超出上限，先试12
+        self.assertEqual(build_tuning.suggest(self.resources, entry({16: 100.0}))[0], 12)
+        self.assertEqual(build_tuning.suggest(self.resources, entry({16: 100.0, 12: 90.0}))[0], 15)
+        trials = {16: 100.0, 12: 90.0, 15: 95.0, 9: 120.0, 14: 94.0, 10: 110.0, 13: 93.0, 11: 91.0}
+        self.assertEqual(build_tuning.suggest(self.resources, entry(trials)), (12, "已收敛"))
+
+    def test_ranks_by_wall_time(self):
+        # 旧记录中的比值不参与比较，只看墙钟时间
+        record = entry({8: 50.0, 16: 60.0})
+        record['trials']['16']['ratio'] = 0.1
+        record['trials']['8']['ratio'] = 0.9
+        jobs, _ = build_tuning.suggest(self.resources, record)
+        self.assertNotEqual(jobs, 16)
+        self.assertEqual(build_tuning.suggest(self.resources, entry({8: 50.0, 16: 60.0, 10: 55.0, 6: 56.0,
+                                                                     9: 52.0, 7: 51.0}))[0], 8)
+
+    def test_is_oom(self):
+        self.assertTrue(build_tuning.is_oom(build_result(returncode=137)))
+        self.assertTrue(build_tuning.is_oom(build_result(returncode=2, output="clang: error: Killed signal "
+                                                                              "terminated program cc1plus")))
+        self.assertFalse(build_tuning.is_oom(build_result(returncode=2, output="error: unknown type name")))
+        self.assertFalse(build_tuning.is_oom(build_result(returncode=0, output="out of memory")))
+
+
+class StateTest(unittest.TestCase):
+
+    def setUp(self):
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        self.resources = build_tuning.Resources(16, 64 * GB, 48 * GB)
+        patchers = [
+            mock.patch.dict(os.environ, {'BUILD_TUNING_PATH': str(Path(temp.name) / "tuning.json"),
+                                         'BUILD_AUTOTUNE': '1', 'DOBBY_BUILD_JOBS': '', 'BUILD_CPU_BUDGET': ''}),
+            mock.patch.object(build_tuning, 'detect_resources', return_value=self.resources),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def trials(self, kind='ndk-build'):
+        return build_tuning._load_state()[self.resources.machine_class][kind]['trials']
+
+    def test_choose_jobs(self):
+        self.assertEqual(build_tuning.choose_jobs('ndk-build'), 16)
+        with mock.patch.dict(os.environ, {'BUILD_CPU_BUDGET': '3'}):
+            self.assertEqual(build_tuning.choose_jobs('ndk-build'), 3)
+        # 关闭自动调优时使用检测到的CPU数(受亲和性和cgroup限制)，而不是os.cpu_count()
+        with mock.patch.dict(os.environ, {'BUILD_AUTOTUNE': '0'}), \
+                mock.patch.object(os, 'cpu_count', return_value=128):
+            self.assertEqual(build_tuning.choose_jobs('cmake'), 16)
+
+    def test_record_smooths_wall_time(self):
+        build_tuning.record('ndk-build', 16, build_result(elapsed=100.0))
+        build_tuning.record('ndk-build', 16, build_result(elapsed=50.0))
+        trial = self.trials()['16']
+        self.assertEqual(trial['runs'], 2)
+        self.assertAlmostEqual(trial['seconds'], build_tuning.EMA_ALPHA * 50 + (1 - build_tuning.EMA_ALPHA) * 100)
+        peak = build_tuning._load_state()[self.resources.machine_class]['ndk-build']['peak_rss_kb']
+        self.assertEqual(peak, 800 * 1024)
+
+    def test_record_skips_uninformative_builds(self):
+        # 几乎没有编译工作的增量构建只计次数
+        build_tuning.record('ndk-build', 8, build_result(cpu_seconds=1.0))
+        self.assertIsNone(self.trials()['8']['seconds'])
+        # 普通的编译失败不记录
+        build_tuning.record('ndk-build', 4, build_result(returncode=2, output="error: x"))
+        self.assertNotIn('4', self.trials())
+        build_tuning.record('ndk-build', 12, build_result(returncode=137))
+        self.assertTrue(self.trials()['12']['oom'])
+        self.assertEqual(build_tuning.choose_jobs('ndk-build'), 11)
+
+    def test_concurrent_records_are_not_lost(self):
+        threads = [threading.Thread(target=build_tuning.record, args=('cmake', 8, build_result()))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.trials('cmake')['8']['runs'], 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+测试统一命令行入口的子命令分派
+"""
+
+import io
+import sys
+import importlib
+import subprocess
+import unittest
+import contextlib
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+REPO_ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(REPO_ROOT / "scripts"))
+
+import cli
+
+
+class DispatchTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(sys, 'argv', ['cli'])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def dispatch(self, argv):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            status = cli.main(argv)
+        return status, output.getvalue()
+
+    def test_every_command_has_an_entry_point(self):
+        for table in (cli.COMMANDS, cli.BENCHMARKS):
+            for name, (description, module_name, func_name, fixed_args) in table.items():
+                with self.subTest(command=name):
+                    self.assertTrue(description)
+                    if name in cli.NESTED:
+                        continue
+                    module = importlib.import_module(module_name)
+                    self.assertTrue(callable(getattr(module, func_name)))
+
+    def test_usage(self):
+        status, output = self.dispatch(['--help'])
+        self.assertEqual(status, 0)
+        for name in cli.COMMANDS:
+            self.assertIn(name, output)
+        self.assertEqual(self.dispatch([])[0], 2)
+
+    def test_unknown_command(self):
+        status, output = self.dispatch(['nope'])
+        self.assertEqual(status, 2)
+        self.assertIn("未知的子命令: nope", output)
+
+    def test_passes_fixed_and_user_arguments(self):
+        entry = mock.Mock(return_value=7)
+        with mock.patch.object(importlib, 'import_module', return_value=SimpleNamespace(main=entry)) as load:
+            self.assertEqual(self.dispatch(['watch', '--abi', 'x86_64'])[0], 7)
+        load.assert_called_once_with('build_monitor')
+        entry.assert_called_once_with(['--watch', '--abi', 'x86_64'])
+        self.assertEqual(sys.argv[0], "python -m scripts watch")
+
+    def test_nested_commands(self):
+        entry = mock.Mock(return_value=0)
+        with mock.patch.object(importlib, 'import_module', return_value=SimpleNamespace(main=entry)) as load:
+            self.assertEqual(self.dispatch(['bench', 'rules', '--size-mb', '1'])[0], 0)
+        load.assert_called_once_with('bench_fix_rules')
+        entry.assert_called_once_with(['--size-mb', '1'])
+
+        status, output = self.dispatch(['bench'])
+        self.assertEqual(status, 2)
+        self.assertIn("python -m scripts bench <子命令>", output)
+
+    def test_only_selected_module_is_imported(self):
+        # 在新的解释器中运行，确认查询历史的帮助不会导入构建和分析相关的模块
+        code = (
+            "import sys, scripts, cli\n"
+            "try:\n"
+            "    cli.main(['history', '--help'])\n"
+            "except SystemExit:\n"
+            "    pass\n"
+            "heavy = ['analysis_client', 'auto_fix_on_build_failure', 'build_runner', 'matrix_build']\n"
+            "sys.stderr.write(','.join(name for name in heavy if name in sys.modules))\n"
+        )
+        result = subprocess.run([sys.executable, '-c', code], cwd=REPO_ROOT, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn("查询运行历史", result.stdout)
+        self.assertEqual(result.stderr, "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+测试编译耗时报告的time-trace汇总
+"""
+
+import os
+import sys
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+
+import compile_profile
+
+
+def event(name, dur, detail=None):
+    """clang time-trace中的一个完整事件"""
+    item = {'ph': 'X', 'name': name, 'ts': 0, 'dur': dur}
+    if detail is not None:
+        item['args'] = {'detail': detail}
+    return item
+
+
+def unit_trace(total, headers=(), templates=()):
+    """一个编译单元的time-trace"""
+    events = [event('Total ExecuteCompiler', total),
+              event('Total Frontend', total * 3 // 4),
+              event('Total Backend', total // 4),
+              {'ph': 'M', 'name': 'process_name', 'args': {'name': 'clang'}}]
+    events += [event('Source', dur, header) for header, dur in headers]
+    events += [event('InstantiateClass', dur, template) for template, dur in templates]
+    return {'traceEvents': events}
+
+
+class CompileProfileTest(unittest.TestCase):
+
+    def setUp(self):
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        self.root = Path(temp.name)
+
+    def write(self, rel_path, data):
+        path = self.root / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(data) if not isinstance(data, str) else data)
+        return path
+
+    def test_time_trace_flags(self):
+        self.assertEqual(compile_profile.time_trace_flags(), "-ftime-trace -ftime-trace-granularity=500")
+        with mock.patch.dict(os.environ, {'BUILD_TIME_TRACE_GRANULARITY': '50'}):
+            self.assertEqual(compile_profile.time_trace_flags(), "-ftime-trace -ftime-trace-granularity=50")
+
+    def test_analyze_trace(self):
+        result = compile_profile.analyze_trace(unit_trace(
+            4000,
+            headers=[('jni/hook.h', 300), ('jni/hook.h', 200), ('<string>', 700)],
+            templates=[('std::vector<int>', 100), ('std::vector<char>', 50)]
+        )['traceEvents'])
+        self.assertEqual((result['total'], result['frontend'], result['backend']), (4000, 3000, 1000))
+        self.assertEqual(dict(result['headers']), {'jni/hook.h': 500, '<string>': 700})
+        self.assertEqual(dict(result['templates']), {'std::vector': 150})
+
+        # 没有总耗时事件时由前端和后端相加
+        result = compile_profile.analyze_trace([event('Total Frontend', 30), event('Total Backend', 10)])
+        self.assertEqual(result['total'], 40)
+
+    def test_find_trace_files_skips_other_json(self):
+        trace = self.write("obj/local/arm64-v8a/objs/lsfbypass/hook.o.json", unit_trace(10))
+        self.write("obj/compile_commands.json", [])
+        self.write("obj/.configure-stamp.json", {'signature': 'x'})
+        self.assertEqual(compile_profile.find_trace_files(self.root / "obj"), [trace])
+
+        broken = self.write("obj/broken.json", "{not json")
+        self.assertIsNone(compile_profile.load_trace(broken))
+        self.assertIsNone(compile_profile.load_trace(self.root / "obj" / "compile_commands.json"))
+
+    def test_aggregate_and_report(self):
+        self.write("obj/hook.o.json", unit_trace(5_000_000, headers=[('<string>', 800_000)],
+                                                  templates=[('std::map<int, int>', 200_000)]))
+        self.write("obj/util.o.json", unit_trace(1_000_000, headers=[('<string>', 400_000)]))
+        self.write("dobby/core.o.json", unit_trace(3_000_000, headers=[('dobby.h', 900_000)]))
+        self.write("obj/notes.json", {'unrelated': True})
+
+        report = compile_profile.aggregate([('jni', self.root / "obj"), ('Dobby', self.root / "dobby")])
+        self.assertEqual([unit['name'] for unit in report['units']],
+                         ['jni/hook.o', 'Dobby/core.o', 'jni/util.o'])
+        self.assertEqual(report['headers'][0], {'name': '<string>', 'time': 1_200_000, 'units': 2})
+        self.assertEqual(report['templates'], [{'name': 'std::map', 'time': 200_000, 'units': 1}])
+
+        text_path = compile_profile.write_report(report, self.root / "report", top=2)
+        text = text_path.read_text(encoding='utf-8')
+        self.assertIn("3 个编译单元，合计 9.00s", text)
+        self.assertIn("jni/hook.o", text)
+        self.assertNotIn("jni/util.o", text)
+        saved = json.loads((self.root / "report" / "compile-time-report.json").read_text(encoding='utf-8'))
+        self.assertEqual(saved, report)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+测试编译器缓存的检测、环境变量和命中统计
+"""
+
+import os
+import sys
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+
+import compiler_cache
+
+
+def ccache_stats(hits, misses):
+    """ccache --print-stats 的输出"""
+    return (f"stats_updated_timestamp\t1700000000\ndirect_cache_hit\t{hits}\n"
+            f"preprocessed_cache_hit\t0\ncache_miss\t{misses}\n")
+
+
+class CompilerCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        self.root = Path(temp.name)
+        self.bin = self.root / "bin"
+        self.bin.mkdir()
+        patcher = mock.patch.dict(os.environ, {
+            'PATH': str(self.bin),
+            'HOME': str(self.root / "home"),
+            'PREFLIGHT_CACHE_PATH': str(self.root / "preflight.json"),
+            'COMPILER_CACHE_STATE': str(self.root / "compiler_cache.json"),
+            'COMPILER_CACHE': 'auto',
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_tool(self, name):
+        path = self.bin / name
+        path.write_text(f"#!/bin/sh\necho \"{name} version 4.9\"\n")
+        path.chmod(0o755)
+        return str(path)
+
+    @unittest.skipUnless(os.name == 'posix', "测试使用sh脚本模拟缓存工具")
+    def test_detect(self):
+        self.assertIsNone(compiler_cache.detect())
+        sccache = self.make_tool('sccache')
+        self.assertEqual(compiler_cache.detect(), ('sccache', sccache))
+        ccache = self.make_tool('ccache')
+        # auto时优先选择ccache
+        self.assertEqual(compiler_cache.detect(), ('ccache', ccache))
+        with mock.patch.dict(os.environ, {'COMPILER_CACHE': 'sccache'}):
+            self.assertEqual(compiler_cache.detect(), ('sccache', sccache))
+        with mock.patch.dict(os.environ, {'COMPILER_CACHE': 'none'}):
+            self.assertIsNone(compiler_cache.detect())
+
+    def test_build_env(self):
+        base = {'PATH': '/usr/bin'}
+        self.assertEqual(compiler_cache.build_env(None, base), base)
+        env = compiler_cache.build_env(('ccache', '/usr/bin/ccache'), base)
+        self.assertEqual(env['NDK_CCACHE'], '/usr/bin/ccache')
+        self.assertEqual(env['CCACHE_BASEDIR'], str(Path.cwd()))
+        env = compiler_cache.build_env(('sccache', '/usr/bin/sccache'), base)
+        self.assertEqual(env['NDK_CCACHE'], '/usr/bin/sccache')
+        self.assertNotIn('CCACHE_BASEDIR', env)
+        self.assertNotIn('NDK_CCACHE', base)
+
+    def test_read_stats(self):
+        with mock.patch.object(compiler_cache, '_run_stats', return_value=ccache_stats(7, 3)):
+            self.assertEqual(compiler_cache.read_stats(('ccache', 'ccache')), {'hits': 7, 'misses': 3})
+
+        sccache = json.dumps({'stats': {
+            'cache_hits': {'counts': {'C/C++': 5, 'Rust': 1}},
+            'cache_misses': {'counts': {'C/C++': 2}},
+        }})
+        with mock.patch.object(compiler_cache, '_run_stats', return_value=sccache):
+            self.assertEqual(compiler_cache.read_stats(('sccache', 'sccache')), {'hits': 6, 'misses': 2})
+        with mock.patch.object(compiler_cache, '_run_stats', return_value="not json"):
+            self.assertIsNone(compiler_cache.read_stats(('sccache', 'sccache')))
+        with mock.patch.object(compiler_cache, '_run_stats', return_value=None):
+            self.assertIsNone(compiler_cache.read_stats(('ccache', 'ccache')))
+
+    def test_session_tracks_hits_and_time_per_miss(self):
+        outputs = [ccache_stats(10, 10), ccache_stats(10, 14), ccache_stats(18, 14), ccache_stats(18, 14)]
+        with mock.patch.object(compiler_cache, '_run_stats', side_effect=outputs):
+            session = compiler_cache.CacheSession(('ccache', 'ccache'))
+            # 第一次构建: 4个未命中，每个约2秒
+            self.assertEqual(session.record_build(8.0), {'hits': 0, 'misses': 4})
+            self.assertAlmostEqual(session.estimate_saved(1), 2.0)
+            # 重试全部命中，不更新平均耗时
+            self.assertEqual(session.record_build(0.5), {'hits': 8, 'misses': 0})
+            self.assertEqual(session.report(), {'hits': 8, 'misses': 4})
+
+        state = json.loads(Path(os.environ['COMPILER_CACHE_STATE']).read_text())
+        self.assertAlmostEqual(state['seconds_per_miss'], 2.0)
+        # 下一次运行沿用记录的平均耗时
+        with mock.patch.object(compiler_cache, '_run_stats', return_value=None):
+            self.assertAlmostEqual(compiler_cache.CacheSession(('ccache', 'ccache')).estimate_saved(3), 6.0)
+
+    def test_disabled_session(self):
+        session = compiler_cache.CacheSession(None)
+        self.assertFalse(session.enabled)
+        self.assertIsNone(session.record_build(5.0))
+        self.assertEqual(session.builds, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
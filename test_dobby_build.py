@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+测试Dobby库的增量编译
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+
+import dobby_build
+
+
+# 记录调用参数的cmake: 配置时生成CMakeCache.txt，编译时生成libdobby.a
+FAKE_CMAKE = """#!/bin/sh
+echo "$*" >> "$CMAKE_CALLS"
+if [ "$1" = "--build" ]; then
+    mkdir -p "$2/lib" && echo "$DOBBY_LIB" > "$2/lib/libdobby.a"
+else
+    [ -n "$CMAKE_FAIL" ] && exit 1
+    mkdir -p "$4" && echo cache > "$4/CMakeCache.txt"
+fi
+"""
+
+
+@unittest.skipUnless(os.name == 'posix', "测试使用sh脚本模拟cmake")
+class DobbyBuildTest(unittest.TestCase):
+
+    def setUp(self):
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        self.root = Path(temp.name)
+        bin_dir = self.root / "bin"
+        bin_dir.mkdir()
+        cmake = bin_dir / "cmake"
+        cmake.write_text(FAKE_CMAKE)
+        cmake.chmod(0o755)
+
+        self.src = self.root / "Dobby"
+        self.src.mkdir()
+        (self.src / "CMakeLists.txt").write_text("project(Dobby)\n")
+        self.ndk = self.root / "ndk"
+        (self.ndk / "build" / "cmake").mkdir(parents=True)
+        (self.ndk / "build" / "cmake" / "android.toolchain.cmake").write_text("# toolchain\n")
+        self.calls = self.root / "cmake-calls.txt"
+
+        patcher = mock.patch.dict(os.environ, {
+            'PATH': f"{bin_dir}{os.pathsep}/bin{os.pathsep}/usr/bin",
+            'HOME': str(self.root / "home"),
+            'CMAKE_CALLS': str(self.calls),
+            'DOBBY_LIB': "compiled",
+            'DOBBY_CACHE_DIR': str(self.root / "cache"),
+            'DOBBY_BUILD_JOBS': '2',
+            'PREFLIGHT_CACHE_PATH': str(self.root / "preflight.json"),
+            'BUILD_TUNING_PATH': str(self.root / "tuning.json"),
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def cmake_calls(self):
+        if not self.calls.exists():
+            return []
+        # 预检探测工具版本的调用不计入
+        return [call for call in self.calls.read_text().splitlines() if call != '--version']
+
+    def test_configure_skipped_when_unchanged(self):
+        build_dir = self.root / "build"
+        flags = dobby_build.cmake_flags('arm64-v8a', 21, 'Release')
+        self.assertTrue(dobby_build.configure(self.src, build_dir, self.ndk, flags, echo=False))
+        self.assertTrue(dobby_build.configure(self.src, build_dir, self.ndk, flags, echo=False))
+        self.assertEqual(len(self.cmake_calls()), 1)
+
+        # 缓存变量变化时重新配置
+        flags = dobby_build.cmake_flags('arm64-v8a', 21, 'Debug')
+        self.assertTrue(dobby_build.configure(self.src, build_dir, self.ndk, flags, echo=False))
+        self.assertEqual(len(self.cmake_calls()), 2)
+        self.assertIn('-DCMAKE_BUILD_TYPE=Debug', self.cmake_calls()[-1])
+
+    def test_configure_failure_retries_once(self):
+        flags = dobby_build.cmake_flags('arm64-v8a', 21, 'Release')
+        with mock.patch.dict(os.environ, {'CMAKE_FAIL': '1'}):
+            self.assertFalse(dobby_build.configure(self.src, self.root / "build", self.ndk, flags, echo=False))
+        self.assertEqual(len(self.cmake_calls()), 2)
+
+    def test_compile_installs_library_and_reuses_cache(self):
+        target = self.root / "jni" / "dobby" / "arm64-v8a" / "libdobby.a"
+        self.assertTrue(dobby_build.compile_dobby(self.src, self.ndk, [target], echo=False))
+        self.assertEqual(target.read_text().strip(), "compiled")
+        calls = self.cmake_calls()
+        self.assertEqual([call.split()[0] for call in calls], ['-S', '--build'])
+        self.assertIn('--parallel 2', calls[1])
+
+        # 源码和参数未变化时从缓存恢复，不再调用cmake
+        target.unlink()
+        self.assertTrue(dobby_build.compile_dobby(self.src, self.ndk, [target], echo=False))
+        self.assertEqual(target.read_text().strip(), "compiled")
+        self.assertEqual(self.cmake_calls(), calls)
+
+    def test_force_rebuilds_from_scratch(self):
+        target = self.root / "libdobby.a"
+        self.assertTrue(dobby_build.compile_dobby(self.src, self.ndk, [target], echo=False))
+
+        with mock.patch.dict(os.environ, {'DOBBY_LIB': "rebuilt"}):
+            self.assertTrue(dobby_build.compile_dobby(self.src, self.ndk, [target], echo=False, force=True))
+        # 构建目录被清理，重新配置并编译，结果覆盖缓存中的条目
+        self.assertEqual([call.split()[0] for call in self.cmake_calls()], ['-S', '--build', '-S', '--build'])
+        self.assertEqual(target.read_text().strip(), "rebuilt")
+        target.unlink()
+        self.assertTrue(dobby_build.compile_dobby(self.src, self.ndk, [target], echo=False))
+        self.assertEqual(target.read_text().strip(), "rebuilt")
+
+
+if __name__ == "__main__":
+    unittest.main()
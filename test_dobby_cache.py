@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+测试Dobby静态库缓存的存取和LRU淘汰
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+
+import dobby_cache
+
+
+class DobbyCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.root = Path(self.tmp.name)
+        patcher = mock.patch.dict(os.environ, {'DOBBY_CACHE_DIR': str(self.root / "cache")})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_lib(self, name, size):
+        path = self.root / name
+        path.write_bytes(os.urandom(size))
+        return path
+
+    def test_store_and_restore(self):
+        lib = self.make_lib("libdobby.a", 1024)
+        dobby_cache.store('ab' * 32, lib)
+        target = self.root / "out" / "arm64-v8a" / "libdobby.a"
+        self.assertTrue(dobby_cache.restore('ab' * 32, [target]))
+        self.assertEqual(target.read_bytes(), lib.read_bytes())
+
+    def test_restore_miss(self):
+        self.assertFalse(dobby_cache.restore('cd' * 32, [self.root / "libdobby.a"]))
+
+    def test_store_keeps_entry_larger_than_limit(self):
+        lib = self.make_lib("libdobby.a", 2 * 1024 * 1024)
+        with mock.patch.dict(os.environ, {'DOBBY_CACHE_MAX_MB': '1'}):
+            dobby_cache.store('ef' * 32, lib)
+        self.assertTrue(dobby_cache.restore('ef' * 32, [self.root / "libdobby.a.out"]))
+
+    def test_evict_removes_least_recently_used(self):
+        old = dobby_cache.store('01' * 32, self.make_lib("old.a", 600 * 1024))
+        os.utime(old.with_suffix('.used'), (1, 1))
+        dobby_cache.store('02' * 32, self.make_lib("new.a", 600 * 1024))
+        self.assertEqual(dobby_cache.evict(max_size=1024 * 1024), 1)
+        self.assertFalse(old.exists())
+        self.assertFalse(old.with_suffix('.used').exists())
+        self.assertTrue(dobby_cache.restore('02' * 32, [self.root / "restored.a"]))
+
+    def test_restore_keeps_target_mtime(self):
+        # 恢复出的库与条目是同一个inode，记录使用时间不能改变它的mtime
+        entry = dobby_cache.store('03' * 32, self.make_lib("libdobby.a", 1024))
+        os.utime(entry, (1, 1))
+        target = self.root / "out" / "libdobby.a"
+        dobby_cache.restore('03' * 32, [target])
+        dobby_cache.restore('03' * 32, [self.root / "other.a"])
+        self.assertEqual(target.stat().st_mtime, 1)
+        # 最近恢复过的条目不会先被淘汰
+        os.utime(dobby_cache.store('04' * 32, self.make_lib("new.a", 1024)).with_suffix('.used'), (2, 2))
+        dobby_cache.evict(max_size=1500)
+        self.assertTrue(entry.exists())
+
+
+class HashSourceTreeTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.src = Path(tmp.name)
+        (self.src / "source").mkdir()
+        (self.src / "source" / "dobby.cpp").write_text("int x;\n")
+        (self.src / "build").mkdir()
+        (self.src / "build" / "ignored.o").write_text("obj")
+
+    def test_unchanged_tree_is_not_read_again(self):
+        first = dobby_cache.hash_source_tree(self.src)
+        with mock.patch.object(dobby_cache, 'open', create=True, side_effect=open) as opened:
+            self.assertEqual(dobby_cache.hash_source_tree(self.src), first)
+        opened.assert_not_called()
+        (self.src / "build" / "ignored.o").write_text("changed")
+        self.assertEqual(dobby_cache.hash_source_tree(self.src), first)
+
+    def test_edit_changes_hash(self):
+        path = self.src / "source" / "dobby.cpp"
+        first = dobby_cache.hash_source_tree(self.src)
+        # 大小相同的修改，只有mtime不同
+        path.write_text("int y;\n")
+        os.utime(path, ns=(0, path.stat().st_mtime_ns + 1000))
+        second = dobby_cache.hash_source_tree(self.src)
+        self.assertNotEqual(second, first)
+        (self.src / "source" / "new.h").write_text("")
+        self.assertNotEqual(dobby_cache.hash_source_tree(self.src), second)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+测试Dobby源码的获取、检出和离线导入导出
+"""
+
+import os
+import sys
+import json
+import shutil
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+
+import dobby_cache
+import dobby_source
+
+
+def git(cwd, *args):
+    """在测试仓库中执行git命令"""
+    result = subprocess.run(['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com',
+                             '-c', 'commit.gpgsign=false'] + list(args),
+                            cwd=cwd, check=True, capture_output=True, text=True)
+    return result.stdout.strip()
+
+
+@unittest.skipUnless(shutil.which('git'), "需要git")
+class DobbySourceTest(unittest.TestCase):
+
+    def setUp(self):
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        self.root = Path(temp.name)
+
+        # 作为上游的本地仓库
+        self.upstream = self.root / "upstream"
+        (self.upstream / "source").mkdir(parents=True)
+        (self.upstream / "CMakeLists.txt").write_text("project(Dobby)\n")
+        (self.upstream / "source" / "dobby.cpp").write_text("int dobby;\n")
+        git(self.upstream, 'init', '--quiet')
+        git(self.upstream, 'add', '.')
+        git(self.upstream, 'commit', '--quiet', '-m', 'initial')
+        self.commit = git(self.upstream, 'rev-parse', 'HEAD')
+
+        self.work = self.root / "work"
+        self.work.mkdir()
+        cwd = os.getcwd()
+        os.chdir(self.work)
+        self.addCleanup(os.chdir, cwd)
+
+        patcher = mock.patch.dict(os.environ, {
+            'DOBBY_SOURCE_CACHE_DIR': str(self.root / "cache"),
+            'DOBBY_REPO_URL': str(self.upstream),
+            'DOBBY_OFFLINE': '0',
+            'BUILD_TRACE': '0',
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        os.environ.pop('DOBBY_COMMIT', None)
+        self.dest = Path("jni/external/Dobby")
+
+    def test_first_checkout_pins_version(self):
+        self.assertTrue(dobby_source.materialize(self.dest))
+
+        self.assertEqual((self.dest / "source" / "dobby.cpp").read_text(), "int dobby;\n")
+        lock = json.loads(Path("dobby.lock").read_text())
+        self.assertEqual(lock['commit'], self.commit)
+        self.assertEqual(lock['tree_sha256'], dobby_cache.hash_source_tree(self.dest))
+        self.assertEqual(dobby_source.cached_tree(self.commit), lock['tree_sha256'])
+
+    def test_checkout_does_not_share_files_with_cache(self):
+        self.assertTrue(dobby_source.materialize(self.dest))
+        checked_out = self.dest / "source" / "dobby.cpp"
+        cached = dobby_source.tree_dir(self.commit) / "source" / "dobby.cpp"
+        self.assertNotEqual(os.stat(checked_out).st_ino, os.stat(cached).st_ino)
+
+        # 原地修改检出的源码不影响缓存
+        with open(checked_out, 'a') as f:
+            f.write("// patched\n")
+        self.assertIsNotNone(dobby_source.cached_tree(self.commit))
+
+    def test_modified_checkout_is_restored(self):
+        self.assertTrue(dobby_source.materialize(self.dest))
+        (self.dest / "source" / "dobby.cpp").write_text("broken\n")
+        self.assertTrue(dobby_source.materialize(self.dest))
+        self.assertEqual((self.dest / "source" / "dobby.cpp").read_text(), "int dobby;\n")
+
+        (self.dest / "CMakeLists.txt").unlink()
+        self.assertTrue(dobby_source.materialize(self.dest))
+        self.assertTrue((self.dest / "CMakeLists.txt").exists())
+
+    def test_unmanaged_checkout_is_left_alone(self):
+        (self.dest / "source").mkdir(parents=True)
+        (self.dest / "source" / "dobby.cpp").write_text("local\n")
+        self.assertTrue(dobby_source.materialize(self.dest))
+        self.assertEqual((self.dest / "source" / "dobby.cpp").read_text(), "local\n")
+
+    def test_offline_requires_cached_version(self):
+        with mock.patch.dict(os.environ, {'DOBBY_OFFLINE': '1'}):
+            self.assertFalse(dobby_source.materialize(self.dest))
+            dobby_source.save_lock({'commit': self.commit})
+            self.assertFalse(dobby_source.materialize(self.dest))
+        self.assertFalse(self.dest.exists())
+
+    def test_export_and_import_offline(self):
+        self.assertTrue(dobby_source.materialize(self.dest))
+        archive = self.root / "dobby.tar"
+        self.assertEqual(dobby_source.export_archive(archive), self.commit)
+
+        # 另一台没有网络的构建机：空的缓存，相同的dobby.lock
+        shutil.rmtree(self.dest)
+        with mock.patch.dict(os.environ, {'DOBBY_SOURCE_CACHE_DIR': str(self.root / "offline-cache"),
+                                          'DOBBY_OFFLINE': '1'}):
+            self.assertEqual(dobby_source.import_archive(archive), self.commit)
+            self.assertTrue(dobby_source.materialize(self.dest))
+        self.assertEqual((self.dest / "source" / "dobby.cpp").read_text(), "int dobby;\n")
+
+    def test_import_rejects_mismatched_archive(self):
+        self.assertTrue(dobby_source.materialize(self.dest))
+        archive = self.root / "dobby.tar"
+        dobby_source.export_archive(archive)
+        lock = dobby_source.load_lock()
+        lock['tree_sha256'] = '0' * 64
+        dobby_source.save_lock(lock)
+
+        with mock.patch.dict(os.environ, {'DOBBY_SOURCE_CACHE_DIR': str(self.root / "offline-cache")}):
+            with self.assertRaises(dobby_source.SourceError):
+                dobby_source.import_archive(archive)
+            self.assertFalse(dobby_source.tree_dir(self.commit).exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
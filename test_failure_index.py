@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+测试历史构建失败的相似度索引
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+
+import failure_index
+import file_lock
+
+
+def error_log(index):
+    """第index种构建失败的日志"""
+    return (f"[arm64-v8a] Compile++      : hook <= hook{index}.cpp\n"
+            f"jni/hook{index}.cpp:{index + 10}:5: error: use of undeclared identifier 'symbol_{index}'\n"
+            f"make: *** [obj/local/arm64-v8a/objs/hook/hook{index}.o] Error 1\n")
+
+
+class FailureIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        self.root = Path(temp.name)
+        patcher = mock.patch.dict(os.environ, {'FAILURE_INDEX': '1', 'FAILURE_INDEX_DIR': str(self.root)})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def open_index(self):
+        index = failure_index.FailureIndex()
+        self.addCleanup(index.close)
+        return index
+
+    def fill(self, count):
+        index = self.open_index()
+        for number in range(count):
+            self.assertTrue(index.insert(error_log(number), f"fix-{number}"))
+        return index
+
+    def test_query_before_and_after_compact(self):
+        index = self.fill(5)
+        self.assertEqual((index.count, len(index.tail)), (0, 5))
+        self.assertEqual(index.query(error_log(3), k=1)[0]['fix'], "fix-3")
+
+        self.assertEqual(index.compact(), 5)
+        self.assertEqual((index.count, len(index.tail)), (5, 0))
+        match = self.open_index().query(error_log(3), k=1)[0]
+        self.assertEqual((match['fix'], match['similarity']), ("fix-3", 1.0))
+        self.assertNotIn('signature', match)
+
+    def test_record_and_find_similar(self):
+        failure_index.record_fix(error_log(1), "fix-1", 'fix_action')
+        suggestions = failure_index.suggested_fixes(failure_index.find_similar(error_log(1)))
+        self.assertEqual(suggestions[0]['fix'], "fix-1")
+        with mock.patch.dict(os.environ, {'FAILURE_INDEX': '0'}):
+            self.assertEqual(failure_index.find_similar(error_log(1)), [])
+
+    def test_trim_while_another_index_is_open(self):
+        self.fill(6).compact()
+        reader = self.open_index()
+        self.assertEqual(reader.count, 6)
+
+        # 另一个进程裁剪之后，已打开的索引中的偏移指向新文件里的其他内容
+        self.open_index().compact(max_cases=2)
+        self.assertEqual(reader.query(error_log(0)), [])
+        self.assertEqual(reader.query(error_log(5), k=1), [])
+
+        reopened = self.open_index()
+        self.assertEqual(reopened.count, 2)
+        self.assertEqual(reopened.query(error_log(5), k=1)[0]['fix'], "fix-5")
+        self.assertEqual(reopened.query(error_log(0)), [])
+
+    def test_rebuilds_after_interrupted_trim(self):
+        self.fill(4).compact()
+        # 裁剪替换了cases.jsonl、还没来得及替换index.bin就退出
+        cases_path = self.root / failure_index.CASES_FILE
+        lines = cases_path.read_bytes().splitlines(True)
+        failure_index._replace(cases_path, b''.join(lines[2:]))
+
+        index = self.open_index()
+        self.assertEqual((index.count, len(index.tail)), (2, 0))
+        self.assertEqual(index.query(error_log(3), k=1)[0]['fix'], "fix-3")
+        self.assertEqual(index.query(error_log(1)), [])
+
+    def test_rebuilds_old_format(self):
+        self.fill(3)
+        (self.root / failure_index.INDEX_FILE).write_bytes(b'SFFI' + bytes(36))
+        index = self.open_index()
+        self.assertEqual((index.count, len(index.tail)), (3, 0))
+
+    def test_insert_waits_for_trim(self):
+        self.fill(3).compact()
+        cases_path = self.root / failure_index.CASES_FILE
+        writer = self.open_index()
+        # 持有锁期间读取并替换cases.jsonl，模拟正在进行的裁剪
+        with file_lock.locked(cases_path):
+            lines = cases_path.read_bytes().splitlines(True)
+            thread = threading.Thread(target=writer.insert, args=(error_log(9), "fix-9"))
+            thread.start()
+            time.sleep(0.2)
+            failure_index._replace(cases_path, b''.join(lines[1:]))
+        thread.join()
+
+        fixes = [json.loads(line)['fix'] for line in cases_path.read_bytes().splitlines()]
+        self.assertEqual(fixes, ["fix-1", "fix-2", "fix-9"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+测试文件变化监听和监听模式的增量构建
+"""
+
+import os
+import sys
+import time
+import platform
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+
+import build_monitor
+import compiler_cache
+import file_watch
+
+
+class WatcherTests:
+    """两种监听器共同的行为"""
+
+    def setUp(self):
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        self.root = Path(temp.name)
+        self.src = self.root / "jni"
+        (self.src / "obj").mkdir(parents=True)
+        (self.src / "hook.cpp").write_text("int x;\n")
+        (self.root / "config.json").write_text("{}\n")
+        (self.root / "other.json").write_text("{}\n")
+        self.watcher = self.create([self.src], [self.root / "config.json"], {'obj'})
+        self.addCleanup(self.watcher.close)
+
+    def touch(self, path, text="changed\n"):
+        # 轮询监听按修改时间和大小比较，每次写入不同长度的内容
+        path.write_text(text * (path.stat().st_size + 1 if path.exists() else 1))
+
+    def test_reports_modified_file(self):
+        self.touch(self.src / "hook.cpp")
+        self.assertIn(str(self.src / "hook.cpp"), file_watch.wait_for_quiet(self.watcher, set(), 0.2))
+
+    def test_tracks_new_directories(self):
+        (self.src / "hooks").mkdir()
+        file_watch.wait_for_quiet(self.watcher, set(), 0.2)
+        self.touch(self.src / "hooks" / "surface.cpp")
+        self.assertIn(str(self.src / "hooks" / "surface.cpp"),
+                      file_watch.wait_for_quiet(self.watcher, set(), 0.2))
+
+    def test_ignores_build_output_and_editor_files(self):
+        self.touch(self.src / "obj" / "hook.o")
+        self.touch(self.src / ".#hook.cpp")
+        self.touch(self.src / "hook.cpp.swp")
+        self.touch(self.root / "other.json")
+        self.assertEqual(self.watcher.wait(0.3), set())
+
+    def test_single_file(self):
+        self.touch(self.root / "config.json")
+        self.assertEqual(file_watch.wait_for_quiet(self.watcher, set(), 0.2), {str(self.root / "config.json")})
+
+
+@unittest.skipUnless(platform.system() == 'Linux', "inotify只在Linux上可用")
+class InotifyWatcherTest(WatcherTests, unittest.TestCase):
+
+    def create(self, roots, files, ignored_dirs):
+        return file_watch.InotifyWatcher(roots, files, ignored_dirs)
+
+
+class PollingWatcherTest(WatcherTests, unittest.TestCase):
+
+    def create(self, roots, files, ignored_dirs):
+        return file_watch.PollingWatcher(roots, files, ignored_dirs, interval=0.02)
+
+
+# 模拟的ndk-build: 按环境变量输出、等待和退出
+FAKE_NDK_BUILD = """#!/bin/sh
+echo "$BUILD_OUTPUT"
+sleep "${BUILD_SLEEP:-0}"
+exit "${BUILD_EXIT:-0}"
+"""
+
+
+@unittest.skipUnless(os.name == 'posix', "测试使用sh脚本模拟ndk-build")
+class WatchBuilderTest(unittest.TestCase):
+
+    def setUp(self):
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        self.root = Path(temp.name)
+        (self.root / "jni").mkdir()
+        ndk_build = self.root / "ndk-build"
+        ndk_build.write_text(FAKE_NDK_BUILD)
+        ndk_build.chmod(0o755)
+        cwd = os.getcwd()
+        os.chdir(self.root)
+        self.addCleanup(os.chdir, cwd)
+
+        patchers = [
+            mock.patch.dict(os.environ, {
+                'BUILD_LOG_PATH': str(self.root / "build.log"),
+                'BUILD_TUNING_PATH': str(self.root / "tuning.json"),
+                'FAILURE_INDEX_DIR': str(self.root / "failure_index"),
+                'BUILD_OUTPUT': "[arm64-v8a] SharedLibrary  : liblsfbypass.so",
+            }),
+            mock.patch.object(compiler_cache, 'get_session', return_value=compiler_cache.CacheSession(None)),
+            mock.patch.object(build_monitor.run_history, 'finish'),
+            mock.patch.object(build_monitor.run_history, 'record_command'),
+            mock.patch.object(build_monitor.failure_index, 'record_fix'),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.builder = build_monitor.WatchBuilder(str(ndk_build), 'arm64-v8a', 2)
+        self.addCleanup(self.builder.cancel)
+
+    def wait_builder(self):
+        self.builder._thread.join(10)
+        self.assertFalse(self.builder._thread.is_alive())
+
+    def test_new_change_cancels_running_build(self):
+        with mock.patch.dict(os.environ, {'BUILD_SLEEP': '30'}):
+            self.builder.start(time.monotonic())
+            time.sleep(0.2)
+        start = time.monotonic()
+        self.builder.start(time.monotonic(), ['jni/hook.cpp'])
+        self.wait_builder()
+
+        self.assertLess(time.monotonic() - start, 10)
+        # 被取消的构建不产生运行记录
+        build_monitor.run_history.finish.assert_called_once_with('watch', True)
+
+    def test_fix_recorded_after_failure_is_resolved(self):
+        error = "jni/hook.cpp:3:1: error: unknown type name 'foo'"
+        with mock.patch.dict(os.environ, {'BUILD_EXIT': '1', 'BUILD_OUTPUT': error}):
+            self.builder.start(time.monotonic())
+            self.wait_builder()
+        build_monitor.run_history.finish.assert_called_once_with('watch', False)
+
+        self.builder.start(time.monotonic(), ['jni/hook.cpp'])
+        self.wait_builder()
+        build_monitor.failure_index.record_fix.assert_called_once()
+        failure, fix, source = build_monitor.failure_index.record_fix.call_args[0]
+        self.assertIn(error, failure)
+        self.assertEqual((fix, source), ("修改 jni/hook.cpp", 'watch'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+测试修复规则索引: 与逐条正则匹配的结果一致，并按优先级排序
+"""
+
+import re
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+
+import fix_rules
+
+
+CORPUS_DIR = Path(__file__).resolve().parent / "bench" / "corpus"
+
+
+def make_rule(pattern, fix_action, priority=0, flags=0):
+    return {
+        'pattern': re.compile(pattern, flags),
+        'fix_action': fix_action,
+        'description': fix_action,
+        'fatal': False,
+        'priority': priority,
+        'index': 0,
+    }
+
+
+def naive_classify(rules, text):
+    """逐条运行规则正则的参考实现"""
+    found = []
+    for rule in rules:
+        m = rule['pattern'].search(text)
+        if m:
+            found.append((rule['fix_action'], m.start()))
+    found.sort(key=lambda item: (-next(r['priority'] for r in rules if r['fix_action'] == item[0]), item[1]))
+    return found
+
+
+def summarize(matches):
+    return [(match['rule']['fix_action'], match['first_offset']) for match in matches]
+
+
+class RuleMatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rules = [
+            make_rule(r'libdobby\.a: No such file or directory', 'missing_dobby', 100),
+            make_rule(r'ANDROID_NDK_HOME.*not set', 'ndk_unset', 90),
+            make_rule(r'arm64-v8a', 'abi', 30, re.IGNORECASE),
+            make_rule(r'(?:clang|gcc)\+*: error', 'compiler', 40),
+            make_rule(r'\bndk\b', 'ndk', 10, re.IGNORECASE),
+        ]
+        self.matcher = fix_rules.RuleMatcher(self.rules)
+
+    def test_matches_naive_search_on_corpus(self):
+        for log_path in sorted(CORPUS_DIR.glob('*.log')):
+            text = log_path.read_text(encoding='utf-8', errors='replace')
+            with self.subTest(log=log_path.name):
+                self.assertEqual(summarize(self.matcher.classify(text)), naive_classify(self.rules, text))
+
+    def test_ranked_by_priority_then_position(self):
+        text = "NDK r25\nARM64-V8A build\nclang++: error: linker failed\nANDROID_NDK_HOME is not set\n"
+        actions = [match['rule']['fix_action'] for match in self.matcher.classify(text)]
+        self.assertEqual(actions, ['ndk_unset', 'compiler', 'abi', 'ndk'])
+
+    def test_literal_must_be_confirmed_by_regex(self):
+        # 包含字面量但整条正则不匹配的行不算命中
+        text = "ANDROID_NDK_HOME=/opt/ndk\nlater: not set\n"
+        self.assertEqual(summarize(self.matcher.classify(text)), naive_classify(self.rules, text))
+
+    def test_first_line_is_reported(self):
+        matches = self.matcher.classify("ok\nfatal: libdobby.a: No such file or directory\n")
+        self.assertEqual(matches[0]['first_line'], "fatal: libdobby.a: No such file or directory")
+
+    def test_classify_file_matches_classify_across_chunks(self):
+        text = ''.join(f"[arm64-v8a] Compile++ : file{i}.cpp\n" for i in range(200))
+        text += "clang++: error: linker command failed\nlibdobby.a: No such file or directory\n"
+        with tempfile.TemporaryDirectory() as tmp:
+            log_path = Path(tmp) / "build.log"
+            log_path.write_text(text, encoding='utf-8')
+            self.assertEqual(summarize(self.matcher.classify_file(log_path, chunk_size=97)),
+                             summarize(self.matcher.classify(text)))
+
+    def test_multi_line_pattern(self):
+        rules = [make_rule(r'error: linker command failed\n.*undefined symbol', 'link', 50)]
+        text = "ld: error: linker command failed\nld: undefined symbol: DobbyHook\n"
+        matches = fix_rules.RuleMatcher(rules).classify(text)
+        self.assertEqual(summarize(matches), [('link', 4)])
+
+    def test_multi_line_match_starting_before_literal_line(self):
+        # 最长的必需字面量在第二行，匹配从第一行开始
+        rules = [make_rule(r'error:\s+undefined_reference_to', 'link', 50)]
+        text = "ok\nerror:\n  undefined_reference_to\n"
+        self.assertEqual(summarize(fix_rules.RuleMatcher(rules).classify(text)), [('link', 3)])
+
+    def test_overlapping_literals(self):
+        # 分支正则在同一位置只报告一个字面量，其余规则的字面量在同一位置或重叠位置也要确认
+        rules = [
+            make_rule(r'error: undefined', 'undefined', 50),
+            make_rule(r'error: und', 'prefix', 40),
+            make_rule(r'ror: undefined symbol', 'symbol', 30, re.IGNORECASE),
+            make_rule(r'Error: \w+', 'capital', 20),
+        ]
+        text = "ok\nld: ERROR: Undefined Symbol: x\nld: error: undefined symbol: DobbyHook\n"
+        self.assertEqual(summarize(fix_rules.RuleMatcher(rules).classify(text)), naive_classify(rules, text))
+
+    def test_config_rules_ignore_normal_output(self):
+        # NDK路径和Dobby符号出现在每条编译命令中，不应触发修复动作
+        matcher = fix_rules.RuleMatcher(fix_rules.load_fix_rules())
+        text = ("/opt/android-ndk-r25c/toolchains/llvm/prebuilt/linux-x86_64/bin/clang++ -c jni/hook.cpp\n"
+                "jni/hook.cpp:42:10: error: use of undeclared identifier 'DobbyHook'\n")
+        self.assertEqual(matcher.classify(text), [])
+        actions = [match['rule']['fix_action'] for match in matcher.classify(
+            "ld: error: undefined symbol: DobbyHook\nbuild.sh: line 3: ndk-build: command not found\n")]
+        self.assertEqual(actions, ['recompile_dobby', 'check_ndk_installation'])
+
+    def test_spans_lines(self):
+        self.assertTrue(fix_rules.spans_lines(re.compile(r'a\nb')))
+        self.assertTrue(fix_rules.spans_lines(re.compile(r'a\s+b')))
+        self.assertTrue(fix_rules.spans_lines(re.compile(r'(?s)a.*b')))
+        self.assertTrue(fix_rules.spans_lines(re.compile(r'a[^x]b')))
+        self.assertFalse(fix_rules.spans_lines(re.compile(r'ANDROID_NDK_HOME.*not set')))
+        self.assertFalse(fix_rules.spans_lines(re.compile(r'a[^\n]+b')))
+
+    def test_no_match(self):
+        self.assertEqual(self.matcher.classify("all good\n"), [])
+        self.assertEqual(self.matcher.classify(""), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+测试有状态的修复尝试调度
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+
+import fix_scheduler
+
+
+ERROR = "jni/hook.cpp:25:6: error: no template named 'unordered_set' in namespace 'std'\n"
+OTHER_ERROR = "ld.lld: error: undefined symbol: DobbyHook\n"
+
+
+class StaticMatcher:
+    """按给定的规则列表分类，不读取配置文件"""
+
+    def __init__(self, *rules):
+        self.rules = [{'description': action, 'fix_action': action, 'priority': priority}
+                      for action, priority in rules]
+
+    def classify(self, error_msg):
+        return [{'rule': rule} for rule in self.rules]
+
+
+class FixSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        self.root = Path(temp.name)
+        (self.root / "jni").mkdir()
+        (self.root / "jni" / "hook.cpp").write_text("int main() {}\n")
+        cwd = os.getcwd()
+        os.chdir(self.root)
+        self.addCleanup(os.chdir, cwd)
+
+        patcher = mock.patch.dict(os.environ, {
+            'FIX_HISTORY_PATH': str(self.root / "fix_history.json"),
+            'FAILURE_INDEX_DIR': str(self.root / "failure_index"),
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.builds = []
+
+    def edit(self, name):
+        """修改工作区源码的修复动作"""
+        def action():
+            with open(Path("jni") / name, 'a', encoding='utf-8') as f:
+                f.write("// fixed\n")
+            return True
+        return action
+
+    def build_results(self, *results):
+        """依次返回给定结果的构建函数"""
+        results = list(results)
+
+        def build():
+            self.builds.append(len(self.builds))
+            return results.pop(0)
+        return build
+
+    def test_workspace_fingerprint_components(self):
+        before = fix_scheduler.workspace_fingerprint()
+        (self.root / "jni" / "Dobby").mkdir()
+        (self.root / "jni" / "Dobby" / "dobby.cpp").write_text("// dobby\n")
+        (self.root / "jni" / "obj").mkdir()
+        (self.root / "jni" / "obj" / "hook.o").write_text("object")
+        # Dobby源码和构建产物不计入指纹
+        self.assertEqual(fix_scheduler.workspace_fingerprint(), before)
+
+        (self.root / "jni" / "libdobby.a").write_text("archive")
+        after = fix_scheduler.workspace_fingerprint()
+        self.assertEqual(fix_scheduler.changed_components(before, after), ['dobby'])
+        with mock.patch.dict(os.environ, {'COMPILER_CACHE': 'none'}):
+            self.assertEqual(fix_scheduler.changed_components(after, fix_scheduler.workspace_fingerprint()),
+                             ['toolchain'])
+
+    def test_unchanged_workspace_skips_rebuild(self):
+        actions = {'noop': lambda: True, 'broken': lambda: False, 'edit': self.edit("hook.cpp")}
+        scheduler = fix_scheduler.FixScheduler(actions, self.build_results((True, "")),
+                                               StaticMatcher(('noop', 30), ('broken', 20), ('edit', 10)))
+
+        self.assertEqual(scheduler.run(ERROR), (True, ""))
+        self.assertEqual(len(self.builds), 1)
+        self.assertEqual([(item['action'], item['outcome']) for item in scheduler.attempts],
+                         [('noop', 'unchanged'), ('broken', 'failed'), ('edit', 'fixed')])
+        self.assertEqual(scheduler.attempts[-1]['changed'], ['sources'])
+
+        history = fix_scheduler.load_history()
+        self.assertEqual(history['edit'], {'runs': 1, 'fixed': 1, 'rebuilds': 1})
+        self.assertEqual(history['noop'], {'runs': 1, 'unchanged': 1})
+
+    def test_rebuilds_are_capped(self):
+        actions = {'first': self.edit("a.cpp"), 'second': self.edit("b.cpp"), 'third': self.edit("c.cpp")}
+        build = self.build_results((False, ERROR), (False, OTHER_ERROR), (True, ""))
+        scheduler = fix_scheduler.FixScheduler(actions, build,
+                                               StaticMatcher(('first', 30), ('second', 20), ('third', 10)),
+                                               max_rebuilds=2)
+
+        self.assertEqual(scheduler.run(ERROR), (False, OTHER_ERROR))
+        self.assertEqual(len(self.builds), 2)
+        self.assertEqual([item['outcome'] for item in scheduler.attempts], ['no_effect', 'error_changed'])
+
+    def test_plan_prefers_effective_actions_within_priority(self):
+        fix_scheduler.save_history({
+            'rarely': {'rebuilds': 4, 'fixed': 1},
+            'often': {'rebuilds': 4, 'fixed': 3},
+        })
+        actions = {'rarely': lambda: True, 'often': lambda: True, 'urgent': lambda: True}
+        scheduler = fix_scheduler.FixScheduler(actions, self.build_results(),
+                                               StaticMatcher(('rarely', 10), ('often', 10), ('urgent', 50),
+                                                             ('unknown', 99)))
+
+        plan = scheduler.plan(ERROR, ())
+        self.assertEqual([rule['fix_action'] for rule in plan], ['urgent', 'often', 'rarely'])
+
+    def test_similar_failure_suggests_previous_fix(self):
+        actions = {'edit': self.edit("hook.cpp")}
+        scheduler = fix_scheduler.FixScheduler(actions, self.build_results((True, "")),
+                                               StaticMatcher(('edit', 10)))
+        self.assertTrue(scheduler.run(ERROR)[0])
+
+        # 之后没有规则匹配时，相似的失败仍会尝试解决过它的修复动作
+        scheduler = fix_scheduler.FixScheduler(actions, self.build_results(), StaticMatcher())
+        plan = scheduler.plan(ERROR, ())
+        self.assertEqual([(rule['fix_action'], rule['priority']) for rule in plan],
+                         [('edit', fix_scheduler.SIMILAR_PRIORITY)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+测试构建日志缩减和错误指纹
+"""
+
+import io
+import sys
+import unittest
+import contextlib
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+
+import build_runner
+import diagnostics
+import error_fingerprint
+import log_reducer
+
+
+HOOK_ERROR = [
+    "[arm64-v8a] Compile++      : lsfbypass <= hook.cpp",
+    "jni/hook.cpp:25:6: error: no template named 'unordered_set' in namespace 'std'",
+    "std::unordered_set<std::string> whitelist;",
+    "~~~~~^~~~~~~~~~~~~",
+]
+
+
+def make_log(before, after, repeat=1):
+    """在同一个错误前后加上不同数量的无关输出"""
+    lines = ["Building HyperOS SF Bypass module..."]
+    lines += [f"[arm64-v8a] Compile++      : lsfbypass <= file{i}.cpp" for i in range(before)]
+    for _ in range(repeat):
+        lines += HOOK_ERROR
+    lines += [f"[arm64-v8a] Compile++      : lsfbypass <= other{i}.cpp" for i in range(after)]
+    lines.append("make: *** [obj/local/arm64-v8a/objs/lsfbypass/hook.o] Error 1")
+    return '\n'.join(lines) + '\n'
+
+
+def reduced_fingerprint(text):
+    """与分析缓存、修复调度和批量分析相同的指纹计算方式"""
+    return log_reducer.fingerprint(log_reducer.reduce_log(text))
+
+
+class FingerprintTest(unittest.TestCase):
+
+    def test_same_error_different_log_length(self):
+        short = make_log(before=2, after=0)
+        long = make_log(before=5, after=40)
+        self.assertNotEqual(log_reducer.reduce_log(short), log_reducer.reduce_log(long))
+        self.assertEqual(reduced_fingerprint(short), reduced_fingerprint(long))
+
+    def test_repeat_count_does_not_change_fingerprint(self):
+        self.assertEqual(reduced_fingerprint(make_log(2, 0, repeat=1)),
+                         reduced_fingerprint(make_log(2, 0, repeat=3)))
+
+    def test_different_errors_have_different_fingerprints(self):
+        other = make_log(2, 0).replace("unordered_set", "shared_mutex")
+        self.assertNotEqual(reduced_fingerprint(make_log(2, 0)), reduced_fingerprint(other))
+
+    def test_error_text_drops_length_dependent_lines(self):
+        text = log_reducer.error_text(log_reducer.reduce_log(make_log(5, 40, repeat=2)))
+        self.assertNotIn(log_reducer.SUMMARY_PREFIX, text)
+        self.assertNotIn("重复", text)
+        self.assertNotIn("other39.cpp", text)
+        self.assertIn("no template named 'unordered_set'", text)
+
+    def test_paths_line_numbers_and_addresses_are_normalized(self):
+        first = "/home/a/jni/hook.cpp:25:6: error: bad value 0x7ffd1234 at 12:00:01"
+        second = "/work/b/jni/hook.cpp:31:2: error: bad value 0x55aa at 09:30:45"
+        self.assertEqual(error_fingerprint.fingerprint(first), error_fingerprint.fingerprint(second))
+
+    def test_salt_changes_fingerprint(self):
+        text = "jni/hook.cpp:1:1: error: x"
+        self.assertNotEqual(error_fingerprint.fingerprint(text, salt='a'),
+                            error_fingerprint.fingerprint(text, salt='b'))
+
+
+class ReduceTest(unittest.TestCase):
+
+    def test_keeps_command_and_error_block(self):
+        reduced = log_reducer.reduce_log(make_log(3, 3))
+        self.assertIn("$ [arm64-v8a] Compile++      : lsfbypass <= hook.cpp", reduced)
+        self.assertIn("no template named 'unordered_set'", reduced)
+        self.assertNotIn("file1.cpp", reduced)
+
+    def test_duplicates_are_counted_once(self):
+        reduced = log_reducer.reduce_log(make_log(0, 0, repeat=4))
+        self.assertEqual(reduced.count("no template named"), 1)
+        self.assertIn("(重复 4 次)", reduced)
+
+    def test_max_blocks(self):
+        text = '\n'.join(f"jni/f{i}.cpp:1:1: error: problem number {chr(97 + i)}" for i in range(10))
+        reduced = log_reducer.reduce_log(text, max_blocks=3)
+        self.assertEqual(reduced.count("### 错误"), 3)
+        self.assertIn("不同错误 10 个，保留 3 个", reduced)
+
+    def test_byte_budget(self):
+        text = '\n'.join(f"jni/f{i}.cpp:1:1: error: " + chr(97 + i % 26) * 500 for i in range(50))
+        reduced = log_reducer.reduce_log(text, max_blocks=50, max_bytes=2000)
+        self.assertLessEqual(len(reduced.encode('utf-8')), 2000 + 200)
+        self.assertIn("已达到字节预算", reduced)
+
+    def test_include_chain_is_collapsed(self):
+        text = '\n'.join([
+            "In file included from jni/a.cpp:1:",
+            "In file included from jni/b.h:2:",
+            "In file included from jni/c.h:3:",
+            "In file included from jni/d.h:4:",
+            "jni/e.h:5:1: error: unknown type name 'foo'",
+        ])
+        reduced = log_reducer.reduce_log(text)
+        self.assertIn("省略 2 层包含", reduced)
+
+    def test_no_errors_falls_back_to_tail(self):
+        text = '\n'.join(f"line {i}" for i in range(100))
+        reduced = log_reducer.reduce_log(text)
+        self.assertIn("line 99", reduced)
+        self.assertNotIn("line 10\n", reduced)
+
+    def test_fatal_error_without_location_is_kept(self):
+        text = "jni/hook.cpp:1:1: error: x\nfatal error: too many errors emitted, stopping now\n"
+        reduced = log_reducer.reduce_log(text)
+        self.assertIn("fatal error: too many errors emitted", reduced)
+        self.assertIn("不同错误 2 个", reduced)
+
+
+class ReduceResultTest(unittest.TestCase):
+
+    def stream_result(self, text):
+        """与run_streaming相同: 诊断在输出时解析，tail只保留尾部"""
+        lines = text.splitlines(keepends=True)
+        return build_runner.StreamResult(2, lines[-20:], 1.0, None, None, None,
+                                         diagnostics=diagnostics.parse_text(text))
+
+    def test_same_report_as_text(self):
+        text = make_log(3, 3, repeat=2)
+        self.assertEqual(log_reducer.error_text(log_reducer.reduce_result(self.stream_result(text))),
+                         log_reducer.error_text(log_reducer.reduce_log(text)))
+
+    def test_does_not_rescan_output(self):
+        result = self.stream_result(make_log(3, 3))
+        with mock.patch.object(diagnostics.DiagnosticParser, 'feed', side_effect=AssertionError):
+            reduced = log_reducer.reduce_result(result)
+        self.assertIn("no template named 'unordered_set'", reduced)
+
+    def test_errors_before_tail_are_kept(self):
+        # 错误之后的输出超过保留的尾部行数时，诊断中仍然有这个错误
+        result = self.stream_result(make_log(0, 100))
+        self.assertIn("no template named 'unordered_set'", log_reducer.reduce_result(result))
+
+    def test_no_errors_falls_back_to_tail(self):
+        result = self.stream_result('\n'.join(f"line {i}" for i in range(100)))
+        reduced = log_reducer.reduce_result(result)
+        self.assertIn("line 99", reduced)
+        self.assertNotIn("line 10\n", reduced)
+
+
+class MainTest(unittest.TestCase):
+
+    def test_missing_log(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertEqual(log_reducer.main([str(Path(__file__).parent / "no-such-build.log")]), 1)
+        self.assertIn("错误: 无法读取日志", output.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
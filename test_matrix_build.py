@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+测试矩阵构建的jobserver令牌池
+"""
+
+import os
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+
+import matrix_build
+
+
+@unittest.skipUnless(os.name == 'posix', "jobserver只在posix平台启用")
+class JobServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.jobserver = matrix_build.JobServer(8, 2)
+        self.addCleanup(self.jobserver.close)
+
+    def test_acquire_takes_tokens_out_of_pool(self):
+        first = self.jobserver.acquire(8)
+        second = self.jobserver.acquire(8)
+        # 管道中有8-2个令牌，加上两个构建各自隐含的任务槽
+        self.assertEqual(first + second, 8)
+        self.assertEqual(second, 1)
+
+    def test_acquire_respects_limit(self):
+        self.assertEqual(self.jobserver.acquire(3), 3)
+        self.assertEqual(self.jobserver.acquire(8), 5)
+
+    def test_release_returns_tokens(self):
+        jobs = self.jobserver.acquire(8)
+        self.jobserver.release(jobs)
+        self.assertEqual(self.jobserver.acquire(8), 7)
+
+    def test_fair_share(self):
+        jobserver = matrix_build.JobServer(8, 2, builds=3)
+        self.addCleanup(jobserver.close)
+        # 两个并发的构建各取一半，第一个ABI不会取走全部令牌
+        self.assertEqual(jobserver.fair_share(), 4)
+        first = jobserver.acquire(jobserver.fair_share())
+        second = jobserver.acquire(jobserver.fair_share())
+        self.assertEqual((first, second), (4, 4))
+        jobserver.release(first)
+        jobserver.finish_build()
+        jobserver.finish_build()
+        # 只剩最后一个构建时可以使用全部预算
+        self.assertEqual(jobserver.fair_share(), 8)
+        self.assertEqual(jobserver.acquire(jobserver.fair_share()), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+测试模块打包: 相同的输入得到逐字节相同的zip，未变化时不重新写出
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import zipfile
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+
+import package_module
+
+
+def make_repo(root, library):
+    """生成一个最小的模块源码目录"""
+    files = {
+        'module.prop': "id=test\nversion=v1.0\n",
+        'service.sh': "#!/system/bin/sh\n",
+        'sepolicy.rule': "allow surfaceflinger self capability sys_nice\n",
+        'zygisk_next.xml': "<zygisk/>\n",
+        'whitelist.txt': "# whitelist\ncom.example.app\n",
+    }
+    for name, content in files.items():
+        (root / name).write_text(content, encoding='utf-8')
+    lib = root / "jni" / "libs" / "arm64-v8a" / "liblsfbypass.so"
+    lib.parent.mkdir(parents=True)
+    lib.write_bytes(library)
+
+
+class PackageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.tmp_path = Path(self.tmp.name)
+        # 超过并行压缩阈值，同时覆盖线程池中压缩的路径
+        self.library = (b'\x7fELF' + os.urandom(64)) * (package_module.PARALLEL_THRESHOLD // 32)
+
+    def package(self, root, output):
+        dist = root / "dist"
+        with mock.patch.multiple(package_module, REPO_ROOT=root, DIST_DIR=dist,
+                                 MANIFEST_PATH=dist / ".package-manifest.json",
+                                 MEMBER_CACHE_DIR=dist / ".package-cache"), \
+                mock.patch('builtins.print'):
+            return package_module.package(output=output, jobs=2)
+
+    def test_same_inputs_give_identical_zip(self):
+        first_root = self.tmp_path / "first"
+        second_root = self.tmp_path / "second"
+        first_root.mkdir()
+        make_repo(first_root, self.library)
+        second_root.mkdir()
+        make_repo(second_root, self.library)
+        # 修改时间和文件系统顺序不影响输出
+        os.utime(second_root / "service.sh", (1, 1))
+
+        first, _, _ = self.package(first_root, first_root / "out.zip")
+        second, _, _ = self.package(second_root, second_root / "out.zip")
+        self.assertEqual(first.read_bytes(), second.read_bytes())
+
+        with zipfile.ZipFile(first) as archive:
+            self.assertIsNone(archive.testzip())
+            names = archive.namelist()
+            self.assertEqual(names, sorted(names))
+            self.assertIn("lib/arm64-v8a/liblsfbypass.so", names)
+            self.assertEqual(archive.read("lib/arm64-v8a/liblsfbypass.so"), self.library)
+            mode = archive.getinfo("service.sh").external_attr >> 16
+            self.assertEqual(mode & 0o777, 0o755)
+
+    def test_incremental_repackage(self):
+        root = self.tmp_path / "repo"
+        root.mkdir()
+        make_repo(root, self.library)
+        output = root / "out.zip"
+        _, written, compressed = self.package(root, output)
+        self.assertTrue(written)
+        self.assertEqual(compressed, 7)
+        original = output.read_bytes()
+
+        _, written, compressed = self.package(root, output)
+        self.assertFalse(written)
+
+        # 只改动一个条目时只重新压缩该条目
+        (root / "service.sh").write_text("#!/system/bin/sh\necho ok\n", encoding='utf-8')
+        _, written, compressed = self.package(root, output)
+        self.assertTrue(written)
+        self.assertEqual(compressed, 1)
+
+        # 改回原内容后得到与第一次相同的zip
+        (root / "service.sh").write_text("#!/system/bin/sh\n", encoding='utf-8')
+        self.package(root, output)
+        self.assertEqual(output.read_bytes(), original)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+测试构建环境预检和预检缓存
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+
+import preflight
+
+
+@unittest.skipUnless(os.name == 'posix', "测试使用sh脚本模拟构建工具")
+class PreflightTest(unittest.TestCase):
+
+    def setUp(self):
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        self.root = Path(temp.name)
+        self.bin = self.root / "bin"
+        self.bin.mkdir()
+        self.ndk = self.root / "ndk" / "26.1.10909125"
+        self.ndk.mkdir(parents=True)
+        (self.ndk / "source.properties").write_text("Pkg.Desc = Android NDK\nPkg.Revision = 26.1.10909125\n")
+        self.git = self.make_tool('git', 'echo "git version 2.43.0"')
+
+        patcher = mock.patch.dict(os.environ, {
+            'PATH': str(self.bin),
+            'HOME': str(self.root / "home"),
+            'ANDROID_NDK_HOME': str(self.ndk),
+            'PREFLIGHT_CACHE_PATH': str(self.root / "preflight.json"),
+            'PREFLIGHT_CACHE': '1',
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_tool(self, name, body):
+        path = self.bin / name
+        path.write_text(f"#!/bin/sh\n{body}\n")
+        path.chmod(0o755)
+        return path
+
+    def test_probes_tools_and_ndk(self):
+        self.make_tool('make', 'exit 2')
+        report = preflight.run_preflight()
+
+        self.assertFalse(report.from_cache)
+        self.assertEqual(report.tools['git'], preflight.ToolInfo('git', str(self.git), "git version 2.43.0"))
+        # 无法执行的工具有路径但没有版本
+        self.assertEqual(report.tools['make'].path, str(self.bin / "make"))
+        self.assertIsNone(report.tools['make'].version)
+        self.assertIsNone(report.tools['cmake'].path)
+        self.assertEqual(report.missing_tools(['git', 'make', 'cmake']), ['make', 'cmake'])
+        self.assertEqual((report.ndk_path, report.ndk_source, report.ndk_version),
+                         (str(self.ndk), 'env', "26.1.10909125"))
+
+    def test_reuses_cached_report(self):
+        first = preflight.run_preflight()
+        with mock.patch.object(preflight, '_probe_tool', side_effect=AssertionError("不应重新探测")):
+            second = preflight.run_preflight()
+
+        self.assertTrue(second.from_cache)
+        self.assertEqual(second.to_dict(), first.to_dict())
+
+    def test_cache_invalidated_when_tool_changes(self):
+        preflight.run_preflight()
+        stat = self.git.stat()
+        os.utime(self.git, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+        self.assertFalse(preflight.run_preflight().from_cache)
+
+    def test_cache_invalidated_when_tool_appears(self):
+        preflight.run_preflight()
+        self.make_tool('cmake', 'echo "cmake version 3.22.1"')
+
+        report = preflight.run_preflight()
+        self.assertFalse(report.from_cache)
+        self.assertEqual(report.tools['cmake'].version, "cmake version 3.22.1")
+
+    def test_no_cache_skips_cache(self):
+        preflight.run_preflight()
+        self.assertFalse(preflight.run_preflight(use_cache=False).from_cache)
+        with mock.patch.dict(os.environ, {'PREFLIGHT_CACHE': '0'}):
+            self.assertFalse(preflight.run_preflight().from_cache)
+
+
+if __name__ == "__main__":
+    unittest.main()
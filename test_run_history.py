@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+测试运行记录和历史查询
+"""
+
+import os
+import sys
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+
+import build_runner
+import diagnostics
+import run_history
+
+
+ERROR_OUTPUT = "jni/hook.cpp:25:6: error: unknown type name 'foo'\nmake: *** [hook.o] Error 1\n"
+
+
+def stream_result(returncode, output="", elapsed=1.0):
+    """构造一个流式构建的结果"""
+    tail = output.splitlines(True)
+    return build_runner.StreamResult(returncode, tail, elapsed, None, tail[0].rstrip() if tail else None,
+                                     "build.log", diagnostics=diagnostics.parse_text(output))
+
+
+class RunHistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        self.root = Path(temp.name)
+        patcher = mock.patch.dict(os.environ, {
+            'RUN_HISTORY': '1',
+            'RUN_HISTORY_PATH': str(self.root / "history.sqlite3"),
+            'RUN_REPORT_PATH': str(self.root / "run-report.json"),
+            'BUILD_TRACE': '0',
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # 丢弃其他测试留下的记录
+        run_history._take()
+
+    def store_run(self, command, success, started_at, duration=10.0, failed=()):
+        """直接写入一条运行记录"""
+        record = {
+            'run_id': f"{command}-{started_at}",
+            'command': command,
+            'host': 'test',
+            'started_at': started_at,
+            'finished_at': started_at + duration,
+            'duration_s': duration,
+            'success': success,
+            'error_fingerprint': None if success or not failed else failed[-1],
+            'preflight': None,
+            'commands': [{'command': 'build.sh', 'elapsed_s': 5.0, 'first_error': 'error: x', 'fingerprint': fp}
+                         for fp in failed],
+            'classification': [],
+            'fix_actions': [],
+            'analyses': [],
+            'phases': [{'name': 'ndk-build', 'count': 1, 'wall_s': duration}],
+        }
+        run_history.store(record)
+        return record
+
+    def summary(self, last=run_history.DEFAULT_LAST_RUNS):
+        return run_history.query(last)['summary']
+
+    def test_finish_writes_report_and_history(self):
+        run_history.record_command(['bash', 'build.sh'], stream_result(2, ERROR_OUTPUT))
+        run_history.record_command(['bash', 'build.sh'], stream_result(0))
+        record = run_history.finish('fix', True)
+
+        self.assertEqual([entry['command'] for entry in record['commands']], ['build.sh', 'build.sh'])
+        failed, passed = record['commands']
+        # 编译错误和make的错误各一条
+        self.assertEqual((failed['returncode'], failed['errors']), (2, 2))
+        self.assertTrue(failed['fingerprint'])
+        self.assertIsNone(passed['fingerprint'])
+        # 最终成功的运行没有错误指纹
+        self.assertIsNone(record['error_fingerprint'])
+        self.assertEqual(json.loads(Path(os.environ['RUN_REPORT_PATH']).read_text(encoding='utf-8')), record)
+
+        result = run_history.query()
+        self.assertEqual(result['summary']['runs'], 1)
+        self.assertEqual(result['frequent_failures'][0]['fingerprint'], failed['fingerprint'])
+
+        # 下一次运行从空的记录开始
+        self.assertEqual(run_history.finish('fix', False)['commands'], [])
+
+    def test_disabled(self):
+        run_history.record_command(['bash', 'build.sh'], stream_result(0))
+        with mock.patch.dict(os.environ, {'RUN_HISTORY': '0'}):
+            self.assertIsNone(run_history.finish('fix', True))
+        self.assertFalse(Path(os.environ['RUN_HISTORY_PATH']).exists())
+
+    def test_time_to_green(self):
+        self.store_run('fix', False, 1000, failed=['a'])
+        self.store_run('fix', False, 1100, failed=['a'])
+        self.store_run('fix', True, 1200, duration=50)
+        # 运行中有失败的构建、最终成功的运行也算一次恢复
+        self.store_run('build', True, 2000, duration=30, failed=['b'])
+        self.store_run('build', False, 3000, failed=['c'])
+
+        summary = self.summary()
+        self.assertEqual((summary['runs'], summary['successes'], summary['recoveries']), (5, 2, 2))
+        self.assertAlmostEqual(summary['mean_time_to_green_s'], ((1250 - 1000) + 30) / 2)
+        self.assertEqual(summary['still_failing_since'], 3000)
+
+    def test_analyze_runs_do_not_count(self):
+        self.store_run('fix', False, 1000, failed=['a'])
+        # 分析一份干净的日志不代表构建已经恢复
+        self.store_run('analyze', True, 1100)
+        self.store_run('analyze', False, 1150)
+        self.store_run('fix', True, 1200)
+
+        summary = self.summary()
+        self.assertEqual((summary['runs'], summary['successes'], summary['recoveries']), (2, 1, 1))
+        self.assertAlmostEqual(summary['mean_time_to_green_s'], 1210 - 1000)
+        # --last 按构建运行计数
+        self.assertEqual(self.summary(last=1)['runs'], 1)
+
+    def test_slowest_phases_and_frequent_failures(self):
+        self.store_run('fix', False, 1000, duration=20, failed=['a', 'b'])
+        self.store_run('fix', False, 1100, duration=40, failed=['a'])
+        self.store_run('fix', True, 1200, duration=5)
+
+        result = run_history.query(top=1)
+        self.assertEqual(result['slowest_phases'][0]['name'], 'ndk-build')
+        self.assertAlmostEqual(result['slowest_phases'][0]['total_s'], 65)
+        self.assertEqual(result['slowest_phases'][0]['max_s'], 40)
+        self.assertEqual([(row['fingerprint'], row['count'], row['runs']) for row in result['frequent_failures']],
+                         [('a', 2, 2)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+测试白名单的解析、二进制表的编码和mmap查找
+"""
+
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+
+import whitelist_table
+
+
+class ParseTest(unittest.TestCase):
+
+    def test_invalid_and_duplicate_entries(self):
+        entries, errors, duplicates = whitelist_table.parse_text([
+            "# comment", "", "com.b.app", "com.a.app:remote", "not a package", "com.b.app", "single",
+        ])
+        self.assertEqual(entries, ["com.a.app:remote", "com.b.app"])
+        self.assertEqual(errors, [(5, "not a package"), (7, "single")])
+        self.assertEqual(duplicates, [(6, "com.b.app")])
+
+    def test_sorted_by_utf8_bytes(self):
+        entries, _, _ = whitelist_table.parse_text(["com.b.x", "com.B.x", "com.a_z.x", "com.a.x"])
+        self.assertEqual(entries, sorted(entries, key=lambda name: name.encode('utf-8')))
+
+
+class TableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = Path(self.tmp.name) / "whitelist.bin"
+
+    def open(self, **kwargs):
+        table = whitelist_table.WhitelistTable(self.path, **kwargs)
+        self.addCleanup(table.close)
+        return table
+
+    def test_lookup(self):
+        entries = [f"com.example.app{i:03d}" for i in range(300)]
+        whitelist_table.write_table(entries, self.path)
+        table = self.open()
+        self.assertEqual(len(table), 300)
+        self.assertEqual(list(table[i] for i in range(len(table))), entries)
+        for name in entries:
+            self.assertIn(name, table)
+        self.assertNotIn("com.example.app", table)
+        self.assertNotIn("com.example.app300", table)
+        self.assertNotIn("zzz.last", table)
+
+    def test_empty_table(self):
+        whitelist_table.write_table([], self.path)
+        table = self.open()
+        self.assertEqual(len(table), 0)
+        self.assertNotIn("com.example.app", table)
+
+    def test_unchanged_table_is_not_rewritten(self):
+        self.assertTrue(whitelist_table.write_table(["com.a.b"], self.path))
+        self.assertFalse(whitelist_table.write_table(["com.a.b"], self.path))
+
+    def test_corruption_is_detected(self):
+        whitelist_table.write_table(["com.a.b", "com.c.d"], self.path)
+        data = bytearray(self.path.read_bytes())
+        data[-1] ^= 0xff
+        self.path.write_bytes(bytes(data))
+        with self.assertRaises(whitelist_table.WhitelistError):
+            whitelist_table.WhitelistTable(self.path)
+
+    def test_truncation_is_detected(self):
+        whitelist_table.write_table(["com.a.b", "com.c.d"], self.path)
+        self.path.write_bytes(self.path.read_bytes()[:-2])
+        with self.assertRaises(whitelist_table.WhitelistError):
+            whitelist_table.WhitelistTable(self.path, verify=False)
+
+
+if __name__ == "__main__":
+    unittest.main()